@@ -1,64 +1,152 @@
-from flask import Flask, request, abort
-from flask_restful import Api
-from flask_wtf.csrf import CSRFProtect
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from flask_caching import Cache
-from flask_cors import CORS
-from flasgger import Swagger
-from celery import Celery
+from flask import Flask, current_app, request, abort
 from dotenv import load_dotenv
 import os
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import re
+import threading
+from models.db import db
 
 load_dotenv()
 
-app = Flask(__name__)
-app.config.from_object('config.Config')
+ROLE_WEB = 'web'
+ROLE_WORKER = 'worker'
 
-# Swagger API Documentation
-swagger = Swagger(app, template={
-    "info": {
-        "title": "Free SSL Service API",
-        "description": "API documentation for Free SSL Service",
-        "version": "1.0.0"
-    },
-    "securityDefinitions": {
-        "Bearer": {
-            "type": "apiKey",
-            "name": "Authorization",
-            "in": "header"
+def create_app(role=ROLE_WEB, config_object='config.Config'):
+    """
+    Create the Flask app.
+    
+    The worker role (Celery worker/beat, migrations) only sets up the database, caches
+    and email templates; the web role additionally loads Swagger, CSRF, rate limiting,
+    CORS, request validation and the blueprints. Schema creation is not done here,
+    run `python -m migrations.create_schema` instead.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+    
+    db.init_app(app)
+    
+    # Import models so that every table is registered with the metadata
+    from models.user_model import User
+    from models.cert_model import Certificate, CertificateDomain
+    from models.payment_model import PaymentOrder
+    from models.invitation_model import Invitation
+    from models.cert_job_model import CertificateJob
+    from models.scan_cursor_model import ScanCursor
+    from models.lineage_model import CertificateLineage
+    from models.email_outbox_model import EmailOutbox
+    from models.notification_model import Notification
+    from models.auth_token_model import AuthToken
+    
+    # Cache initialization
+    from flask_caching import Cache
+    cache = Cache(app)
+    
+    # Authenticated principal cache (in-process L1 + Redis L2)
+    from services.principal_cache import principal_cache
+    principal_cache.init_app(app, cache)
+    
+    # Certificate PEM material cache
+    from utils.pem_cache import pem_cache
+    pem_cache.init_app(app)
+    
+    # Email templates are compiled once per process
+    from services.email_templates import get_email_renderer
+    get_email_renderer(app.config)
+    
+    # Password hashing process pool
+    from utils.password_hasher import password_hasher
+    password_hasher.init_app(app)
+    
+    if role == ROLE_WEB:
+        init_web(app)
+    elif role != ROLE_WORKER:
+        raise ValueError(f"Unknown app role: {role}")
+    
+    return app
+
+def init_web(app):
+    """
+    Set up everything only needed to serve HTTP requests.
+    """
+    from flask_restful import Api
+    from flask_wtf.csrf import CSRFProtect
+    from flask_limiter import Limiter
+    from flask_limiter.util import get_remote_address
+    from flask_cors import CORS
+    from flasgger import Swagger
+    from concurrent.futures import ThreadPoolExecutor
+    
+    # Swagger API Documentation
+    Swagger(app, template={
+        "info": {
+            "title": "Free SSL Service API",
+            "description": "API documentation for Free SSL Service",
+            "version": "1.0.0"
+        },
+        "securityDefinitions": {
+            "Bearer": {
+                "type": "apiKey",
+                "name": "Authorization",
+                "in": "header"
+            }
         }
-    }
-})
-
-# CSRF Protection
-csrf = CSRFProtect(app)
-
-# Cache initialization
-cache = Cache(app)
-
-# Rate Limiting
-limiter = Limiter(
-    app,
-    key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"],
-    storage_uri=app.config['CELERY_RESULT_BACKEND']
-)
-
-# CORS configuration
-CORS(app, resources={
-    r"/api/*": {
-        "origins": ["*"],
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
-    }
-})
+    })
+    
+    # CSRF Protection
+    CSRFProtect(app)
+    
+    # Rate Limiting
+    limiter = Limiter(
+        app,
+        key_func=get_remote_address,
+        default_limits=["200 per day", "50 per hour"],
+        storage_uri=app.config['CELERY_RESULT_BACKEND']
+    )
+    
+    # CORS configuration
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": ["*"],
+            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization"],
+            # Listing endpoints return the next page cursor in these headers
+            "expose_headers": ["X-Next-Cursor", "Link"]
+        }
+    })
+    
+    app.after_request(add_security_headers)
+    
+    # JSON responses (orjson with stdlib fallback)
+    from utils.json_provider import json_provider
+    json_provider.init_app(app)
+    
+    # Input validation middleware
+    from utils.input_screen import input_screener
+    input_screener.init_app(app)
+    app.before_request(validate_request)
+    
+    # Async support
+    app.executor = ThreadPoolExecutor(max_workers=10)
+    
+    Api(app)
+    
+    # Register error handlers
+    from utils.error_handler import register_error_handlers
+    register_error_handlers(app)
+    
+    # Import routes
+    from routes.auth_routes import auth_bp
+    from routes.cert_routes import cert_bp
+    from routes.payment_routes import payment_bp
+    from routes.invitation_routes import invitation_bp
+    
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(cert_bp)
+    app.register_blueprint(payment_bp)
+    app.register_blueprint(invitation_bp)
+    
+    # Health check for container orchestration and load balancers
+    app.add_url_rule('/api/health', 'health', limiter.exempt(health), methods=['GET'])
 
 # Security headers
-@app.after_request
 def add_security_headers(response):
     response.headers['X-Content-Type-Options'] = 'nosniff'
     response.headers['X-Frame-Options'] = 'DENY'
@@ -67,74 +155,52 @@ def add_security_headers(response):
     response.headers['Content-Security-Policy'] = "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data:; font-src 'self'; connect-src 'self'"
     return response
 
-# Input validation middleware
-@app.before_request
 def validate_request():
     # Validate request size
     if request.content_length and request.content_length > 1024 * 1024 * 10:  # 10MB limit
         abort(413, description="Request entity too large")
     
-    # Validate input for common attacks
+    # Validate input for common attacks (per-route rules via utils.input_screen.screen_input)
     if request.method in ['POST', 'PUT', 'PATCH']:
+        from utils.input_screen import input_screener
         try:
             if request.is_json:
                 data = request.get_json()
-                validate_input(data)
+                input_screener.check(data, current_app.view_functions.get(request.endpoint))
         except Exception as e:
             abort(400, description="Invalid request data")
 
-# Input validation function
-def validate_input(data):
-    if isinstance(data, dict):
-        for key, value in data.items():
-            if isinstance(value, (str, bytes)):
-                # Check for SQL injection patterns
-                sql_patterns = [r'\bor\b', r'\band\b', r'\bunion\b', r'\bselect\b', r'\bfrom\b', r'\bwhere\b', r'\bdrop\b', r'\balter\b']
-                for pattern in sql_patterns:
-                    if re.search(pattern, str(value), re.IGNORECASE):
-                        raise ValueError("Invalid input detected")
-                # Check for XSS patterns
-                xss_patterns = [r'<script', r'</script>', r'<iframe', r'</iframe>', r'javascript:', r'vbscript:']
-                for pattern in xss_patterns:
-                    if re.search(pattern, str(value), re.IGNORECASE):
-                        raise ValueError("Invalid input detected")
-            elif isinstance(value, (dict, list)):
-                validate_input(value)
-    elif isinstance(data, list):
-        for item in data:
-            validate_input(item)
-
-# Async support
-app.executor = ThreadPoolExecutor(max_workers=10)
+def health():
+    return {'status': 'ok'}
 
 # Async helper function
 def run_async(func):
     def wrapper(*args, **kwargs):
+        import asyncio
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         return loop.run_until_complete(func(*args, **kwargs))
     return wrapper
 
-# Import db from models
-from models.db import db
-db.init_app(app)
-
-api = Api(app)
-
-# Import models
-from models.user_model import User
-from models.cert_model import Certificate
-from models.payment_model import PaymentOrder
-from models.invitation_model import Invitation
-
 # Celery configuration
-def make_celery(app):
+def create_celery(app=None):
+    """
+    Create the Celery app bound to a Flask app (a worker-role app by default).
+    
+    Tasks are registered when the worker or beat imports the `tasks` module on startup,
+    so importing this module does not import any task or service code.
+    """
+    from celery import Celery
+    
+    app = app or create_app(ROLE_WORKER)
     celery = Celery(
         app.import_name,
         backend=app.config['CELERY_RESULT_BACKEND'],
         broker=app.config['CELERY_BROKER_URL']
     )
     celery.conf.update(app.config)
+    # Old-style key, like the CELERY_* keys coming from the Flask config
+    celery.conf.update(CELERY_IMPORTS=('tasks',))
     
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
@@ -144,29 +210,32 @@ def make_celery(app):
     celery.Task = ContextTask
     return celery
 
-celery = make_celery(app)
-
-# Import routes
-from routes.auth_routes import auth_bp
-from routes.cert_routes import cert_bp
-from routes.payment_routes import payment_bp
-from routes.invitation_routes import invitation_bp
-
-# Import tasks to register them with Celery
-import tasks
-
-# Register error handlers
-from utils.error_handler import register_error_handlers
-register_error_handlers(app)
-
-app.register_blueprint(auth_bp)
-app.register_blueprint(cert_bp)
-app.register_blueprint(payment_bp)
-app.register_blueprint(invitation_bp)
-
-# Create database tables
-with app.app_context():
-    db.create_all()
+_app = None
+_celery = None
+_lock = threading.RLock()
+
+def __getattr__(name):
+    """
+    Module-level `app` and `celery` are created on first access, so `from app import app`
+    builds the web app, while `celery -A app.celery` builds only a worker-role app.
+    """
+    global _app, _celery
+    if name == 'app':
+        with _lock:
+            if _app is None:
+                _app = create_app(ROLE_WEB)
+            return _app
+    if name == 'celery':
+        with _lock:
+            if _celery is None:
+                if _app is None:
+                    _app = create_app(ROLE_WORKER)
+                _celery = create_celery(_app)
+            return _celery
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py).
+    # Go through the importable module so that tasks share this app instead of creating another.
+    from app import app
+    app.run(host='0.0.0.0', debug=os.getenv('FLASK_DEBUG') == '1')
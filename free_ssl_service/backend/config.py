@@ -27,20 +27,93 @@ class Config:
     CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://redis:6379/1')
     CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', '3600'))
     CACHE_KEY_PREFIX = os.getenv('CACHE_KEY_PREFIX', 'freessl:')
+    # Authenticated principal cache: Redis TTL and in-process TTL (seconds)
+    PRINCIPAL_CACHE_TTL = int(os.getenv('PRINCIPAL_CACHE_TTL', '60'))
+    PRINCIPAL_CACHE_LOCAL_TTL = float(os.getenv('PRINCIPAL_CACHE_LOCAL_TTL', '5'))
+    
+    # Certificate PEM material cache (bytes)
+    PEM_CACHE_MAX_BYTES = int(os.getenv('PEM_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
     
     # Celery configuration
     CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://redis:6379/0')
     CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
     
+    # Scan scheduling: daily (fixed crontab) or bucketed (spread across the day)
+    SCAN_SCHEDULE_MODE = os.getenv('SCAN_SCHEDULE_MODE', 'daily')
+    SCAN_BUCKETS = int(os.getenv('SCAN_BUCKETS', '96'))
+    SCAN_TICK_MINUTES = int(os.getenv('SCAN_TICK_MINUTES', '15'))
+    SCAN_TICK_LIMIT = int(os.getenv('SCAN_TICK_LIMIT', '500'))
+    SCAN_CHUNK_SIZE = int(os.getenv('SCAN_CHUNK_SIZE', '100'))
+    SCAN_TICK_JITTER = int(os.getenv('SCAN_TICK_JITTER', '60'))
+    # Lease held on a scan cursor while a bucket is processed (renewed after every chunk)
+    SCAN_LEASE_SECONDS = int(os.getenv('SCAN_LEASE_SECONDS', '1800'))
+    # Daily scans are split into shards of this many certificate IDs and fanned out across workers
+    SCAN_SHARD_SIZE = int(os.getenv('SCAN_SHARD_SIZE', '20000'))
+    # Expiry reminders: individual (one email per certificate) or digest (one email per user per scan)
+    EXPIRY_NOTIFICATION_MODE = os.getenv('EXPIRY_NOTIFICATION_MODE', 'individual')
+    # Days before the end of the free period at which a reminder is sent (once per threshold)
+    FREE_EXPIRY_THRESHOLDS = [int(days) for days in os.getenv('FREE_EXPIRY_THRESHOLDS', '30,7,1').split(',')]
+    
     # Certbot configuration
     CERTBOT_CONFIG_DIR = os.getenv('CERTBOT_CONFIG_DIR', '/etc/letsencrypt')
     CERTBOT_WORK_DIR = os.getenv('CERTBOT_WORK_DIR', '/var/lib/letsencrypt')
     CERTBOT_LOG_DIR = os.getenv('CERTBOT_LOG_DIR', '/var/log/letsencrypt')
+    CERTBOT_BIN = os.getenv('CERTBOT_BIN', 'certbot')
+    CERTBOT_TIMEOUT = int(os.getenv('CERTBOT_TIMEOUT', '600'))
+    # Cluster-wide certbot concurrency (0 disables the Redis governor)
+    CERTBOT_CLUSTER_LIMIT = int(os.getenv('CERTBOT_CLUSTER_LIMIT', '4'))
+    CERTBOT_ACQUIRE_TIMEOUT = int(os.getenv('CERTBOT_ACQUIRE_TIMEOUT', '300'))
+    CERTBOT_GOVERNOR_REDIS_URL = os.getenv('CERTBOT_GOVERNOR_REDIS_URL', CACHE_REDIS_URL)
+    # Comma-separated account emails allowed to read operational metrics (e.g. governor state)
+    ADMIN_EMAILS = [e.strip().lower() for e in os.getenv('ADMIN_EMAILS', '').split(',') if e.strip()]
+    
+    # Reuse an existing certificate for the same domain set if it is valid for at least this many days
+    CERT_REUSE_MIN_VALIDITY_DAYS = int(os.getenv('CERT_REUSE_MIN_VALIDITY_DAYS', '30'))
+    # Pending issuance jobs not picked up by a worker within this time are treated as abandoned
+    ISSUE_JOB_STALE_SECONDS = int(os.getenv('ISSUE_JOB_STALE_SECONDS', '3600'))
+    # Running jobs are released this long after they started; must exceed the longest possible
+    # issuance (governor wait, certbot or ACME order timeout, DNS propagation)
+    ISSUE_JOB_LEASE_SECONDS = int(os.getenv(
+        'ISSUE_JOB_LEASE_SECONDS', str(CERTBOT_ACQUIRE_TIMEOUT + 2 * CERTBOT_TIMEOUT + 300)
+    ))
+    
+    # Issuance backend: certbot (CLI) or acme (in-process ACME client)
+    ISSUANCE_BACKEND = os.getenv('ISSUANCE_BACKEND', 'certbot')
+    ACME_DIRECTORY_URL = os.getenv('ACME_DIRECTORY_URL', 'https://acme-v02.api.letsencrypt.org/directory')
+    ACME_ACCOUNT_KEY_PATH = os.getenv('ACME_ACCOUNT_KEY_PATH', '')
+    ACME_VERIFY_SSL = os.getenv('ACME_VERIFY_SSL', 'true').lower() == 'true'
+    ACME_KEY_TYPE = os.getenv('ACME_KEY_TYPE', 'ec')
+    ACME_DNS_PROVIDER = os.getenv('ACME_DNS_PROVIDER', 'route53')
+    ACME_CHALLTESTSRV_URL = os.getenv('ACME_CHALLTESTSRV_URL', 'http://localhost:8055')
+    ACME_DNS_PROPAGATION_SECONDS = float(os.getenv('ACME_DNS_PROPAGATION_SECONDS', '10'))
+    
+    # Bulk renewal configuration
+    RENEWAL_MAX_WORKERS = int(os.getenv('RENEWAL_MAX_WORKERS', '8'))
+    # Concurrent renewals per customer (certificate contact email); all orders use the same ACME account.
+    # RENEWAL_PER_ACCOUNT_LIMIT is the old name of this setting.
+    RENEWAL_PER_CUSTOMER_LIMIT = int(os.getenv('RENEWAL_PER_CUSTOMER_LIMIT', os.getenv('RENEWAL_PER_ACCOUNT_LIMIT', '4')))
+    RENEWAL_PER_DOMAIN_LIMIT = int(os.getenv('RENEWAL_PER_DOMAIN_LIMIT', '2'))
+    RENEWAL_MAX_ATTEMPTS = int(os.getenv('RENEWAL_MAX_ATTEMPTS', '3'))
+    RENEWAL_RETRY_BASE_DELAY = float(os.getenv('RENEWAL_RETRY_BASE_DELAY', '30'))
+    # Orders per batch for backends that pipeline orders (acme: one DNS propagation wait per batch)
+    RENEWAL_BATCH_SIZE = int(os.getenv('RENEWAL_BATCH_SIZE', '20'))
     
     # Email configuration
     EMAIL_SERVICE = os.getenv('EMAIL_SERVICE', 'sendgrid')
     EMAIL_API_KEY = os.getenv('EMAIL_API_KEY', '')
     EMAIL_FROM = os.getenv('EMAIL_FROM', 'noreply@freessl.com')
+    SENDGRID_API_URL = os.getenv('SENDGRID_API_URL', 'https://api.sendgrid.com')
+    # Outbox delivery: recipients per SendGrid call, emails per drain run and retry backoff
+    EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '500'))
+    EMAIL_DRAIN_LIMIT = int(os.getenv('EMAIL_DRAIN_LIMIT', '2000'))
+    EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '5'))
+    EMAIL_RETRY_BASE_DELAY = int(os.getenv('EMAIL_RETRY_BASE_DELAY', '60'))
+    # Email templates (<locale>/<kind>.html), compiled once per process with a bytecode cache
+    EMAIL_TEMPLATE_DIR = os.getenv('EMAIL_TEMPLATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email'))
+    EMAIL_TEMPLATE_CACHE_DIR = os.getenv('EMAIL_TEMPLATE_CACHE_DIR', '')
+    EMAIL_DEFAULT_LOCALE = os.getenv('EMAIL_DEFAULT_LOCALE', 'zh')
+    # Public URL of the frontend, used for links in emails
+    FRONTEND_BASE_URL = os.getenv('FRONTEND_BASE_URL', 'http://localhost:8080')
     
     # OAuth configuration
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID', '')
@@ -48,5 +121,39 @@ class Config:
     WECHAT_CLIENT_ID = os.getenv('WECHAT_CLIENT_ID', '')
     WECHAT_CLIENT_SECRET = os.getenv('WECHAT_CLIENT_SECRET', '')
     
+    # Listing endpoints (/api/certs, /api/invitation/list): default and maximum page size
+    LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', '50'))
+    LIST_MAX_PAGE_SIZE = int(os.getenv('LIST_MAX_PAGE_SIZE', '200'))
+    
+    # JSON response serializer: orjson (falls back to stdlib when not installed) or stdlib
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson')
+    
+    # JSON request screening budgets: max nesting depth and max total container elements
+    INPUT_SCREEN_MAX_DEPTH = int(os.getenv('INPUT_SCREEN_MAX_DEPTH', '32'))
+    INPUT_SCREEN_MAX_NODES = int(os.getenv('INPUT_SCREEN_MAX_NODES', '100000'))
+    
+    # One-time token lifetimes (seconds) and how long expired tokens are kept before purging
+    VERIFICATION_TOKEN_TTL = int(os.getenv('VERIFICATION_TOKEN_TTL', str(24 * 3600)))
+    RESET_TOKEN_TTL = int(os.getenv('RESET_TOKEN_TTL', '3600'))
+    AUTH_TOKEN_RETENTION_DAYS = int(os.getenv('AUTH_TOKEN_RETENTION_DAYS', '7'))
+    AUTH_TOKEN_PURGE_BATCH = int(os.getenv('AUTH_TOKEN_PURGE_BATCH', '1000'))
+    
+    # Password hashing: pbkdf2, scrypt or argon2 (requires argon2-cffi); existing hashes are upgraded on login
+    PASSWORD_HASH_SCHEME = os.getenv('PASSWORD_HASH_SCHEME', 'pbkdf2')
+    PASSWORD_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', '260000'))
+    PASSWORD_SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', '32768'))
+    PASSWORD_SCRYPT_R = int(os.getenv('PASSWORD_SCRYPT_R', '8'))
+    PASSWORD_SCRYPT_P = int(os.getenv('PASSWORD_SCRYPT_P', '1'))
+    PASSWORD_ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', '3'))
+    PASSWORD_ARGON2_MEMORY_COST = int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', '65536'))
+    PASSWORD_ARGON2_PARALLELISM = int(os.getenv('PASSWORD_ARGON2_PARALLELISM', '4'))
+    # Hashing runs in a process pool of this size (0 hashes in the request thread); beyond
+    # PASSWORD_HASH_MAX_PENDING queued operations requests get a 503. Both are per host and
+    # split evenly across the gunicorn workers; with more workers than PASSWORD_HASH_WORKERS each
+    # worker keeps one hashing process and a host-wide semaphore caps the concurrent hashes
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1)))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '64'))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+    
     # Encryption key for sensitive data
     ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', 'your-encryption-key-32-bytes-long')
\ No newline at end of file
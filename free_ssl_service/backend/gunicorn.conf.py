@@ -0,0 +1,59 @@
+"""
+gunicorn 配置，参数均可通过环境变量覆盖
+
+worker 类型（GUNICORN_WORKER_CLASS）：
+- sync：每个worker同时处理一个请求，适合CPU密集、无长连接的场景
+- gthread（默认）：每个worker一个线程池，请求中等待数据库、Redis、SendGrid时其他线程继续处理
+- gevent：协程，适合大量空闲长连接；需在主进程导入应用前打补丁，见下方
+
+平滑重载：kill -HUP <master> 按新配置重启全部worker，正在处理的请求在 graceful_timeout 内完成；
+由于应用在主进程中预加载，代码更新需 kill -USR2 <master> 启动新的主进程，
+新worker就绪后再向旧主进程发送 WINCH 和 TERM（或直接滚动重启容器）。
+"""
+import os
+import multiprocessing
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class not in ('sync', 'gthread', 'gevent'):
+    raise ValueError(f"Unsupported GUNICORN_WORKER_CLASS: {worker_class}")
+
+if worker_class == 'gevent':
+    # 预加载的应用在主进程中导入，必须在此之前打补丁
+    from gevent import monkey
+    monkey.patch_all()
+
+wsgi_app = 'wsgi:application'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+preload_app = True
+
+workers = int(os.getenv('GUNICORN_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))  # 仅 gthread
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))  # 仅 gevent
+
+# nginx 与 gunicorn 之间复用连接，keepalive 需小于 nginx 的 keepalive_timeout
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+
+# 定期回收worker，限制内存缓慢增长；抖动避免所有worker同时重启
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None  # 设为空字符串关闭访问日志
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+forwarded_allow_ips = os.getenv('FORWARDED_ALLOW_IPS', '*')
+
+def pre_fork(server, worker):
+    # HUP 重启worker时主进程可能重新建立过连接，fork前再关闭一次
+    from app import app, db
+    
+    with app.app_context():
+        db.engine.dispose()
+
+def when_ready(server):
+    # 密码哈希进程池按主机预算配置，由各worker平分；在fork worker之前执行，
+    # worker 数多于预算时创建的跨进程信号量由全部worker继承
+    from utils.password_hasher import password_hasher
+    
+    password_hasher.share(server.cfg.workers)
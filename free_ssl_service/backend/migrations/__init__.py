@@ -0,0 +1 @@
+# Data migrations
\ No newline at end of file
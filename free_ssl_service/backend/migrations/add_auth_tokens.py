@@ -0,0 +1,74 @@
+"""
+创建一次性令牌 auth_tokens 表，并迁移 users 表中的明文令牌
+
+users.verification_token / users.reset_token 中尚未使用的令牌以哈希形式写入新表，
+有效期从迁移时重新计算（旧令牌没有过期时间），随后清空这两列，数据库中不再保留明文令牌。
+列本身保留，确认无旧版本进程后可手工删除。按主键分批处理，可重复执行。
+
+用法：
+    python -m migrations.add_auth_tokens
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import inspect, text
+from models.user_model import User, db
+from models.auth_token_model import AuthToken, hash_token
+
+BATCH_SIZE = 1000
+
+LEGACY_COLUMNS = (
+    ('verification_token', AuthToken.PURPOSE_VERIFY_EMAIL, 'VERIFICATION_TOKEN_TTL'),
+    ('reset_token', AuthToken.PURPOSE_RESET_PASSWORD, 'RESET_TOKEN_TTL'),
+)
+
+def upgrade(batch_size=BATCH_SIZE):
+    """
+    创建表（如不存在）并迁移旧令牌
+    
+    Returns:
+        int: 迁移的令牌数
+    """
+    AuthToken.__table__.create(bind=db.engine, checkfirst=True)
+    
+    columns = [c['name'] for c in inspect(db.engine).get_columns(User.__tablename__)]
+    now = datetime.now()
+    migrated = 0
+    for column, purpose, ttl_key in LEGACY_COLUMNS:
+        if column not in columns:
+            continue
+        expires_at = now + timedelta(seconds=current_app.config[ttl_key])
+        
+        while True:
+            rows = db.session.execute(text(
+                f'SELECT id, {column} FROM {User.__tablename__} '
+                f'WHERE {column} IS NOT NULL ORDER BY id LIMIT :limit'
+            ), {'limit': batch_size}).fetchall()
+            if not rows:
+                break
+            
+            db.session.bulk_insert_mappings(AuthToken, [
+                {
+                    'user_id': row[0],
+                    'purpose': purpose,
+                    'token_hash': hash_token(row[1]),
+                    'expires_at': expires_at,
+                    'created_at': now
+                }
+                for row in rows
+            ])
+            db.session.execute(
+                text(f'UPDATE {User.__tablename__} SET {column} = NULL WHERE id IN :ids').bindparams(
+                    db.bindparam('ids', expanding=True)
+                ),
+                {'ids': [row[0] for row in rows]}
+            )
+            db.session.commit()
+            migrated += len(rows)
+    
+    return migrated
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        print(f"Migrated {upgrade()} legacy tokens to auth_tokens")
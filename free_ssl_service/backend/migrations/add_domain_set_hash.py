@@ -0,0 +1,72 @@
+"""
+添加域名集合哈希及颁发任务合并键
+
+为 certificates 表添加 domain_set_hash 列及 (user_id, domain_set_hash) 索引，
+为 certificate_jobs 表添加 inflight_key 列及唯一索引，并按主键分批回填已有证书的哈希。
+可重复执行。
+
+用法：
+    python -m migrations.add_domain_set_hash
+"""
+from sqlalchemy import inspect, text
+from models.cert_model import Certificate, domain_set_hash, db
+from models.cert_job_model import CertificateJob
+
+BATCH_SIZE = 1000
+
+def _add_column(table, column, ddl):
+    columns = [c['name'] for c in inspect(db.engine).get_columns(table.name)]
+    if column not in columns:
+        db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column} {ddl}'))
+        db.session.commit()
+
+def _create_indexes(table):
+    existing = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(bind=db.engine)
+
+def upgrade(batch_size=BATCH_SIZE):
+    """
+    添加列和索引并回填哈希
+    
+    Returns:
+        int: 回填的证书数
+    """
+    _add_column(Certificate.__table__, 'domain_set_hash', 'VARCHAR(64)')
+    _add_column(CertificateJob.__table__, 'inflight_key', 'VARCHAR(80)')
+    _create_indexes(Certificate.__table__)
+    _create_indexes(CertificateJob.__table__)
+    
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Certificate.id, Certificate.domains).filter(
+            Certificate.id > last_id,
+            Certificate.domain_set_hash.is_(None)
+        ).order_by(Certificate.id).limit(batch_size).all()
+        
+        if not rows:
+            break
+        
+        mappings = []
+        for cert_id, domains in rows:
+            try:
+                mappings.append({'id': cert_id, 'domain_set_hash': domain_set_hash(domains)})
+            except ValueError:
+                # 无法规范化的历史数据不参与复用
+                continue
+        db.session.bulk_update_mappings(Certificate, mappings)
+        db.session.commit()
+        
+        updated += len(mappings)
+        last_id = rows[-1][0]
+    
+    return updated
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        count = upgrade()
+        print(f"Backfilled domain set hash for {count} certificates")
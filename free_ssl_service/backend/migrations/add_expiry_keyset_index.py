@@ -0,0 +1,27 @@
+"""
+添加 certificates (expiry_date, id) 复合索引
+
+到期扫描按 (expiry_date, id) 做键集分页，该索引让每个批次都是一次索引范围扫描。
+可重复执行。
+
+用法：
+    python -m migrations.add_expiry_keyset_index
+"""
+from models.cert_model import Certificate, db
+
+INDEX_NAME = 'ix_certificates_expiry_date_id'
+
+def upgrade():
+    """
+    创建索引（如不存在）
+    """
+    for index in Certificate.__table__.indexes:
+        if index.name == INDEX_NAME:
+            index.create(bind=db.engine, checkfirst=True)
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        upgrade()
+        print(f"Created index {INDEX_NAME}")
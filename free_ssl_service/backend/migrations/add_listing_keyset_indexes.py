@@ -0,0 +1,33 @@
+"""
+添加列表接口的键集分页复合索引
+
+GET /api/certs 按 (user_id, issue_date, id)、GET /api/invitation/list 按
+(inviter_id, created_at, id) 分页，这两个索引让每一页都是一次索引范围扫描。
+可重复执行。
+
+用法：
+    python -m migrations.add_listing_keyset_indexes
+"""
+from models.cert_model import Certificate, db
+from models.invitation_model import Invitation
+
+INDEXES = {
+    Certificate: 'ix_certificates_user_issue_date_id',
+    Invitation: 'ix_invitations_inviter_created_at_id',
+}
+
+def upgrade():
+    """
+    创建索引（如不存在）
+    """
+    for model, name in INDEXES.items():
+        for index in model.__table__.indexes:
+            if index.name == name:
+                index.create(bind=db.engine, checkfirst=True)
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        upgrade()
+        print(f"Created indexes {', '.join(INDEXES.values())}")
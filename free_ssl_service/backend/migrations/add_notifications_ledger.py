@@ -0,0 +1,61 @@
+"""
+创建提醒台账 notifications 表
+
+旧的免费期提醒扫描每天都会重新提醒所有处于提醒窗口内的证书。
+创建表后为这些证书按当前所处的阈值写入台账记录，上线后的第一次扫描不会再重复提醒它们，
+之后只有进入下一个阈值的证书才会收到提醒。按主键分批处理，可重复执行。
+
+用法：
+    python -m migrations.add_notifications_ledger
+"""
+from datetime import datetime
+from models.cert_model import Certificate, db
+from models.notification_model import Notification
+
+BATCH_SIZE = 1000
+
+def upgrade(batch_size=BATCH_SIZE):
+    """
+    创建表（如不存在）并为已在提醒窗口内的证书写入台账
+    
+    Returns:
+        int: 写入的台账记录数
+    """
+    from tasks import free_expiry_certs_query
+    
+    Notification.__table__.create(bind=db.engine, checkfirst=True)
+    
+    now = datetime.now()
+    inserted = 0
+    last_id = 0
+    while True:
+        certs = free_expiry_certs_query(now).filter(
+            Certificate.id > last_id
+        ).order_by(Certificate.id).limit(batch_size).all()
+        
+        if not certs:
+            break
+        
+        db.session.bulk_insert_mappings(Notification, [
+            {
+                'certificate_id': cert.id,
+                'kind': Notification.KIND_FREE_EXPIRY,
+                'threshold': cert.free_expiry_threshold,
+                'created_at': now
+            }
+            for cert in certs
+        ])
+        db.session.commit()
+        
+        inserted += len(certs)
+        last_id = certs[-1].id
+    
+    return inserted
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        count = upgrade()
+        print(f"Seeded {count} free expiry notifications "
+              f"(thresholds: {app.config['FREE_EXPIRY_THRESHOLDS']})")
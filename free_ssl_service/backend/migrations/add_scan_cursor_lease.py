@@ -0,0 +1,28 @@
+"""
+为 scan_cursors 表添加租约列（locked_by、locked_until）
+
+分桶扫描运行期间持有游标的租约，避免同一扫描的两个运行处理相同的证书。可重复执行。
+
+用法：
+    python -m migrations.add_scan_cursor_lease
+"""
+from sqlalchemy import inspect, text
+from models.scan_cursor_model import ScanCursor, db
+
+def upgrade():
+    """
+    添加列（如不存在）
+    """
+    columns = [c['name'] for c in inspect(db.engine).get_columns(ScanCursor.__tablename__)]
+    if 'locked_by' not in columns:
+        db.session.execute(text(f'ALTER TABLE {ScanCursor.__tablename__} ADD COLUMN locked_by VARCHAR(32)'))
+    if 'locked_until' not in columns:
+        db.session.execute(text(f'ALTER TABLE {ScanCursor.__tablename__} ADD COLUMN locked_until DATETIME'))
+    db.session.commit()
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        upgrade()
+        print("Added scan_cursors.locked_by and scan_cursors.locked_until")
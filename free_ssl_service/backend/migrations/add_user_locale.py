@@ -0,0 +1,26 @@
+"""
+为 users 表添加 locale 列（邮件语言）
+
+已有用户的 locale 为空，发送邮件时使用 EMAIL_DEFAULT_LOCALE。可重复执行。
+
+用法：
+    python -m migrations.add_user_locale
+"""
+from sqlalchemy import inspect, text
+from models.user_model import User, db
+
+def upgrade():
+    """
+    添加列（如不存在）
+    """
+    columns = [c['name'] for c in inspect(db.engine).get_columns(User.__tablename__)]
+    if 'locale' not in columns:
+        db.session.execute(text(f'ALTER TABLE {User.__tablename__} ADD COLUMN locale VARCHAR(10)'))
+        db.session.commit()
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        upgrade()
+        print("Added users.locale")
@@ -0,0 +1,59 @@
+"""
+回填 certificate_domains 表
+
+为尚未拥有域名子表记录的证书，按 Certificate.domains 字符串生成规范化的域名行。
+按主键分批处理，可重复执行。
+
+用法：
+    python -m migrations.backfill_certificate_domains
+"""
+from models.cert_model import Certificate, CertificateDomain, split_domains, reverse_domain, db
+
+BATCH_SIZE = 1000
+
+def upgrade(batch_size=BATCH_SIZE):
+    """
+    创建表（如不存在）并回填域名记录
+    
+    Returns:
+        int: 新插入的域名记录数
+    """
+    CertificateDomain.__table__.create(bind=db.engine, checkfirst=True)
+    
+    inserted = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Certificate.id, Certificate.domains).outerjoin(
+            CertificateDomain, CertificateDomain.cert_id == Certificate.id
+        ).filter(
+            Certificate.id > last_id,
+            CertificateDomain.id.is_(None)
+        ).order_by(Certificate.id).limit(batch_size).all()
+        
+        if not rows:
+            break
+        
+        mappings = [
+            {
+                'cert_id': cert_id,
+                'domain': domain,
+                'reversed_domain': reverse_domain(domain),
+                'is_wildcard': domain.startswith('*.')
+            }
+            for cert_id, domains in rows
+            for domain in split_domains(domains)
+        ]
+        db.session.bulk_insert_mappings(CertificateDomain, mappings)
+        db.session.commit()
+        
+        inserted += len(mappings)
+        last_id = rows[-1][0]
+    
+    return inserted
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        count = upgrade()
+        print(f"Backfilled {count} certificate domain rows")
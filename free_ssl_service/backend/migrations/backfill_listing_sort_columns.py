@@ -0,0 +1,72 @@
+"""
+回填列表分页的排序列并改为 NOT NULL
+
+GET /api/certs 按 (issue_date, id)、GET /api/invitation/list 按 (created_at, id) 做键集分页，
+排序列为空的行不满足游标条件，第一页之后不会再出现。按颁发时的有效期从到期时间推算
+（证书免费期90天，邀请有效期30天），推算不出时取1970-01-01，排在列表末尾。
+按主键分批处理，可重复执行。SQLite 不支持修改列约束，只回填。
+
+用法：
+    python -m migrations.backfill_listing_sort_columns
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, text
+from models.cert_model import Certificate, db
+from models.invitation_model import Invitation
+
+BATCH_SIZE = 1000
+EPOCH = datetime(1970, 1, 1)
+
+# (排序列, 推算所用的到期列, 有效期)
+COLUMNS = (
+    (Certificate.issue_date, Certificate.free_expiry_date, timedelta(days=90)),
+    (Invitation.created_at, Invitation.expires_at, timedelta(days=30)),
+)
+
+def backfill(column, source, validity, batch_size=BATCH_SIZE) -> int:
+    """
+    回填排序列为空的行
+    
+    Returns:
+        int: 回填的行数
+    """
+    model = column.class_
+    updated = 0
+    while True:
+        rows = db.session.query(model.id, source).filter(column.is_(None)).order_by(model.id).limit(batch_size).all()
+        if not rows:
+            return updated
+        
+        db.session.bulk_update_mappings(model, [
+            {'id': row_id, column.key: expires - validity if expires else EPOCH}
+            for row_id, expires in rows
+        ])
+        db.session.commit()
+        updated += len(rows)
+
+def upgrade():
+    """
+    回填并添加 NOT NULL 约束（如需要）
+    
+    Returns:
+        int: 回填的行数
+    """
+    updated = 0
+    for column, source, validity in COLUMNS:
+        updated += backfill(column, source, validity)
+        
+        if db.engine.dialect.name == 'sqlite':
+            continue
+        table = column.class_.__tablename__
+        info = next(c for c in inspect(db.engine).get_columns(table) if c['name'] == column.key)
+        if info['nullable']:
+            db.session.execute(text(f'ALTER TABLE {table} MODIFY {column.key} DATETIME NOT NULL'))
+            db.session.commit()
+    return updated
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        count = upgrade()
+        print(f"Backfilled {count} rows; certificates.issue_date and invitations.created_at are NOT NULL")
@@ -0,0 +1,24 @@
+"""
+创建数据库表
+
+应用导入时不再自动执行 db.create_all()，首次部署或新增模型后执行一次。
+只创建不存在的表，不修改已有表结构（列变更见其他迁移脚本）。可重复执行。
+
+用法：
+    python -m migrations.create_schema
+"""
+from models.db import db
+
+def upgrade():
+    """
+    创建所有模型对应的表（如不存在）
+    """
+    db.create_all()
+
+if __name__ == '__main__':
+    from app import create_app, ROLE_WORKER
+    
+    app = create_app(ROLE_WORKER)
+    with app.app_context():
+        upgrade()
+        print("Database schema created")
@@ -0,0 +1,70 @@
+"""
+按依赖顺序执行全部数据库迁移
+
+首次部署和升级已有部署时都执行这一个命令（scripts/deploy.sh 在启动服务前调用）：
+先创建缺少的表，再为已有表添加列和索引、回填数据。
+已执行的迁移记录在 schema_migrations 表中，再次执行时跳过；各迁移本身也可重复执行，
+记录表丢失时全部重跑不会出错。新增迁移脚本时追加到 MIGRATIONS 末尾。
+
+用法：
+    python -m migrations.upgrade
+"""
+import importlib
+from datetime import datetime
+from sqlalchemy import Column, DateTime, MetaData, String, Table
+from models.db import db
+
+# 顺序即依赖关系：后面的迁移通过ORM查询证书和用户，要求前面添加的列已经存在
+MIGRATIONS = (
+    'create_schema',  # 新表（auth_tokens、certificate_domains、certificate_jobs、notifications 等）
+    'add_user_locale',
+    'widen_password_hash',
+    'add_auth_tokens',  # 旧的明文令牌迁移到 auth_tokens
+    'add_domain_set_hash',  # certificates.domain_set_hash、certificate_jobs.inflight_key
+    'backfill_certificate_domains',
+    'add_expiry_keyset_index',
+    'add_listing_keyset_indexes',
+    'add_scan_cursor_lease',
+    'add_notifications_ledger',  # 查询证书及其用户，需在上面的列变更之后
+    'backfill_listing_sort_columns',
+)
+
+# 迁移记录表不属于应用模型，不参与 db.create_all()
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('name', String(100), primary_key=True),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+def applied_migrations() -> set:
+    """
+    已执行的迁移名称（记录表不存在时创建）
+    """
+    schema_migrations.create(bind=db.engine, checkfirst=True)
+    return {row.name for row in db.session.execute(schema_migrations.select())}
+
+def upgrade() -> list:
+    """
+    依次执行尚未执行的迁移，每个迁移完成后立即记录，中途失败时重新执行会从失败的迁移继续
+    
+    Returns:
+        list: 本次执行的迁移名称
+    """
+    done = applied_migrations()
+    ran = []
+    for name in MIGRATIONS:
+        if name in done:
+            continue
+        importlib.import_module(f'migrations.{name}').upgrade()
+        db.session.execute(schema_migrations.insert().values(name=name, applied_at=datetime.now()))
+        db.session.commit()
+        ran.append(name)
+    return ran
+
+if __name__ == '__main__':
+    from app import create_app, ROLE_WORKER
+    
+    app = create_app(ROLE_WORKER)
+    with app.app_context():
+        ran = upgrade()
+        print(f"Applied {len(ran)} migrations: {', '.join(ran)}" if ran else "Database is up to date")
@@ -0,0 +1,33 @@
+"""
+将 users.password_hash 扩展为 VARCHAR(255)
+
+scrypt 和 argon2 哈希比 werkzeug 的 pbkdf2 哈希更长，原来的128个字符放不下。
+SQLite 不限制 VARCHAR 长度，无需修改。可重复执行。
+
+用法：
+    python -m migrations.widen_password_hash
+"""
+from sqlalchemy import inspect, text
+from models.user_model import User, db
+
+LENGTH = 255
+
+def upgrade():
+    """
+    扩展列长度（如需要）
+    """
+    if db.engine.dialect.name == 'sqlite':
+        return
+    column = next(c for c in inspect(db.engine).get_columns(User.__tablename__) if c['name'] == 'password_hash')
+    if getattr(column['type'], 'length', None) and column['type'].length < LENGTH:
+        db.session.execute(text(
+            f'ALTER TABLE {User.__tablename__} MODIFY password_hash VARCHAR({LENGTH}) NOT NULL'
+        ))
+        db.session.commit()
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        upgrade()
+        print(f"users.password_hash is VARCHAR({LENGTH})")
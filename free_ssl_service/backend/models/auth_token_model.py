@@ -0,0 +1,122 @@
+from models.db import db
+from datetime import datetime
+import hashlib
+import secrets
+
+def hash_token(token):
+    """
+    令牌的SHA-256，数据库中只保存哈希，按哈希走唯一索引查找
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class AuthToken(db.Model):
+    """
+    一次性令牌（邮箱验证、重置密码）
+    
+    明文令牌只出现在邮件链接中，表中保存其SHA-256；查找是一次唯一索引等值查询，
+    不依赖对明文令牌逐字符比较。使用时以带条件的UPDATE（未使用且未过期）消费，
+    并发请求中只有一个能成功。过期记录由 purge_expired_auth_tokens 任务定期清理。
+    """
+    __tablename__ = 'auth_tokens'
+    
+    PURPOSE_VERIFY_EMAIL = 'verify_email'
+    PURPOSE_RESET_PASSWORD = 'reset_password'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    purpose = db.Column(db.String(20), nullable=False)  # verify_email, reset_password
+    token_hash = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    used_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    @classmethod
+    def issue(cls, user_id, purpose, ttl):
+        """
+        生成一个令牌并使该用户同一用途的未使用令牌失效（不提交）
+        
+        Args:
+            user_id: 用户ID
+            purpose: 用途
+            ttl: 有效期（timedelta）
+        
+        Returns:
+            str: 明文令牌
+        """
+        now = datetime.now()
+        cls.query.filter(
+            cls.user_id == user_id,
+            cls.purpose == purpose,
+            cls.used_at.is_(None)
+        ).update({cls.used_at: now}, synchronize_session=False)
+        
+        token = secrets.token_urlsafe(32)
+        db.session.add(cls(
+            user_id=user_id,
+            purpose=purpose,
+            token_hash=hash_token(token),
+            expires_at=now + ttl,
+            created_at=now
+        ))
+        return token
+    
+    @classmethod
+    def consume(cls, token, purpose):
+        """
+        消费令牌（不提交，调用方回滚时令牌恢复可用）
+        
+        Args:
+            token: 明文令牌
+            purpose: 用途
+        
+        Returns:
+            Optional[int]: 令牌有效时返回用户ID，无效、过期或已使用时返回None
+        """
+        if not token:
+            return None
+        row = db.session.query(cls.id, cls.user_id).filter(
+            cls.token_hash == hash_token(token),
+            cls.purpose == purpose
+        ).first()
+        if row is None:
+            return None
+        
+        now = datetime.now()
+        consumed = cls.query.filter(
+            cls.id == row.id,
+            cls.used_at.is_(None),
+            cls.expires_at > now
+        ).update({cls.used_at: now}, synchronize_session=False)
+        return row.user_id if consumed == 1 else None
+    
+    @classmethod
+    def purge(cls, before, batch_size=1000):
+        """
+        分批删除在 before 之前过期或被使用的令牌，每批单独提交，避免长时间锁表
+        
+        Args:
+            before: 截止时间
+            batch_size: 每批删除的行数
+        
+        Returns:
+            int: 删除的行数
+        """
+        deleted = 0
+        while True:
+            ids = [row.id for row in db.session.query(cls.id).filter(
+                db.or_(cls.expires_at < before, cls.used_at < before)
+            ).order_by(cls.id).limit(batch_size)]
+            if not ids:
+                return deleted
+            deleted += cls.query.filter(cls.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'purpose': self.purpose,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'used_at': self.used_at.isoformat() if self.used_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
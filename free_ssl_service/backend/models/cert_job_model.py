@@ -0,0 +1,41 @@
+from models.db import db
+from datetime import datetime
+import uuid
+
+class CertificateJob(db.Model):
+    __tablename__ = 'certificate_jobs'
+    
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    domains = db.Column(db.String(255), nullable=False)
+    email = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(20), default=STATUS_PENDING, nullable=False)  # pending, running, succeeded, failed
+    cert_id = db.Column(db.Integer, db.ForeignKey('certificates.id'), nullable=True)
+    inflight_key = db.Column(db.String(80), unique=True, index=True)  # user_id:domain_set_hash，任务结束后清空，用于合并相同的并发申请
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    user = db.relationship('User', backref='certificate_jobs')
+    certificate = db.relationship('Certificate', foreign_keys=[cert_id])
+    
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'domains': self.domains,
+            'status': self.status,
+            'cert_id': self.cert_id,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
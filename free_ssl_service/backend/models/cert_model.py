@@ -1,19 +1,92 @@
 from models.db import db
-from datetime import datetime
+from datetime import datetime, timedelta
+from operator import attrgetter
+import hashlib
+
+def split_domains(domains):
+    """
+    将逗号分隔的域名字符串拆分为规范化的域名列表（小写、去重、保持顺序）
+    """
+    result = []
+    for domain in domains.split(','):
+        domain = domain.strip().lower().rstrip('.')
+        if domain and domain not in result:
+            result.append(domain)
+    return result
+
+def primary_domain(domains):
+    """
+    主域名，即certbot的lineage名称
+    """
+    return domains.split(',')[0].strip()
+
+def canonical_domains(domains):
+    """
+    规范化域名集合：小写、IDNA编码为ASCII、去重并排序
+    
+    Raises:
+        ValueError: 域名无法进行IDNA编码
+    """
+    result = set()
+    for domain in split_domains(domains):
+        try:
+            result.add(domain.encode('idna').decode('ascii'))
+        except UnicodeError:
+            raise ValueError(f"Invalid domain: {domain}")
+    return sorted(result)
+
+def domain_set_hash(domains):
+    """
+    规范化域名集合的SHA-256，相同域名集合（与顺序、大小写、IDN写法无关）得到相同的值
+    """
+    return hashlib.sha256(','.join(canonical_domains(domains)).encode('ascii')).hexdigest()
+
+def reverse_domain(domain):
+    """
+    按标签反转域名，例如 www.example.com -> com.example.www，便于按后缀做前缀索引查询
+    """
+    return '.'.join(reversed(domain.split('.')))
 
 class Certificate(db.Model):
     __tablename__ = 'certificates'
+    __table_args__ = (
+        db.Index('ix_certificates_user_domain_set', 'user_id', 'domain_set_hash'),
+        db.Index('ix_certificates_expiry_date_id', 'expiry_date', 'id'),
+        db.Index('ix_certificates_user_issue_date_id', 'user_id', 'issue_date', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     domains = db.Column(db.String(255), nullable=False)
+    domain_set_hash = db.Column(db.String(64))  # 规范化域名集合的SHA-256，用于复用已有证书
     email = db.Column(db.String(120), nullable=False)
-    issue_date = db.Column(db.DateTime, default=datetime.now)
+    issue_date = db.Column(db.DateTime, nullable=False, default=datetime.now)  # 列表分页的排序列
     expiry_date = db.Column(db.DateTime, nullable=False)
     free_expiry_date = db.Column(db.DateTime, nullable=False)
     cert_path = db.Column(db.String(255), nullable=False)
     notified_free_expiry = db.Column(db.Boolean, default=False)
     payment_status = db.Column(db.String(20), default='free')
+    # 免费期提醒扫描在查询中计算的当前提醒阈值（天），见 tasks.free_expiry_certs_query
+    free_expiry_threshold = db.query_expression()
+    
+    domain_entries = db.relationship('CertificateDomain', backref='certificate', lazy=True,
+                                     cascade='all, delete-orphan')
+    
+    @property
+    def domain_list(self):
+        return split_domains(self.domains)
+    
+    @property
+    def primary_domain(self):
+        return primary_domain(self.domains)
+    
+    def set_domains(self, domains):
+        """
+        设置证书域名，同时维护 certificate_domains 子表
+        """
+        self.domains = domains
+        self.domain_set_hash = domain_set_hash(domains)
+        self.domain_entries = [CertificateDomain.from_domain(domain) for domain in split_domains(domains)]
     
     def to_dict(self):
         return {
@@ -30,9 +103,88 @@ class Certificate(db.Model):
             'can_renew': self._can_renew()
         }
     
+    # 列表接口可返回的字段：列，以及由列计算出的字段及其依赖的列
+    SERIALIZED_COLUMNS = (
+        'id', 'domains', 'email', 'issue_date', 'expiry_date', 'free_expiry_date',
+        'cert_path', 'notified_free_expiry', 'payment_status'
+    )
+    COMPUTED_FIELDS = {
+        'status': ('expiry_date',),
+        'can_renew': ('expiry_date', 'free_expiry_date'),
+    }
+    SERIALIZED_FIELDS = SERIALIZED_COLUMNS + tuple(COMPUTED_FIELDS)
+    
+    @classmethod
+    def projected_columns(cls, fields=None, extra=()):
+        """
+        返回字段所需的列（fields 为None时为全部列），extra 为额外需要的列（如分页的排序列）
+        """
+        needed = set(extra)
+        for name in fields or cls.SERIALIZED_FIELDS:
+            needed.update(cls.COMPUTED_FIELDS.get(name, (name,)))
+        return [getattr(cls, name) for name in cls.SERIALIZED_COLUMNS if name in needed]
+    
+    @classmethod
+    def serialize_many(cls, rows, now=None, fields=None):
+        """
+        批量序列化，结果与逐个 to_dict() 编码后的JSON相同（fields 指定时只包含这些字段）
+        
+        rows 可以是只查询了 projected_columns() 的结果行，也可以是 Certificate 对象；
+        日期保留为 datetime，由 utils.json_provider 编码。整个响应只取一次当前时间，
+        可续期判断 (free_expiry_date - now).days <= 30 等价于 free_expiry_date < now + 31天。
+        
+        Args:
+            rows: 结果行或证书对象
+            now: 当前时间
+            fields: 返回的字段，默认全部
+        
+        Returns:
+            List[dict]: 证书数据
+        """
+        now = now or datetime.now()
+        renew_before = now + timedelta(days=31)
+        computed = {
+            'status': lambda row: 'active' if row.expiry_date > now else 'expired',
+            'can_renew': lambda row: row.free_expiry_date < renew_before or row.expiry_date <= now,
+        }
+        getters = [(name, computed.get(name) or attrgetter(name)) for name in fields or cls.SERIALIZED_FIELDS]
+        return [{name: getter(row) for name, getter in getters} for row in rows]
+    
     def _can_renew(self):
         now = datetime.now()
         return (
             (self.free_expiry_date - now).days <= 30 or
             self.expiry_date <= now
-        )
\ No newline at end of file
+        )
+
+class CertificateDomain(db.Model):
+    __tablename__ = 'certificate_domains'
+    __table_args__ = (
+        db.UniqueConstraint('cert_id', 'domain', name='uq_certificate_domains_cert_domain'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    cert_id = db.Column(db.Integer, db.ForeignKey('certificates.id', ondelete='CASCADE'), nullable=False, index=True)
+    domain = db.Column(db.String(253), nullable=False, index=True)  # 规范化后的完整域名，如 *.example.com
+    reversed_domain = db.Column(db.String(253), nullable=False, index=True)  # 如 com.example.*
+    is_wildcard = db.Column(db.Boolean, default=False, nullable=False)
+    
+    @classmethod
+    def from_domain(cls, domain):
+        return cls(
+            domain=domain,
+            reversed_domain=reverse_domain(domain),
+            is_wildcard=domain.startswith('*.')
+        )
+    
+    @staticmethod
+    def covering_names(hostname):
+        """
+        返回可以覆盖指定主机名的证书域名：主机名本身及其上一级通配符
+        """
+        hostname = hostname.strip().lower().rstrip('.')
+        names = [hostname]
+        labels = hostname.split('.')
+        if len(labels) > 2 and labels[0] != '*':
+            names.append('*.' + '.'.join(labels[1:]))
+        return names
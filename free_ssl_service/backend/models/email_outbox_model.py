@@ -0,0 +1,53 @@
+from models.db import db
+from datetime import datetime
+import json
+
+class EmailOutbox(db.Model):
+    """
+    待发送邮件，与业务数据在同一事务中写入，由 drain_email_outbox 任务批量投递
+    
+    subject 和 html_content 是同类邮件共用的模板，收件人相关的内容放在 substitutions 中，
+    投递时相同模板的邮件合并为一次SendGrid调用（每个收件人一个personalization）。
+    """
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(50), nullable=False)  # verification, password_reset, certificate_expiry, free_expiry
+    to_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html_content = db.Column(db.Text, nullable=False)
+    substitutions_json = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), default=STATUS_PENDING, nullable=False)  # pending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    sent_at = db.Column(db.DateTime)
+    
+    @property
+    def substitutions(self):
+        return json.loads(self.substitutions_json or '{}')
+    
+    @substitutions.setter
+    def substitutions(self, value):
+        self.substitutions_json = json.dumps(value or {})
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'to_email': self.to_email,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
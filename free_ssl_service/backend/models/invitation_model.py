@@ -3,6 +3,9 @@ from datetime import datetime
 
 class Invitation(db.Model):
     __tablename__ = 'invitations'
+    __table_args__ = (
+        db.Index('ix_invitations_inviter_created_at_id', 'inviter_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     invite_code = db.Column(db.String(32), unique=True, nullable=False)
@@ -10,7 +13,7 @@ class Invitation(db.Model):
     invitee_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     status = db.Column(db.String(20), default='pending')  # pending, accepted, expired
     reward_points = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)  # 列表分页的排序列
     accepted_at = db.Column(db.DateTime)
     expires_at = db.Column(db.DateTime)
     
@@ -28,4 +31,26 @@ class Invitation(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'accepted_at': self.accepted_at.isoformat() if self.accepted_at else None,
             'expires_at': self.expires_at.isoformat() if self.expires_at else None
-        }
\ No newline at end of file
+        }
+    
+    SERIALIZED_COLUMNS = (
+        'id', 'invite_code', 'inviter_id', 'invitee_id', 'status', 'reward_points',
+        'created_at', 'accepted_at', 'expires_at'
+    )
+    
+    @classmethod
+    def projected_columns(cls, fields=None, extra=()):
+        """
+        返回字段所需的列（fields 为None时为全部列），extra 为额外需要的列（如分页的排序列）
+        """
+        needed = set(fields or cls.SERIALIZED_COLUMNS) | set(extra)
+        return [getattr(cls, name) for name in cls.SERIALIZED_COLUMNS if name in needed]
+    
+    @classmethod
+    def serialize_many(cls, rows, fields=None):
+        """
+        批量序列化只查询了 projected_columns() 的结果行（或 Invitation 对象），
+        结果与逐个 to_dict() 编码后的JSON相同（fields 指定时只包含这些字段），日期由 utils.json_provider 编码
+        """
+        names = fields or cls.SERIALIZED_COLUMNS
+        return [{name: getattr(row, name) for name in names} for row in rows]
\ No newline at end of file
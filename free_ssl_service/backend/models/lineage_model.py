@@ -0,0 +1,22 @@
+from models.db import db
+from datetime import datetime
+
+class CertificateLineage(db.Model):
+    """
+    CERTBOT_CONFIG_DIR/live 下各证书目录在上次巡检时的状态
+    """
+    __tablename__ = 'certificate_lineages'
+    
+    name = db.Column(db.String(255), primary_key=True)  # live目录下的lineage名称
+    mtime_ns = db.Column(db.BigInteger, nullable=False)  # live和archive目录mtime的较大值
+    not_after = db.Column(db.DateTime)  # cert.pem的过期时间，文件缺失时为空
+    files_present = db.Column(db.Boolean, default=True, nullable=False)
+    checked_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'not_after': self.not_after.isoformat() if self.not_after else None,
+            'files_present': self.files_present,
+            'checked_at': self.checked_at.isoformat() if self.checked_at else None
+        }
@@ -0,0 +1,31 @@
+from models.db import db
+from datetime import datetime
+
+class Notification(db.Model):
+    """
+    已发送提醒的台账，每个 (证书, 类型, 阈值) 只记录一次
+    
+    扫描任务对该表做反连接，只处理新进入某个提醒阈值（如免费期结束前30/7/1天）的证书，
+    每次运行的工作量和邮件量与新事件数量相关，而不是与积压的证书总数相关。
+    """
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        db.UniqueConstraint('certificate_id', 'kind', 'threshold', name='uq_notifications_cert_kind_threshold'),
+    )
+    
+    KIND_FREE_EXPIRY = 'free_expiry'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    certificate_id = db.Column(db.Integer, db.ForeignKey('certificates.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)  # free_expiry
+    threshold = db.Column(db.Integer, nullable=False)  # 提醒阈值（天）
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'certificate_id': self.certificate_id,
+            'kind': self.kind,
+            'threshold': self.threshold,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,101 @@
+from models.db import db
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+import uuid
+
+class ScanCursor(db.Model):
+    __tablename__ = 'scan_cursors'
+    
+    name = db.Column(db.String(50), primary_key=True)  # certificate_expiry, free_expiry, auto_renew
+    bucket = db.Column(db.Integer, default=0, nullable=False)
+    last_id = db.Column(db.Integer, default=0, nullable=False)  # 当前分桶内已处理的最大证书ID
+    cycle_started_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    locked_by = db.Column(db.String(32))  # 持有租约的运行
+    locked_until = db.Column(db.DateTime)  # 租约到期时间，持有者崩溃后到期即可被接管
+    
+    @classmethod
+    def acquire(cls, name, lease_seconds):
+        """
+        获取扫描游标的租约，同一扫描同一时间只有一个运行在处理
+        
+        用条件UPDATE抢占（没有租约或租约已到期），返回的游标已从会话中移出，
+        修改后由 save() 写回，处理函数的提交和回滚不会影响它。
+        
+        Args:
+            name: 游标名称
+            lease_seconds: 租约时长（秒）
+        
+        Returns:
+            Optional[ScanCursor]: 持有租约的游标，其他运行持有租约时返回None
+        """
+        if cls.query.get(name) is None:
+            db.session.add(cls(name=name, bucket=0, last_id=0, cycle_started_at=datetime.now()))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # 其他运行同时创建了游标
+                db.session.rollback()
+        
+        token = uuid.uuid4().hex
+        now = datetime.now()
+        claimed = cls.query.filter(
+            cls.name == name,
+            db.or_(cls.locked_until.is_(None), cls.locked_until < now)
+        ).update({
+            cls.locked_by: token,
+            cls.locked_until: now + timedelta(seconds=lease_seconds)
+        }, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return None
+        
+        cursor = cls.query.get(name)
+        db.session.expunge(cursor)
+        return cursor
+    
+    def save(self, lease_seconds):
+        """
+        写回游标位置并续租，只有仍持有租约时才会写入
+        
+        Returns:
+            bool: 是否仍持有租约
+        """
+        now = datetime.now()
+        saved = ScanCursor.query.filter_by(name=self.name, locked_by=self.locked_by).update({
+            ScanCursor.bucket: self.bucket,
+            ScanCursor.last_id: self.last_id,
+            ScanCursor.cycle_started_at: self.cycle_started_at,
+            ScanCursor.updated_at: now,
+            ScanCursor.locked_until: now + timedelta(seconds=lease_seconds)
+        }, synchronize_session=False)
+        db.session.commit()
+        return bool(saved)
+    
+    def release(self):
+        """
+        释放租约
+        """
+        ScanCursor.query.filter_by(name=self.name, locked_by=self.locked_by).update({
+            ScanCursor.locked_by: None,
+            ScanCursor.locked_until: None
+        }, synchronize_session=False)
+        db.session.commit()
+    
+    def advance(self, buckets):
+        """
+        进入下一个分桶，回绕时开始新一轮
+        """
+        self.bucket = (self.bucket + 1) % buckets
+        self.last_id = 0
+        if self.bucket == 0:
+            self.cycle_started_at = datetime.now()
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'bucket': self.bucket,
+            'last_id': self.last_id,
+            'cycle_started_at': self.cycle_started_at.isoformat() if self.cycle_started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -1,5 +1,5 @@
 from models.db import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils.password_hasher import password_hasher
 from datetime import datetime
 import re
 
@@ -9,12 +9,11 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     username = db.Column(db.String(50), nullable=False, unique=True)
     email = db.Column(db.String(120), nullable=False, unique=True)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
     verified = db.Column(db.Boolean, default=False)
-    verification_token = db.Column(db.String(128))
-    reset_token = db.Column(db.String(128))
     reward_points = db.Column(db.Integer, default=0)
+    locale = db.Column(db.String(10))  # 邮件语言，为空时使用 EMAIL_DEFAULT_LOCALE
     
     certificates = db.relationship('Certificate', backref='user', lazy=True)
 
@@ -23,18 +22,10 @@ class User(db.Model):
             raise ValueError("Password must be at least 8 characters long")
         if not re.search(r'\d', password) or not re.search(r'[A-Za-z]', password):
             raise ValueError("Password must contain both letters and numbers")
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-    
-    def generate_verification_token(self):
-        self.verification_token = generate_password_hash(self.email + str(datetime.now()))[:50]
-        return self.verification_token
-    
-    def generate_reset_token(self):
-        self.reset_token = generate_password_hash(self.email + str(datetime.now()))[:50]
-        return self.reset_token
+        return password_hasher.verify(self.password_hash, password)
     
     def to_dict(self):
         return {
@@ -43,5 +34,6 @@ class User(db.Model):
             'email': self.email,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'verified': self.verified,
-            'reward_points': self.reward_points
+            'reward_points': self.reward_points,
+            'locale': self.locale
         }
\ No newline at end of file
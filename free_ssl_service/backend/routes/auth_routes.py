@@ -1,12 +1,20 @@
-from flask import Blueprint, request, jsonify, url_for
+from flask import Blueprint, request, url_for, current_app
+from utils.json_provider import jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import timedelta
+from werkzeug.exceptions import HTTPException
 from services.auth_service import AuthService
 from models.user_model import User, db
+from models.auth_token_model import AuthToken
 from services.email_service import EmailService
+from services.email_templates import get_email_renderer
+from services.principal_cache import principal_cache
+from utils.input_screen import screen_input
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
 @auth_bp.route('/register', methods=['POST'])
+@screen_input(exempt_fields=('password',))
 def register():
     """
     Register a new user
@@ -29,6 +37,9 @@ def register():
               type: string
             password:
               type: string
+            locale:
+              type: string
+              description: Email language, defaults to the best match of Accept-Language
     responses:
       201:
         description: User created successfully
@@ -46,21 +57,31 @@ def register():
             email=data['email']
         )
         user.set_password(data['password'])
-        user.generate_verification_token()
+        locales = get_email_renderer(current_app.config).locales
+        user.locale = data.get('locale') if data.get('locale') in locales else request.accept_languages.best_match(locales)
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()
         
-        # 发送验证邮件
-        EmailService.send_verification_email(user)
+        # 验证邮件与用户在同一事务中写入发件箱，由后台任务投递
+        token = AuthToken.issue(user.id, AuthToken.PURPOSE_VERIFY_EMAIL,
+                                timedelta(seconds=current_app.config['VERIFICATION_TOKEN_TTL']))
+        EmailService.send_verification_email(user, token)
+        db.session.commit()
+        EmailService.notify_outbox()
         
         return jsonify({
             'message': 'User created successfully. Please check your email to verify your account.'
         }), 201
+    except HTTPException:
+        # 密码哈希进程池繁忙时返回503
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
 @auth_bp.route('/login', methods=['POST'])
+@screen_input(exempt_fields=('password',))
 def login():
     """
     Login user
@@ -128,13 +149,15 @@ def verify(token):
       400:
         description: Invalid token
     """
-    user = User.query.filter_by(verification_token=token).first()
+    user_id = AuthToken.consume(token, AuthToken.PURPOSE_VERIFY_EMAIL)
+    user = User.query.get(user_id) if user_id else None
     if not user:
+        db.session.rollback()
         return jsonify({'error': 'Invalid verification token'}), 400
     
     user.verified = True
-    user.verification_token = None
     db.session.commit()
+    principal_cache.invalidate(user.id)
     
     return jsonify({'message': 'Account verified successfully'})
 
@@ -167,14 +190,17 @@ def forgot_password():
     
     user = User.query.filter_by(email=email).first()
     if user:
-        reset_token = user.generate_reset_token()
-        db.session.commit()
+        reset_token = AuthToken.issue(user.id, AuthToken.PURPOSE_RESET_PASSWORD,
+                                      timedelta(seconds=current_app.config['RESET_TOKEN_TTL']))
         EmailService.send_password_reset_email(user, reset_token)
+        db.session.commit()
+        EmailService.notify_outbox()
     
     # 即使没有找到用户也返回成功以防止枚举攻击
     return jsonify({'message': 'If the email exists, a reset link has been sent'})
 
 @auth_bp.route('/reset-password', methods=['POST'])
+@screen_input(exempt_fields=('token', 'new_password'))
 def reset_password():
     """
     Reset password with token
@@ -206,16 +232,20 @@ def reset_password():
     if not token or not new_password:
         return jsonify({'error': 'Token and new password are required'}), 400
     
-    user = User.query.filter_by(reset_token=token).first()
+    user_id = AuthToken.consume(token, AuthToken.PURPOSE_RESET_PASSWORD)
+    user = User.query.get(user_id) if user_id else None
     if not user:
+        db.session.rollback()
         return jsonify({'error': 'Invalid reset token'}), 400
     
     try:
         user.set_password(new_password)
-        user.reset_token = None
         db.session.commit()
+        principal_cache.invalidate(user.id)
         return jsonify({'message': 'Password reset successfully'})
     except ValueError as e:
+        # 回滚后令牌恢复可用，用户可以换一个密码重试
+        db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
 @auth_bp.route('/me', methods=['GET'])
@@ -1,16 +1,39 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, url_for, current_app, stream_with_context
 from services.auth_service import AuthService
 from services.cert_service import CertService
+from services.export_service import CertExportService
 from models.cert_model import Certificate, db
 from datetime import datetime, timedelta
+from utils.input_screen import screen_input
+from utils.json_provider import jsonify
+from utils.pagination import page_response, parse_datetime, parse_fields, parse_limit
 
 cert_bp = Blueprint('cert', __name__, url_prefix='/api/certs')
 
 @cert_bp.route('', methods=['GET'])
 def list_certs():
     user = AuthService.get_current_user()
-    certs = Certificate.query.filter_by(user_id=user.id).order_by(Certificate.issue_date.desc()).all()
-    return jsonify([cert.to_dict() for cert in certs])
+    args = request.args
+    
+    try:
+        fields = parse_fields(args.get('fields'), Certificate.SERIALIZED_FIELDS)
+        # 按域名查找与其他筛选条件组合，同样按游标分页
+        page = CertService().list_certs(
+            user.id,
+            cursor=args.get('cursor'),
+            limit=parse_limit(args.get('limit'), current_app.config['LIST_PAGE_SIZE'],
+                              current_app.config['LIST_MAX_PAGE_SIZE']),
+            fields=fields,
+            status=args.get('status'),
+            expires_after=parse_datetime(args.get('expires_after'), 'expires_after'),
+            expires_before=parse_datetime(args.get('expires_before'), 'expires_before'),
+            payment_status=args.get('payment_status'),
+            domain=args.get('domain'),
+            match=args.get('match', 'covers')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return page_response(page.items, page.next_cursor)
 
 @cert_bp.route('', methods=['POST'])
 def create_cert():
@@ -22,16 +45,76 @@ def create_cert():
     
     try:
         cert_service = CertService()
-        cert = cert_service.issue_cert(
+        
+        # 已有相同域名集合的有效证书时直接返回，不再重复签发
+        cert = cert_service.find_reusable_cert(data['domains'], user)
+        if cert:
+            return jsonify(cert.to_dict()), 200
+        
+        job = cert_service.submit_issue_job(
             domains=data['domains'],
             email=user.email,
             user=user
         )
         
-        return jsonify(cert.to_dict()), 201
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers['Location'] = url_for('cert.get_issue_job', job_id=job.id)
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@cert_bp.route('/export', methods=['POST'])
+@screen_input(exempt_fields=('password',))
+def export_certs():
+    user = AuthService.get_current_user()
+    data = request.json or {}
+    
+    try:
+        exporter = CertExportService(data.get('format', 'zip'), data.get('password'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = Certificate.query.filter_by(user_id=user.id)
+    ids = data.get('ids')
+    if ids:
+        if not isinstance(ids, list) or not all(isinstance(cert_id, int) for cert_id in ids):
+            return jsonify({'error': 'ids must be a list of certificate IDs'}), 400
+        query = query.filter(Certificate.id.in_(ids))
+    certs = query.order_by(Certificate.id).all()
+    
+    # 边读取文件边输出，不在内存中生成完整的归档
+    response = current_app.response_class(
+        stream_with_context(exporter.stream(certs)),
+        mimetype=exporter.mimetype
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={exporter.filename}'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@cert_bp.route('/governor', methods=['GET'])
+def get_governor_metrics():
+    # 集群内的排队和占用情况属于运维信息，只对管理员开放
+    AuthService.get_current_admin()
+    governor = CertService().backend.governor
+    
+    if governor is None:
+        return jsonify({'error': 'Certbot governor is disabled'}), 404
+    return jsonify(governor.metrics())
+
+@cert_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_issue_job(job_id):
+    user = AuthService.get_current_user()
+    job = CertService().get_issue_job(job_id, user.id)
+    
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    job_dict = job.to_dict()
+    if job.certificate:
+        job_dict['certificate'] = job.certificate.to_dict()
+    return jsonify(job_dict)
+
 @cert_bp.route('/<int:cert_id>', methods=['GET'])
 def get_cert(cert_id):
     user = AuthService.get_current_user()
@@ -41,16 +124,27 @@ def get_cert(cert_id):
         return jsonify({'error': 'Certificate not found'}), 404
     
     cert_dict = cert.to_dict()
+    cert_service = CertService()
     
     # 读取证书文件
     try:
-        cert_dict['certificate'] = open(f"{cert.cert_path}/cert.pem").read()
-        cert_dict['private_key'] = open(f"{cert.cert_path}/privkey.pem").read()
-        cert_dict['chain'] = open(f"{cert.cert_path}/chain.pem").read()
+        etag = cert_service.get_cert_etag(cert, cert_dict)
+        
+        # 客户端已持有相同版本的证书，无需重新下载
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            material = cert_service.get_cert_material(cert)
+            cert_dict['certificate'] = material.certificate
+            cert_dict['private_key'] = material.private_key
+            cert_dict['chain'] = material.chain
+            response = jsonify(cert_dict)
     except FileNotFoundError:
         return jsonify({'error': 'Certificate files not found'}), 404
     
-    return jsonify(cert_dict)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @cert_bp.route('/<int:cert_id>/renew', methods=['POST'])
 def renew_cert(cert_id):
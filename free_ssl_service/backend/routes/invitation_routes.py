@@ -1,4 +1,7 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, current_app
+from utils.json_provider import jsonify
+from utils.pagination import page_response, parse_datetime, parse_fields, parse_limit
+from models.invitation_model import Invitation
 from services.auth_service import AuthService
 from services.invitation_service import InvitationService
 
@@ -41,9 +44,22 @@ def list_invitations():
     获取用户的邀请列表
     """
     user = AuthService.get_current_user()
+    args = request.args
     
-    invitations = InvitationService.get_user_invitations(user.id)
-    return jsonify(invitations)
+    try:
+        page = InvitationService.get_user_invitations(
+            user.id,
+            cursor=args.get('cursor'),
+            limit=parse_limit(args.get('limit'), current_app.config['LIST_PAGE_SIZE'],
+                              current_app.config['LIST_MAX_PAGE_SIZE']),
+            fields=parse_fields(args.get('fields'), Invitation.SERIALIZED_COLUMNS),
+            status=args.get('status'),
+            expires_after=parse_datetime(args.get('expires_after'), 'expires_after'),
+            expires_before=parse_datetime(args.get('expires_before'), 'expires_before')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return page_response(page.items, page.next_cursor)
 
 @invitation_bp.route('/stats', methods=['GET'])
 def get_invitation_stats():
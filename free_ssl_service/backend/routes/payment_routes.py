@@ -1,4 +1,5 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
+from utils.json_provider import jsonify
 from services.auth_service import AuthService
 from services.payment_service import PaymentService
 from models.payment_model import PaymentOrder
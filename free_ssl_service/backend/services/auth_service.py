@@ -3,8 +3,10 @@ import logging
 from datetime import datetime, timedelta
 from typing import Optional
 from flask import current_app, request
-from werkzeug.exceptions import Unauthorized
-from models.user_model import User
+from werkzeug.exceptions import Forbidden, Unauthorized
+from models.user_model import User, db
+from utils.password_hasher import password_hasher
+from services.principal_cache import principal_cache
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +22,7 @@ class AuthService:
         
         Args:
             user_id: 用户ID
-            
+        
         Returns:
             str: 生成的JWT令牌
         """
@@ -49,10 +51,10 @@ class AuthService:
         
         Args:
             token: JWT令牌
-            
+        
         Returns:
             str: 用户ID
-            
+        
         Raises:
             Unauthorized: 令牌过期或无效
         """
@@ -83,9 +85,12 @@ class AuthService:
         Args:
             username: 用户名
             password: 密码
-            
+        
         Returns:
             Optional[User]: 认证成功返回用户对象，失败返回None
+        
+        Raises:
+            ServiceUnavailable: 密码哈希进程池繁忙
         """
         # 参数验证
         if not username or not password:
@@ -97,6 +102,16 @@ class AuthService:
             logger.warning(f"Authentication failed for username: {username}")
             return None
         
+        # 哈希算法或参数已调整时，用本次登录的明文密码透明地升级哈希
+        if password_hasher.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = password_hasher.hash(password)
+                db.session.commit()
+                logger.info(f"Rehashed password for username: {username}")
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Failed to rehash password for username {username}: {str(e)}")
+        
         logger.info(f"Authentication successful for username: {username}")
         return user
     
@@ -107,7 +122,7 @@ class AuthService:
         
         Returns:
             User: 当前用户对象
-            
+        
         Raises:
             Unauthorized: 未授权或用户不存在
         """
@@ -121,7 +136,8 @@ class AuthService:
             token_value = token[7:]
             user_id = AuthService.decode_token(token_value)
             
-            user = User.query.get(user_id)
+            # 先查进程内和Redis缓存，未命中时才查询数据库
+            user = principal_cache.get(user_id)
             if not user:
                 logger.warning(f"User not found for ID: {user_id}")
                 raise Unauthorized('User not found')
@@ -132,4 +148,22 @@ class AuthService:
             raise
         except Exception as e:
             logger.error(f"Failed to get current user: {str(e)}")
-            raise Unauthorized('Failed to authenticate user')
\ No newline at end of file
+            raise Unauthorized('Failed to authenticate user')
+    
+    @staticmethod
+    def get_current_admin() -> User:
+        """
+        获取当前登录的管理员用户（邮箱在 ADMIN_EMAILS 中）
+        
+        Returns:
+            User: 当前管理员用户对象
+        
+        Raises:
+            Unauthorized: 未授权或用户不存在
+            Forbidden: 当前用户不是管理员
+        """
+        user = AuthService.get_current_user()
+        if (user.email or '').lower() not in current_app.config['ADMIN_EMAILS']:
+            logger.warning(f"Non-admin user {user.username} requested an admin endpoint")
+            raise Forbidden('Admin access required')
+        return user
\ No newline at end of file
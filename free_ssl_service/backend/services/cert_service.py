@@ -1,10 +1,18 @@
-import os
-import subprocess
 import logging
+import hashlib
+import json
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from flask import current_app
-from models.cert_model import Certificate, db
+from sqlalchemy.exc import IntegrityError
+from models.cert_model import (
+    Certificate, CertificateDomain, domain_set_hash, primary_domain, reverse_domain, split_domains, db
+)
+from models.cert_job_model import CertificateJob
+from utils.cert_metadata import CertMetadata, get_cert_metadata
+from utils.pem_cache import PemMaterial, pem_cache
+from utils.pagination import Page, keyset_page
+from services.issuance_backend import IssuanceBackend, IssuanceError, get_issuance_backend
 
 logger = logging.getLogger(__name__)
 
@@ -13,26 +21,67 @@ class CertService:
     证书服务类，负责SSL证书的申请、续期和管理
     """
     
-    def __init__(self):
-        """初始化证书服务"""
-        pass
+    def __init__(self, backend: Optional[IssuanceBackend] = None):
+        """
+        初始化证书服务
+        
+        Args:
+            backend: 证书颁发后端，默认按 ISSUANCE_BACKEND 配置选择
+        """
+        self._backend = backend
+    
+    @property
+    def backend(self) -> IssuanceBackend:
+        if self._backend is None:
+            self._backend = get_issuance_backend(current_app.config)
+        return self._backend
     
     def issue_cert(self, domains: str, email: str, user) -> Certificate:
         """
-        使用certbot颁发证书
+        颁发证书
         
         Args:
             domains: 域名列表，以逗号分隔
             email: 联系人邮箱
             user: 当前用户对象
-            
+        
         Returns:
             Certificate: 生成的证书对象
-            
+        
         Raises:
             ValueError: 参数验证失败
             Exception: 证书颁发失败
         """
+        self._validate_issue_request(domains, email, user)
+        
+        # 排队期间可能已有相同域名集合的证书签发完成
+        existing = self.find_reusable_cert(domains, user)
+        if existing:
+            logger.info(f"Reusing certificate {existing.id} for domains: {domains}")
+            return existing
+        
+        try:
+            logger.info(f"Issuing certificate for domains: {domains}")
+            self.backend.issue(primary_domain(domains), split_domains(domains), email)
+            cert = self._save_cert_to_db(domains, email, user)
+            logger.info(f"Certificate issued successfully for domains: {domains}")
+            return cert
+        except IssuanceError as e:
+            logger.error(f"Certificate issuance failed: {str(e)}")
+            raise Exception(f"Certificate issuance failed: {str(e)}")
+    
+    def _validate_issue_request(self, domains: str, email: str, user) -> None:
+        """
+        校验证书申请参数
+        
+        Args:
+            domains: 域名列表，以逗号分隔
+            email: 联系人邮箱
+            user: 当前用户对象
+        
+        Raises:
+            ValueError: 参数验证失败
+        """
         # 参数验证
         if not domains or not email:
             raise ValueError("Domains and email are required")
@@ -46,25 +95,191 @@ class CertService:
             if not domain.strip():
                 raise ValueError("Invalid domain format")
         
-        cmd = [
-            'certbot', 'certonly', '--non-interactive', '--agree-tos',
-            '--email', email,
-            '--dns-route53',
-            '--domains', domains,
-            '--config-dir', current_app.config['CERTBOT_CONFIG_DIR'],
-            '--work-dir', current_app.config['CERTBOT_WORK_DIR'],
-            '--logs-dir', current_app.config['CERTBOT_LOG_DIR']
-        ]
+        # IDNA编码失败时抛出ValueError
+        domain_set_hash(domains)
+    
+    def find_reusable_cert(self, domains: str, user) -> Optional[Certificate]:
+        """
+        查找用户已有的、域名集合完全相同且剩余有效期足够的证书
+        
+        域名集合按 domain_set_hash 比较，与域名顺序、大小写及IDN写法无关。
+        
+        Args:
+            domains: 域名列表，以逗号分隔
+            user: 当前用户对象
+        
+        Returns:
+            Optional[Certificate]: 可复用的证书，如果不存在则返回None
+        
+        Raises:
+            ValueError: 域名格式无效
+        """
+        min_expiry = datetime.now() + timedelta(days=current_app.config['CERT_REUSE_MIN_VALIDITY_DAYS'])
+        return Certificate.query.filter(
+            Certificate.user_id == user.id,
+            Certificate.domain_set_hash == domain_set_hash(domains),
+            Certificate.expiry_date > min_expiry
+        ).order_by(Certificate.expiry_date.desc()).first()
+    
+    def submit_issue_job(self, domains: str, email: str, user) -> CertificateJob:
+        """
+        创建异步证书颁发任务并投递到Celery
         
+        同一用户相同域名集合的申请在进行中时，直接返回进行中的任务而不重复创建ACME订单。
+        
+        Args:
+            domains: 域名列表，以逗号分隔
+            email: 联系人邮箱
+            user: 当前用户对象
+        
+        Returns:
+            CertificateJob: 已持久化的颁发任务
+        
+        Raises:
+            ValueError: 参数验证失败
+            Exception: 任务创建失败
+        """
+        self._validate_issue_request(domains, email, user)
+        
+        inflight_key = f'{user.id}:{domain_set_hash(domains)}'
+        job = None
+        # inflight_key 唯一约束保证并发的相同申请只有一个能插入成功
+        for _ in range(2):
+            job = CertificateJob(
+                user_id=user.id,
+                domains=domains,
+                email=email,
+                status=CertificateJob.STATUS_PENDING,
+                inflight_key=inflight_key
+            )
+            try:
+                db.session.add(job)
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                existing = self._get_inflight_job(inflight_key)
+                if existing:
+                    logger.info(f"Coalesced issuance request for domains {domains} into job {existing.id}")
+                    return existing
+            except Exception as e:
+                logger.error(f"Failed to create issuance job: {str(e)}")
+                db.session.rollback()
+                raise Exception(f"Failed to create issuance job: {str(e)}")
+        else:
+            raise Exception("Failed to create issuance job: concurrent request conflict")
+        
+        # 延迟导入以避免与tasks模块循环依赖
+        from tasks import issue_certificate
         try:
-            logger.info(f"Issuing certificate for domains: {domains}")
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
-            cert = self._save_cert_to_db(domains, email, user)
-            logger.info(f"Certificate issued successfully for domains: {domains}")
-            return cert
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Certificate issuance failed: {str(e.stderr)}")
-            raise Exception(f"Certificate issuance failed: {str(e)}")
+            issue_certificate.delay(job.id)
+        except Exception as e:
+            # 投递失败的任务不会被执行，立即结束它并释放 inflight_key，相同的申请可以马上重试
+            logger.error(f"Failed to queue issuance job {job.id}: {str(e)}")
+            self._fail_job(job, f'Failed to queue issuance job: {str(e)}')
+            raise Exception(f"Failed to queue issuance job: {str(e)}")
+        logger.info(f"Queued issuance job {job.id} for domains: {domains}")
+        return job
+    
+    def _fail_job(self, job: CertificateJob, error: str) -> None:
+        """
+        将任务标记为失败并释放 inflight_key
+        
+        Args:
+            job: 颁发任务
+            error: 失败原因
+        """
+        job.status = CertificateJob.STATUS_FAILED
+        job.error = error
+        job.finished_at = datetime.now()
+        job.inflight_key = None
+        db.session.commit()
+    
+    def _get_inflight_job(self, inflight_key: str) -> Optional[CertificateJob]:
+        """
+        获取进行中的颁发任务，已失效的任务标记为失败并释放 inflight_key
+        
+        等待中的任务按创建时间判断（超过 ISSUE_JOB_STALE_SECONDS 仍未被worker领取），
+        执行中的任务按开始时间判断（超过 ISSUE_JOB_LEASE_SECONDS 的租约），
+        排队较久或执行较慢但仍在进行的任务不会被误判。
+        
+        Args:
+            inflight_key: 任务合并键
+        
+        Returns:
+            Optional[CertificateJob]: 进行中的任务，如果不存在或已失效则返回None
+        """
+        job = CertificateJob.query.filter_by(inflight_key=inflight_key).first()
+        if not job:
+            return None
+        
+        now = datetime.now()
+        if job.status == CertificateJob.STATUS_RUNNING:
+            stale = job.started_at and job.started_at < now - timedelta(
+                seconds=current_app.config['ISSUE_JOB_LEASE_SECONDS']
+            )
+        else:
+            stale = job.created_at and job.created_at < now - timedelta(
+                seconds=current_app.config['ISSUE_JOB_STALE_SECONDS']
+            )
+        if stale:
+            logger.warning(f"Issuance job {job.id} is stale ({job.status}), releasing it")
+            self._fail_job(job, 'Issuance job timed out')
+            return None
+        return job
+    
+    def run_issue_job(self, job_id: str) -> Optional[CertificateJob]:
+        """
+        执行证书颁发任务（由Celery worker调用）
+        
+        用条件UPDATE把任务从等待中改为执行中，同一任务被重复投递时只会执行一次；
+        结果只在任务仍处于执行中（没有因超出租约被释放）时写回。
+        
+        Args:
+            job_id: 颁发任务ID
+        
+        Returns:
+            Optional[CertificateJob]: 更新后的任务，如果任务不存在或已被领取则返回None
+        """
+        claimed = CertificateJob.query.filter_by(id=job_id, status=CertificateJob.STATUS_PENDING).update({
+            CertificateJob.status: CertificateJob.STATUS_RUNNING,
+            CertificateJob.started_at: datetime.now()
+        }, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            logger.warning(f"Issuance job {job_id} not found or already claimed")
+            return None
+        
+        job = CertificateJob.query.get(job_id)
+        try:
+            cert = self.issue_cert(job.domains, job.email, job.user)
+            outcome = {CertificateJob.cert_id: cert.id, CertificateJob.status: CertificateJob.STATUS_SUCCEEDED}
+        except Exception as e:
+            db.session.rollback()
+            outcome = {CertificateJob.status: CertificateJob.STATUS_FAILED, CertificateJob.error: str(e)}
+        
+        outcome[CertificateJob.inflight_key] = None
+        outcome[CertificateJob.finished_at] = datetime.now()
+        finished = CertificateJob.query.filter_by(id=job_id, status=CertificateJob.STATUS_RUNNING).update(
+            outcome, synchronize_session=False
+        )
+        db.session.commit()
+        if not finished:
+            logger.warning(f"Issuance job {job_id} was released before it finished")
+        return CertificateJob.query.get(job_id)
+    
+    def get_issue_job(self, job_id: str, user_id: int) -> Optional[CertificateJob]:
+        """
+        根据ID获取颁发任务
+        
+        Args:
+            job_id: 颁发任务ID
+            user_id: 用户ID
+        
+        Returns:
+            Optional[CertificateJob]: 任务对象，如果不存在则返回None
+        """
+        return CertificateJob.query.filter_by(id=job_id, user_id=user_id).first()
     
     def _save_cert_to_db(self, domains: str, email: str, user) -> Certificate:
         """
@@ -74,13 +289,15 @@ class CertService:
             domains: 域名列表，以逗号分隔
             email: 联系人邮箱
             user: 当前用户对象
-            
+        
         Returns:
             Certificate: 保存的证书对象
         """
+        cert = Certificate(user_id=user.id, email=email, payment_status='free')
+        cert.set_domains(domains)
+        
         # 获取主域名作为证书路径
-        main_domain = domains.split(',')[0].strip()
-        cert_path = f"{current_app.config['CERTBOT_CONFIG_DIR']}/live/{main_domain}"
+        cert_path = f"{current_app.config['CERTBOT_CONFIG_DIR']}/live/{cert.primary_domain}"
         
         # 获取证书过期日期
         expiry_date = self._get_expiry_date(cert_path)
@@ -88,16 +305,10 @@ class CertService:
         # 免费期为3个月
         free_expiry_date = datetime.now() + timedelta(days=90)
         
-        cert = Certificate(
-            user_id=user.id,
-            domains=domains,
-            email=email,
-            issue_date=datetime.now(),
-            expiry_date=expiry_date,
-            free_expiry_date=free_expiry_date,
-            cert_path=cert_path,
-            payment_status='free'
-        )
+        cert.issue_date = datetime.now()
+        cert.expiry_date = expiry_date
+        cert.free_expiry_date = free_expiry_date
+        cert.cert_path = cert_path
         
         try:
             db.session.add(cert)
@@ -114,28 +325,73 @@ class CertService:
         
         Args:
             cert_path: 证书存放路径
-            
+        
         Returns:
             datetime: 证书过期日期
-            
+        
         Raises:
             Exception: 获取过期日期失败
         """
-        cert_file = f'{cert_path}/cert.pem'
-        if not os.path.exists(cert_file):
-            raise Exception(f"Certificate file not found: {cert_file}")
+        return self.get_cert_metadata(cert_path).not_after
+    
+    def get_cert_metadata(self, cert_path: str) -> CertMetadata:
+        """
+        在进程内解析证书元数据（按文件inode和mtime缓存）
+        
+        Args:
+            cert_path: 证书存放路径
+        
+        Returns:
+            CertMetadata: 证书元数据
         
-        cmd = ['openssl', 'x509', '-enddate', '-noout', '-in', cert_file]
+        Raises:
+            Exception: 证书文件不存在或解析失败
+        """
+        cert_file = f'{cert_path}/cert.pem'
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            date_str = result.stdout.split('=')[1].strip()
-            return datetime.strptime(date_str, '%b %d %H:%M:%S %Y %Z')
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Failed to get expiry date: {str(e.stderr)}")
-            raise Exception(f"Failed to get expiry date: {str(e)}")
+            return get_cert_metadata(cert_file)
+        except FileNotFoundError:
+            raise Exception(f"Certificate file not found: {cert_file}")
         except ValueError as e:
-            logger.error(f"Failed to parse expiry date: {str(e)}")
-            raise Exception(f"Failed to parse expiry date: {str(e)}")
+            logger.error(f"Failed to parse certificate: {str(e)}")
+            raise Exception(f"Failed to parse certificate: {str(e)}")
+    
+    def get_cert_etag(self, cert: Certificate, cert_dict: dict) -> str:
+        """
+        计算证书详情响应的强ETag
+        
+        由证书指纹和数据库字段摘要组成，续期或状态变化都会改变ETag。
+        
+        Args:
+            cert: 证书对象
+            cert_dict: 证书的字典表示
+        
+        Returns:
+            str: ETag值（不含引号）
+        
+        Raises:
+            FileNotFoundError: 证书文件不存在
+        """
+        fingerprint = get_cert_metadata(f'{cert.cert_path}/cert.pem').fingerprint
+        digest = hashlib.sha256(
+            json.dumps(cert_dict, sort_keys=True).encode()
+        ).hexdigest()[:16]
+        return f'{fingerprint}-{digest}'
+    
+    def get_cert_material(self, cert: Certificate) -> PemMaterial:
+        """
+        读取证书、私钥和证书链（带缓存）
+        
+        Args:
+            cert: 证书对象
+        
+        Returns:
+            PemMaterial: PEM文件内容
+        
+        Raises:
+            FileNotFoundError: 证书文件不存在
+        """
+        return pem_cache.get(cert.cert_path)
     
     def renew_cert(self, cert_id: int, user) -> Certificate:
         """
@@ -144,10 +400,10 @@ class CertService:
         Args:
             cert_id: 证书ID
             user: 当前用户对象
-            
+        
         Returns:
             Certificate: 续期后的证书对象
-            
+        
         Raises:
             ValueError: 参数验证失败
             Exception: 证书续期失败
@@ -164,27 +420,17 @@ class CertService:
         if not cert:
             raise Exception("Certificate not found or access denied")
         
-        # 获取主域名作为证书名称
-        main_domain = cert.domains.split(',')[0].strip()
-        
-        cmd = [
-            'certbot', 'renew', '--non-interactive',
-            '--cert-name', main_domain,
-            '--config-dir', current_app.config['CERTBOT_CONFIG_DIR'],
-            '--work-dir', current_app.config['CERTBOT_WORK_DIR'],
-            '--logs-dir', current_app.config['CERTBOT_LOG_DIR']
-        ]
-        
         try:
             logger.info(f"Renewing certificate for domains: {cert.domains}")
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
+            self.backend.renew(cert.primary_domain, cert.domain_list, cert.email)
+            pem_cache.invalidate(cert.cert_path)
             cert.expiry_date = self._get_expiry_date(cert.cert_path)
             cert.payment_status = 'paid'
             db.session.commit()
             logger.info(f"Certificate renewed successfully for domains: {cert.domains}")
             return cert
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Certificate renewal failed: {str(e.stderr)}")
+        except IssuanceError as e:
+            logger.error(f"Certificate renewal failed: {str(e)}")
             raise Exception(f"Certificate renewal failed: {str(e)}")
         except Exception as e:
             logger.error(f"Failed to renew certificate: {str(e)}")
@@ -197,12 +443,90 @@ class CertService:
         
         Args:
             user_id: 用户ID
-            
+        
         Returns:
             List[Certificate]: 证书列表
         """
         return Certificate.query.filter_by(user_id=user_id).all()
     
+    CERT_STATUSES = ('active', 'expired')
+    
+    def list_certs(self, user_id: int, cursor: Optional[str] = None, limit: int = 50,
+                   fields: Optional[Tuple[str, ...]] = None, status: Optional[str] = None,
+                   expires_after: Optional[datetime] = None, expires_before: Optional[datetime] = None,
+                   payment_status: Optional[str] = None, domain: Optional[str] = None,
+                   match: str = 'covers') -> Page:
+        """
+        按颁发时间倒序分页列出用户的证书
+        
+        只查询 fields 所需的列，状态、到期时间窗口、付费状态和域名作为SQL条件过滤，
+        按 (issue_date, id) 做键集分页，使用 (user_id, issue_date, id) 索引。
+        
+        Args:
+            user_id: 用户ID
+            cursor: 上一页返回的游标
+            limit: 每页数量
+            fields: 返回的字段，默认全部
+            status: active 或 expired
+            expires_after: 到期时间不早于
+            expires_before: 到期时间早于
+            payment_status: 付费状态
+            domain: 按域名查找，通过 certificate_domains 索引匹配
+            match: 域名匹配方式，covers 表示能覆盖该主机名的证书（精确匹配或上一级通配符），
+                suffix 表示该域名及其所有子域名的证书
+        
+        Returns:
+            Page: 序列化后的证书及下一页游标
+        
+        Raises:
+            ValueError: 状态、匹配方式或游标无效
+        """
+        now = datetime.now()
+        query = db.session.query(*Certificate.projected_columns(fields, extra=('id', 'issue_date'))).filter(
+            Certificate.user_id == user_id
+        )
+        if status == 'active':
+            query = query.filter(Certificate.expiry_date > now)
+        elif status == 'expired':
+            query = query.filter(Certificate.expiry_date <= now)
+        elif status:
+            raise ValueError(f"Invalid status, expected one of: {', '.join(self.CERT_STATUSES)}")
+        if expires_after:
+            query = query.filter(Certificate.expiry_date >= expires_after)
+        if expires_before:
+            query = query.filter(Certificate.expiry_date < expires_before)
+        if payment_status:
+            query = query.filter(Certificate.payment_status == payment_status)
+        if domain:
+            query = query.filter(self._domain_condition(domain, match))
+        
+        page = keyset_page(query, Certificate.issue_date, Certificate.id, cursor, limit, 'certs')
+        return Page(Certificate.serialize_many(page.items, now, fields), page.next_cursor)
+    
+    @staticmethod
+    def _domain_condition(domain: str, match: str):
+        """
+        证书ID在 certificate_domains 索引中匹配该域名的条件
+        
+        Raises:
+            ValueError: 匹配方式无效
+        """
+        domain = domain.strip().lower().rstrip('.')
+        if match == 'covers':
+            condition = CertificateDomain.domain.in_(CertificateDomain.covering_names(domain))
+        elif match == 'suffix':
+            reversed_name = reverse_domain(domain)
+            condition = db.or_(
+                CertificateDomain.reversed_domain == reversed_name,
+                # 转义域名中的 % 和 _，只按字面前缀匹配
+                CertificateDomain.reversed_domain.startswith(f'{reversed_name}.', autoescape=True)
+            )
+        else:
+            raise ValueError("Invalid match type")
+        
+        cert_ids = db.session.query(CertificateDomain.cert_id).filter(condition)
+        return Certificate.id.in_(cert_ids)
+    
     def get_cert_by_id(self, cert_id: int, user_id: int) -> Optional[Certificate]:
         """
         根据ID获取证书
@@ -210,7 +534,7 @@ class CertService:
         Args:
             cert_id: 证书ID
             user_id: 用户ID
-            
+        
         Returns:
             Optional[Certificate]: 证书对象，如果不存在则返回None
         """
@@ -0,0 +1,270 @@
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+import redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1]: 信号量有序集合；ARGV: 当前时间、租约到期时间、集群上限、令牌
+ACQUIRE_SLOT_SCRIPT = '''
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+    return 1
+end
+return 0
+'''
+
+# KEYS: 各限流有序集合；ARGV: 当前时间、租约到期时间、租约毫秒数、令牌、各键的上限（与KEYS一一对应）
+# 所有键都有空余名额时才同时占用，否则一个都不占
+ACQUIRE_LIMITS_SCRIPT = '''
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', ARGV[1])
+    if redis.call('ZCARD', key) >= tonumber(ARGV[4 + i]) then
+        return 0
+    end
+end
+for _, key in ipairs(KEYS) do
+    redis.call('ZADD', key, ARGV[2], ARGV[4])
+    redis.call('PEXPIRE', key, ARGV[3])
+end
+return 1
+'''
+
+# KEYS: 各限流有序集合；ARGV: 租约到期时间、租约毫秒数、令牌。只续期仍由该令牌持有的名额
+REFRESH_LIMITS_SCRIPT = '''
+for _, key in ipairs(KEYS) do
+    if redis.call('ZSCORE', key, ARGV[3]) then
+        redis.call('ZADD', key, ARGV[1], ARGV[3])
+        redis.call('PEXPIRE', key, ARGV[2])
+    end
+end
+return 1
+'''
+
+# KEYS[1]: lineage锁；ARGV[1]: 令牌。只释放自己持有的锁
+RELEASE_LOCK_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+
+class GovernorTimeout(Exception):
+    """等待certbot执行名额或lineage锁超时"""
+
+class CertbotGovernor:
+    """
+    集群范围的certbot并发控制
+    
+    Web进程、app.executor线程池和Celery worker共享同一个 CERTBOT_CONFIG_DIR，
+    通过Redis协调：
+    - 集群信号量：同时运行的certbot进程数不超过 cluster_limit
+    - lineage互斥：同一个lineage同一时间只有一个进程在操作
+    名额和锁都带租约（默认为certbot超时时间加余量），持有者崩溃后自动释放。
+    排队数量和等待时间记录在Redis中，可通过 metrics() 查看。
+    
+    此外提供按任意键的计数限流（try_acquire_limits），续期引擎用它在所有分片之间
+    共享每个客户和每个注册域名的并发上限。
+    """
+    
+    def __init__(self, redis_client: redis.Redis, cluster_limit: int = 4, lease_seconds: float = 660.0,
+                 acquire_timeout: float = 300.0, poll_interval: float = 0.5, key_prefix: str = 'freessl:certbot:'):
+        self.redis = redis_client
+        self.cluster_limit = cluster_limit
+        self.lease_seconds = lease_seconds
+        self.acquire_timeout = acquire_timeout
+        self.poll_interval = poll_interval
+        self.slots_key = f'{key_prefix}slots'
+        self.waiting_key = f'{key_prefix}waiting'
+        self.stats_key = f'{key_prefix}stats'
+        self.lock_prefix = f'{key_prefix}lineage:'
+        self.limit_prefix = f'{key_prefix}limit:'
+        self._acquire_slot_script = self.redis.register_script(ACQUIRE_SLOT_SCRIPT)
+        self._release_lock_script = self.redis.register_script(RELEASE_LOCK_SCRIPT)
+        self._acquire_limits_script = self.redis.register_script(ACQUIRE_LIMITS_SCRIPT)
+        self._refresh_limits_script = self.redis.register_script(REFRESH_LIMITS_SCRIPT)
+    
+    def _try_lock(self, cert_name: str, token: str) -> bool:
+        return bool(self.redis.set(self.lock_prefix + cert_name, token, nx=True, px=int(self.lease_seconds * 1000)))
+    
+    def _release_lock(self, cert_name: str, token: str) -> None:
+        self._release_lock_script(keys=[self.lock_prefix + cert_name], args=[token])
+    
+    def _release(self, cert_name: str, token: str, slot: bool = False) -> None:
+        # 释放失败时依赖租约到期，不影响已经完成的certbot调用
+        try:
+            if slot:
+                self.redis.zrem(self.slots_key, token)
+            self._release_lock(cert_name, token)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release certbot governor for {cert_name}: {str(e)}")
+    
+    def _try_slot(self, token: str) -> bool:
+        now = time.time()
+        return bool(self._acquire_slot_script(
+            keys=[self.slots_key],
+            args=[now, now + self.lease_seconds, self.cluster_limit, token]
+        ))
+    
+    def _wait_for(self, attempt: Callable[[], bool], deadline: float, what: str) -> None:
+        while not attempt():
+            if time.monotonic() >= deadline:
+                raise GovernorTimeout(f"Timed out after {self.acquire_timeout}s waiting for {what}")
+            time.sleep(self.poll_interval)
+    
+    @contextmanager
+    def lineage_lock(self, cert_name: str):
+        """
+        只获取lineage互斥锁（不占用certbot名额），用于不启动certbot的写入操作
+        
+        Raises:
+            GovernorTimeout: 等待超时
+        """
+        token = uuid.uuid4().hex
+        self._wait_for(lambda: self._try_lock(cert_name, token),
+                       time.monotonic() + self.acquire_timeout, f'lineage {cert_name}')
+        try:
+            yield
+        finally:
+            self._release(cert_name, token)
+    
+    @contextmanager
+    def slot(self, cert_name: str):
+        """
+        获取lineage互斥锁和集群certbot名额，退出时释放
+        
+        先获取lineage锁再排队等名额，等待同一lineage的请求不会占用名额。
+        
+        Args:
+            cert_name: lineage名称
+        
+        Returns:
+            float: 等待时间（秒）
+        
+        Raises:
+            GovernorTimeout: 等待超时
+        """
+        token = uuid.uuid4().hex
+        started = time.time()
+        deadline = time.monotonic() + self.acquire_timeout
+        # 以截止时间为分数记录排队者，进程崩溃后不会一直计入排队数量
+        self.redis.zadd(self.waiting_key, {token: started + self.acquire_timeout})
+        try:
+            self._wait_for(lambda: self._try_lock(cert_name, token), deadline, f'lineage {cert_name}')
+            try:
+                self._wait_for(lambda: self._try_slot(token), deadline, 'a certbot slot')
+            except BaseException:
+                self._release_lock(cert_name, token)
+                raise
+        except GovernorTimeout:
+            self.redis.hincrby(self.stats_key, 'timeouts', 1)
+            raise
+        finally:
+            self.redis.zrem(self.waiting_key, token)
+        
+        waited = time.time() - started
+        pipe = self.redis.pipeline()
+        pipe.hincrby(self.stats_key, 'acquired', 1)
+        pipe.hincrbyfloat(self.stats_key, 'wait_seconds_total', waited)
+        pipe.execute()
+        if waited >= 1:
+            logger.info(f"Waited {waited:.1f}s for certbot slot for {cert_name}")
+        
+        try:
+            yield waited
+        finally:
+            self._release(cert_name, token, slot=True)
+    
+    def try_acquire_limits(self, limits: Dict[str, int], token: str,
+                           lease_seconds: Optional[float] = None) -> bool:
+        """
+        在多个限流键上各占用一个名额，全部有空余时才占用（不等待）
+        
+        Args:
+            limits: 限流键到集群上限的映射，例如 {'renewal:customer:a@example.com': 4}
+            token: 持有者令牌，释放时使用
+            lease_seconds: 名额的租约，默认与certbot名额相同；持有时间更长时用 refresh_limits 续期
+        
+        Returns:
+            bool: 是否占用成功
+        
+        Raises:
+            redis.RedisError: Redis不可用
+        """
+        if not limits:
+            return True
+        keys = list(limits)
+        lease_seconds = lease_seconds or self.lease_seconds
+        now = time.time()
+        return bool(self._acquire_limits_script(
+            keys=[self.limit_prefix + key for key in keys],
+            args=[now, now + lease_seconds, int(lease_seconds * 1000), token]
+            + [limits[key] for key in keys]
+        ))
+    
+    def refresh_limits(self, keys, token: str, lease_seconds: float) -> None:
+        """
+        为 try_acquire_limits 占用的名额续租，租约已过期被清理的名额不会重新占用
+        
+        Raises:
+            redis.RedisError: Redis不可用
+        """
+        self._refresh_limits_script(
+            keys=[self.limit_prefix + key for key in keys],
+            args=[time.time() + lease_seconds, int(lease_seconds * 1000), token]
+        )
+    
+    def release_limits(self, keys, token: str) -> None:
+        """
+        释放 try_acquire_limits 占用的名额，失败时依赖租约到期
+        """
+        try:
+            pipe = self.redis.pipeline()
+            for key in keys:
+                pipe.zrem(self.limit_prefix + key, token)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release governor limits: {str(e)}")
+    
+    def metrics(self) -> Dict:
+        """
+        集群当前状态及累计统计
+        
+        Returns:
+            Dict: limit、active（运行中）、waiting（排队中）、acquired、timeouts、
+                wait_seconds_total 和 avg_wait_seconds
+        """
+        now = time.time()
+        pipe = self.redis.pipeline()
+        pipe.zcount(self.slots_key, now, '+inf')
+        pipe.zcount(self.waiting_key, now, '+inf')
+        pipe.hgetall(self.stats_key)
+        active, waiting, stats = pipe.execute()
+        stats = {key.decode() if isinstance(key, bytes) else key: float(value) for key, value in stats.items()}
+        acquired = int(stats.get('acquired', 0))
+        wait_total = stats.get('wait_seconds_total', 0.0)
+        return {
+            'limit': self.cluster_limit,
+            'active': active,
+            'waiting': waiting,
+            'acquired': acquired,
+            'timeouts': int(stats.get('timeouts', 0)),
+            'wait_seconds_total': round(wait_total, 3),
+            'avg_wait_seconds': round(wait_total / acquired, 3) if acquired else 0.0
+        }
+
+def get_certbot_governor(config) -> Optional[CertbotGovernor]:
+    """
+    根据配置创建certbot并发控制器，CERTBOT_CLUSTER_LIMIT 为0时不启用
+    """
+    if config['CERTBOT_CLUSTER_LIMIT'] <= 0:
+        return None
+    return CertbotGovernor(
+        redis.Redis.from_url(config['CERTBOT_GOVERNOR_REDIS_URL']),
+        cluster_limit=config['CERTBOT_CLUSTER_LIMIT'],
+        lease_seconds=config['CERTBOT_TIMEOUT'] + 60,
+        acquire_timeout=config['CERTBOT_ACQUIRE_TIMEOUT']
+    )
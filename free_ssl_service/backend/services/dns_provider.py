@@ -0,0 +1,167 @@
+import time
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+import requests
+
+logger = logging.getLogger(__name__)
+
+class DnsProvider(ABC):
+    """
+    DNS-01验证使用的DNS服务接口
+    
+    records 参数为 {完整记录名: [TXT值, ...]}，同一记录名可能有多个值
+    （例如 example.com 和 *.example.com 共用 _acme-challenge.example.com）。
+    不同订单可能同时使用同一个记录名，添加和删除都只影响传入的值。
+    """
+    
+    @abstractmethod
+    def add_txt_records(self, records: Dict[str, List[str]]) -> None:
+        """
+        发布TXT记录，返回时记录已生效
+        """
+    
+    @abstractmethod
+    def remove_txt_records(self, records: Dict[str, List[str]]) -> None:
+        """
+        删除TXT记录中的这些值
+        """
+
+class Route53DnsProvider(DnsProvider):
+    """
+    AWS Route53，与 certbot --dns-route53 使用相同的凭证来源
+    """
+    
+    def __init__(self, ttl: int = 10, wait_timeout: int = 600, max_attempts: int = 5, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('route53')
+        self.client = client
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.max_attempts = max_attempts
+        self._zones = None
+    
+    def _zone_id(self, name: str) -> str:
+        if self._zones is None:
+            self._zones = {}
+            paginator = self.client.get_paginator('list_hosted_zones')
+            for page in paginator.paginate():
+                for zone in page['HostedZones']:
+                    if not zone['Config'].get('PrivateZone'):
+                        self._zones[zone['Name'].rstrip('.')] = zone['Id']
+        
+        # 最长后缀匹配
+        labels = name.rstrip('.').split('.')
+        for i in range(len(labels)):
+            zone_id = self._zones.get('.'.join(labels[i:]))
+            if zone_id:
+                return zone_id
+        raise Exception(f"No Route53 hosted zone found for {name}")
+    
+    def _txt_record_set(self, zone_id: str, name: str) -> Optional[dict]:
+        response = self.client.list_resource_record_sets(
+            HostedZoneId=zone_id, StartRecordName=name, StartRecordType='TXT', MaxItems='1'
+        )
+        for record_set in response['ResourceRecordSets']:
+            if record_set['Name'].rstrip('.') == name.rstrip('.') and record_set['Type'] == 'TXT':
+                return record_set
+        return None
+    
+    def _update(self, name: str, update: Callable[[List[str]], List[str]]) -> Optional[str]:
+        """
+        读取-修改-写入一个TXT记录集
+        
+        DELETE 读到的记录集和 CREATE 新记录集放在同一个变更批次中：其间记录被其他订单修改时，
+        DELETE 与现有记录不一致，整个批次被拒绝，重新读取后重试，不会覆盖其他订单的值。
+        
+        Args:
+            name: 记录名
+            update: 由现有值（带引号）计算新值的函数
+        
+        Returns:
+            Optional[str]: 变更ID，记录无需修改时为None
+        """
+        zone_id = self._zone_id(name)
+        for _ in range(self.max_attempts):
+            current = self._txt_record_set(zone_id, name)
+            current_values = [record['Value'] for record in current['ResourceRecords']] if current else []
+            values = update(current_values)
+            if values == current_values:
+                return None
+            
+            changes = []
+            if current:
+                changes.append({'Action': 'DELETE', 'ResourceRecordSet': current})
+            if values:
+                changes.append({'Action': 'CREATE', 'ResourceRecordSet': {
+                    'Name': name,
+                    'Type': 'TXT',
+                    'TTL': self.ttl,
+                    'ResourceRecords': [{'Value': value} for value in values]
+                }})
+            try:
+                response = self.client.change_resource_record_sets(
+                    HostedZoneId=zone_id,
+                    ChangeBatch={'Comment': 'freessl dns-01', 'Changes': changes}
+                )
+                return response['ChangeInfo']['Id']
+            except self.client.exceptions.InvalidChangeBatch:
+                logger.info(f"TXT record {name} changed concurrently, retrying")
+        raise Exception(f"Failed to update TXT record {name}: too many concurrent changes")
+    
+    def _wait(self, change_ids: List[str]) -> None:
+        deadline = time.monotonic() + self.wait_timeout
+        for change_id in change_ids:
+            while self.client.get_change(Id=change_id)['ChangeInfo']['Status'] != 'INSYNC':
+                if time.monotonic() > deadline:
+                    raise Exception(f"Timed out waiting for Route53 change {change_id}")
+                time.sleep(5)
+    
+    def add_txt_records(self, records: Dict[str, List[str]]) -> None:
+        change_ids = []
+        for name, values in records.items():
+            quoted = [f'"{value}"' for value in values]
+            change_id = self._update(name, lambda current: current + [v for v in quoted if v not in current])
+            if change_id:
+                change_ids.append(change_id)
+        self._wait(change_ids)
+    
+    def remove_txt_records(self, records: Dict[str, List[str]]) -> None:
+        for name, values in records.items():
+            quoted = {f'"{value}"' for value in values}
+            try:
+                self._update(name, lambda current: [v for v in current if v not in quoted])
+            except Exception as e:
+                logger.warning(f"Failed to clean up dns-01 record {name}: {str(e)}")
+
+class ChallTestSrvDnsProvider(DnsProvider):
+    """
+    pebble-challtestsrv 的模拟DNS，用于本地和集成测试
+    """
+    
+    def __init__(self, api_url: str):
+        self.api_url = api_url.rstrip('/')
+        self.session = requests.Session()
+    
+    def add_txt_records(self, records: Dict[str, List[str]]) -> None:
+        for name, values in records.items():
+            for value in values:
+                response = self.session.post(f'{self.api_url}/set-txt', json={'host': name + '.', 'value': value})
+                response.raise_for_status()
+    
+    def remove_txt_records(self, records: Dict[str, List[str]]) -> None:
+        # challtestsrv 只能清空整个记录名，仅用于测试环境
+        for name in records:
+            self.session.post(f'{self.api_url}/clear-txt', json={'host': name + '.'})
+
+def get_dns_provider(config) -> DnsProvider:
+    """
+    根据配置创建DNS服务
+    """
+    provider = config['ACME_DNS_PROVIDER']
+    if provider == 'route53':
+        return Route53DnsProvider()
+    if provider == 'challtestsrv':
+        return ChallTestSrvDnsProvider(config['ACME_CHALLTESTSRV_URL'])
+    raise ValueError(f"Unknown DNS provider: {provider}")
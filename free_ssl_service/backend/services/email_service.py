@@ -1,149 +1,357 @@
 from flask import current_app
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-import os
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import attrgetter
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from markupsafe import escape
+from models.db import db
+from models.email_outbox_model import EmailOutbox
+from services.email_templates import get_email_renderer
+
+logger = logging.getLogger(__name__)
+
+def _days_until(date: datetime, now: datetime) -> int:
+    return max((date - now).days, 0)
+
+def _certificate_expiry_fields(cert, now: datetime) -> Dict:
+    """
+    证书到期提醒中每张证书的字段，单封提醒和摘要共用，剩余天数都从 now 起算
+    """
+    return {
+        'domains': cert.domains,
+        'expiry_date': cert.expiry_date.strftime('%Y-%m-%d'),
+        'days_until_expiry': _days_until(cert.expiry_date, now),
+        'free_expiry_date': cert.free_expiry_date.strftime('%Y-%m-%d')
+    }
+
+def _free_expiry_fields(cert, now: datetime) -> Dict:
+    """
+    免费期结束提醒中每张证书的字段，单封提醒和摘要共用
+    """
+    return {
+        'cert_id': cert.id,
+        'domains': cert.domains,
+        'free_expiry_date': cert.free_expiry_date.strftime('%Y-%m-%d'),
+        'expiry_date': cert.expiry_date.strftime('%Y-%m-%d'),
+        'days_until_free_expiry': _days_until(cert.free_expiry_date, now)
+    }
 
 class EmailService:
+    """
+    邮件服务：所有邮件先写入发件箱（email_outbox），不提交事务，
+    由调用方与业务数据一起提交，再由 drain_email_outbox 任务批量投递
+    """
+    
     @staticmethod
-    def send_verification_email(user):
+    def queue(kind: str, to_email: str, subject: str, html_content: str, substitutions: Dict[str, str]) -> EmailOutbox:
         """
-        发送验证邮件
-        """
-        verification_url = f"http://localhost:8080/verify/{user.verification_token}"
+        写入一封待发送邮件
         
-        message = Mail(
-            from_email=current_app.config['EMAIL_FROM'],
-            to_emails=user.email,
-            subject='验证您的账户',
-            html_content=f'''
-            <html>
-                <body>
-                    <h2>欢迎加入Free SSL服务</h2>
-                    <p>您好 {user.username},</p>
-                    <p>感谢您注册我们的服务。请点击下面的链接验证您的账户：</p>
-                    <p><a href="{verification_url}">验证账户</a></p>
-                    <p>如果您没有注册此账户，请忽略此邮件。</p>
-                    <p>此链接将在24小时后过期。</p>
-                    <p>祝好，<br>Free SSL团队</p>
-                </body>
-            </html>
-            '''
-        )
+        Args:
+            kind: 邮件类型
+            to_email: 收件人
+            subject: 主题
+            html_content: 正文，-key- 形式的标签由 substitutions 替换
+            substitutions: 收件人相关的替换值
         
+        Returns:
+            EmailOutbox: 发件箱记录（已加入会话，未提交）
+        """
+        email = EmailOutbox(
+            kind=kind,
+            to_email=to_email,
+            subject=subject,
+            html_content=html_content,
+            next_attempt_at=datetime.now()
+        )
+        email.substitutions = {f'-{key}-': str(value) for key, value in substitutions.items()}
+        db.session.add(email)
+        return email
+    
+    @staticmethod
+    def notify_outbox() -> None:
+        """
+        事务提交后触发一次发件箱投递，broker不可用时由定时任务兜底
+        """
         try:
-            sg = SendGridAPIClient(current_app.config['EMAIL_API_KEY'])
-            response = sg.send(message)
-            return response
+            # 延迟导入以避免与tasks模块循环依赖
+            from tasks import drain_email_outbox
+            drain_email_outbox.delay()
         except Exception as e:
-            print(f"Failed to send verification email: {str(e)}")
-            raise Exception("Failed to send verification email")
+            logger.warning(f"Failed to trigger email outbox drain: {str(e)}")
+    
+    @staticmethod
+    def queue_template(kind: str, user, fields: Dict) -> EmailOutbox:
+        """
+        按用户的语言使用预编译模板写入一封待发送邮件
+        
+        同类邮件共用以替换标签渲染的模板，fields 转义后作为该收件人的替换值。
+        
+        Args:
+            kind: 邮件类型，即模板名称
+            user: 收件人
+            fields: 模板中 recipient 的字段
+        
+        Returns:
+            EmailOutbox: 发件箱记录（已加入会话，未提交）
+        """
+        rendered = get_email_renderer(current_app.config).substitution_template(kind, user.locale)
+        substitutions = {key: str(escape(value)) for key, value in fields.items()}
+        return EmailService.queue(kind, user.email, rendered.subject, rendered.html, substitutions)
+    
+    @staticmethod
+    def send_verification_email(user, verification_token):
+        """
+        发送验证邮件
+        """
+        return EmailService.queue_template('verification', user, {
+            'username': user.username,
+            'verification_token': verification_token
+        })
     
     @staticmethod
     def send_password_reset_email(user, reset_token):
         """
         发送密码重置邮件
         """
-        reset_url = f"http://localhost:8080/reset-password?token={reset_token}"
-        
-        message = Mail(
-            from_email=current_app.config['EMAIL_FROM'],
-            to_emails=user.email,
-            subject='重置您的密码',
-            html_content=f'''
-            <html>
-                <body>
-                    <h2>重置密码</h2>
-                    <p>您好 {user.username},</p>
-                    <p>我们收到了重置您账户密码的请求。</p>
-                    <p>请点击下面的链接重置您的密码：</p>
-                    <p><a href="{reset_url}">重置密码</a></p>
-                    <p>如果您没有请求重置密码，请忽略此邮件。</p>
-                    <p>此链接将在1小时后过期。</p>
-                    <p>祝好，<br>Free SSL团队</p>
-                </body>
-            </html>
-            '''
-        )
-        
-        try:
-            sg = SendGridAPIClient(current_app.config['EMAIL_API_KEY'])
-            response = sg.send(message)
-            return response
-        except Exception as e:
-            print(f"Failed to send password reset email: {str(e)}")
-            raise Exception("Failed to send password reset email")
+        return EmailService.queue_template('password_reset', user, {
+            'username': user.username,
+            'reset_token': reset_token
+        })
     
     @staticmethod
     def send_certificate_expiry_notification(user, cert):
         """
         发送证书到期提醒邮件
         """
-        days_until_expiry = (cert.expiry_date - cert.free_expiry_date).days
-        
-        message = Mail(
-            from_email=current_app.config['EMAIL_FROM'],
-            to_emails=user.email,
-            subject=f'证书即将到期提醒 - {cert.domains}',
-            html_content=f'''
-            <html>
-                <body>
-                    <h2>证书即将到期提醒</h2>
-                    <p>您好 {user.username},</p>
-                    <p>您的SSL证书即将到期：</p>
-                    <ul>
-                        <li><strong>域名：</strong>{cert.domains}</li>
-                        <li><strong>到期日期：</strong>{cert.expiry_date.strftime('%Y-%m-%d')}</li>
-                        <li><strong>剩余天数：</strong>{days_until_expiry}天</li>
-                    </ul>
-                    <p>请注意，免费期将在 {cert.free_expiry_date.strftime('%Y-%m-%d')} 结束。</p>
-                    <p>如需续期，请登录您的账户并选择付费续期选项。</p>
-                    <p><a href="http://localhost:8080/certificates">查看我的证书</a></p>
-                    <p>祝好，<br>Free SSL团队</p>
-                </body>
-            </html>
-            '''
-        )
-        
-        try:
-            sg = SendGridAPIClient(current_app.config['EMAIL_API_KEY'])
-            response = sg.send(message)
-            return response
-        except Exception as e:
-            print(f"Failed to send expiry notification email: {str(e)}")
-            raise Exception("Failed to send expiry notification email")
+        return EmailService.queue_template('certificate_expiry', user, {
+            'username': user.username,
+            **_certificate_expiry_fields(cert, datetime.now())
+        })
     
     @staticmethod
     def send_free_expiry_notification(user, cert):
         """
         发送免费期结束提醒邮件
         """
-        message = Mail(
-            from_email=current_app.config['EMAIL_FROM'],
-            to_emails=user.email,
-            subject=f'免费期即将结束提醒 - {cert.domains}',
-            html_content=f'''
-            <html>
-                <body>
-                    <h2>免费期即将结束提醒</h2>
-                    <p>您好 {user.username},</p>
-                    <p>您的SSL证书免费期即将结束：</p>
-                    <ul>
-                        <li><strong>域名：</strong>{cert.domains}</li>
-                        <li><strong>免费期结束日期：</strong>{cert.free_expiry_date.strftime('%Y-%m-%d')}</li>
-                        <li><strong>证书到期日期：</strong>{cert.expiry_date.strftime('%Y-%m-%d')}</li>
-                    </ul>
-                    <p>免费期结束后，如需继续使用SSL证书，请选择付费续期选项。</p>
-                    <p><a href="http://localhost:8080/certificates/{cert.id}/renew">续期证书</a></p>
-                    <p>祝好，<br>Free SSL团队</p>
-                </body>
-            </html>
-            '''
-        )
+        return EmailService.queue_template('free_expiry', user, {
+            'username': user.username,
+            **_free_expiry_fields(cert, datetime.now())
+        })
+    
+    @staticmethod
+    def queue_digests(kind: str, groups: List[Tuple], row: Callable) -> List[EmailOutbox]:
+        """
+        为每个用户写入一封摘要邮件，按语言分组后用同一个已编译模板批量渲染
+        
+        Args:
+            kind: 邮件类型，即模板名称
+            groups: (用户, 证书列表) 列表
+            row: 将证书转换为摘要表格中一行的函数
         
+        Returns:
+            List[EmailOutbox]: 发件箱记录（已加入会话，未提交）
+        """
+        renderer = get_email_renderer(current_app.config)
+        by_locale = {}
+        for user, certs in groups:
+            by_locale.setdefault(user.locale, []).append((user, certs))
+        
+        emails = []
+        for locale, locale_groups in by_locale.items():
+            recipients = [
+                {'username': user.username, 'certificates': [row(cert) for cert in certs]}
+                for user, certs in locale_groups
+            ]
+            for (user, _), rendered in zip(locale_groups, renderer.render_many(kind, recipients, locale)):
+                emails.append(EmailService.queue(kind, user.email, rendered.subject, rendered.html, {}))
+        return emails
+    
+    @staticmethod
+    def send_certificate_expiry_digests(groups):
+        """
+        发送证书到期提醒摘要，每个用户一封
+        """
+        now = datetime.now()
+        return EmailService.queue_digests(
+            'certificate_expiry_digest', groups, lambda cert: _certificate_expiry_fields(cert, now)
+        )
+    
+    @staticmethod
+    def send_free_expiry_digests(groups):
+        """
+        发送免费期结束提醒摘要，每个用户一封
+        """
+        now = datetime.now()
+        return EmailService.queue_digests('free_expiry_digest', groups, lambda cert: _free_expiry_fields(cert, now))
+
+class SendGridError(Exception):
+    """SendGrid调用失败"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+    
+    @property
+    def retryable(self) -> bool:
+        # 网络错误、限流和服务端错误可以重试，其余4xx说明请求本身有问题
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+class SendGridTransport:
+    """
+    SendGrid v3 mail/send 接口，复用带连接池的 requests.Session
+    
+    base_url 可以指向本地的HTTP替身以便测试。
+    """
+    
+    def __init__(self, api_key: str, base_url: str = 'https://api.sendgrid.com', timeout: float = 30.0,
+                 pool_size: int = 10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount(self.base_url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+    
+    def send(self, payload: dict) -> None:
+        """
+        Raises:
+            SendGridError: 调用失败
+        """
         try:
-            sg = SendGridAPIClient(current_app.config['EMAIL_API_KEY'])
-            response = sg.send(message)
-            return response
-        except Exception as e:
-            print(f"Failed to send free expiry notification email: {str(e)}")
-            raise Exception("Failed to send free expiry notification email")
\ No newline at end of file
+            response = self.session.post(f'{self.base_url}/v3/mail/send', json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise SendGridError(f"SendGrid request failed: {str(e)}")
+        if response.status_code >= 300:
+            raise SendGridError(f"SendGrid returned {response.status_code}: {response.text[:500]}", response.status_code)
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_sendgrid_transport(config) -> SendGridTransport:
+    """
+    进程内共享的SendGrid客户端
+    """
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = SendGridTransport(config['EMAIL_API_KEY'], config['SENDGRID_API_URL'])
+        return _transport
+
+class EmailOutboxDrainer:
+    """
+    发件箱投递
+    
+    领取到期的待发送邮件（把 next_attempt_at 推后一个租约，其他投递进程不会重复领取，
+    进程崩溃后租约到期自动重新投递），按模板分组，每组每次调用最多 batch_size 个收件人。
+    可重试的失败按指数退避重新排期，达到最大次数后标记为失败；
+    SendGrid拒绝整批请求时逐封重发，找出有问题的收件人。
+    """
+    
+    def __init__(self, transport: SendGridTransport, from_email: str, batch_size: int = 500,
+                 max_attempts: int = 5, retry_base_delay: int = 60, claim_seconds: int = 300):
+        self.transport = transport
+        self.from_email = from_email
+        self.batch_size = min(batch_size, 1000)  # SendGrid单次调用最多1000个personalization
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.claim_seconds = claim_seconds
+    
+    @classmethod
+    def from_config(cls, config) -> 'EmailOutboxDrainer':
+        return cls(
+            transport=get_sendgrid_transport(config),
+            from_email=config['EMAIL_FROM'],
+            batch_size=config['EMAIL_BATCH_SIZE'],
+            max_attempts=config['EMAIL_MAX_ATTEMPTS'],
+            retry_base_delay=config['EMAIL_RETRY_BASE_DELAY']
+        )
+    
+    def _claim(self, limit: int) -> List[EmailOutbox]:
+        now = datetime.now()
+        emails = EmailOutbox.query.filter(
+            EmailOutbox.status == EmailOutbox.STATUS_PENDING,
+            EmailOutbox.next_attempt_at <= now
+        ).order_by(EmailOutbox.id).limit(limit).with_for_update(skip_locked=True).all()
+        for email in emails:
+            email.next_attempt_at = now + timedelta(seconds=self.claim_seconds)
+        db.session.commit()
+        return emails
+    
+    def _payload(self, emails: List[EmailOutbox]) -> dict:
+        return {
+            'from': {'email': self.from_email},
+            'subject': emails[0].subject,
+            'content': [{'type': 'text/html', 'value': emails[0].html_content}],
+            'personalizations': [
+                {
+                    'to': [{'email': email.to_email}],
+                    'substitutions': email.substitutions,
+                    'custom_args': {'outbox_id': str(email.id)}
+                }
+                for email in emails
+            ]
+        }
+    
+    def _deliver(self, emails: List[EmailOutbox], counts: Dict[str, int]) -> None:
+        counts['requests'] += 1
+        try:
+            self.transport.send(self._payload(emails))
+        except SendGridError as e:
+            if not e.retryable and len(emails) > 1:
+                for email in emails:
+                    self._deliver([email], counts)
+                return
+            for email in emails:
+                self._fail(email, e, counts)
+            return
+        
+        now = datetime.now()
+        for email in emails:
+            email.status = EmailOutbox.STATUS_SENT
+            email.attempts += 1
+            email.sent_at = now
+            email.last_error = None
+        counts['sent'] += len(emails)
+    
+    def _fail(self, email: EmailOutbox, error: SendGridError, counts: Dict[str, int]) -> None:
+        email.attempts += 1
+        email.last_error = str(error)
+        if not error.retryable or email.attempts >= self.max_attempts:
+            email.status = EmailOutbox.STATUS_FAILED
+            counts['failed'] += 1
+            logger.error(f"Giving up on email {email.id} to {email.to_email}: {str(error)}")
+        else:
+            email.next_attempt_at = datetime.now() + timedelta(
+                seconds=self.retry_base_delay * 2 ** (email.attempts - 1)
+            )
+            counts['retried'] += 1
+    
+    def run(self, limit: int = 2000) -> Dict[str, int]:
+        """
+        投递一轮待发送邮件
+        
+        Args:
+            limit: 本轮最多领取的邮件数
+        
+        Returns:
+            Dict[str, int]: sent、retried、failed、requests 计数
+        """
+        counts = {'sent': 0, 'retried': 0, 'failed': 0, 'requests': 0}
+        emails = self._claim(limit)
+        
+        template_key = attrgetter('subject', 'html_content')
+        for _, group in groupby(sorted(emails, key=template_key), key=template_key):
+            group = list(group)
+            for start in range(0, len(group), self.batch_size):
+                self._deliver(group[start:start + self.batch_size], counts)
+                # 每次调用后提交，进程中断时已投递的邮件不会重发
+                db.session.commit()
+        
+        return counts
\ No newline at end of file
@@ -0,0 +1,141 @@
+import os
+import logging
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateNotFound, select_autoescape
+from markupsafe import Markup
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'email')
+
+class RenderedEmail(NamedTuple):
+    subject: str
+    html: str
+
+class _SubstitutionTags:
+    """
+    替代收件人数据的占位对象，recipient.xxx 渲染为SendGrid替换标签 -xxx-
+    """
+    
+    def __getattr__(self, name: str) -> Markup:
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Markup(f'-{name}-')
+    
+    def __getitem__(self, name: str) -> Markup:
+        return Markup(f'-{name}-')
+
+class EmailTemplateRenderer:
+    """
+    邮件模板渲染
+    
+    模板目录按语言划分：<locale>/<kind>.html，模板继承同语言的 base.html，
+    在 subject 块中定义主题、在 body 块中定义正文；找不到指定语言的模板时使用默认语言。
+    模板中收件人相关的数据统一通过 recipient 访问，其他变量（如 base_url）对所有收件人相同。
+    
+    所有模板在创建时编译一次并常驻内存（关闭自动重载，渲染时不再检查文件），
+    编译结果写入字节码缓存，新进程启动时无需重新解析模板。
+    """
+    
+    def __init__(self, template_dir: str = DEFAULT_TEMPLATE_DIR, cache_dir: Optional[str] = None,
+                 default_locale: str = 'zh', base_url: str = 'http://localhost:8080'):
+        self.default_locale = default_locale
+        self.env = Environment(
+            loader=FileSystemLoader(template_dir),
+            autoescape=select_autoescape(['html']),
+            bytecode_cache=FileSystemBytecodeCache(cache_dir) if cache_dir else FileSystemBytecodeCache(),
+            auto_reload=False,
+            cache_size=-1
+        )
+        self.env.globals['base_url'] = base_url.rstrip('/')
+        self._substitution_templates = {}
+        self.locales = self.compile_all()
+    
+    def compile_all(self) -> List[str]:
+        """
+        编译全部模板
+        
+        Returns:
+            List[str]: 可用的语言
+        """
+        locales = set()
+        for name in self.env.list_templates(extensions=['html']):
+            self.env.get_template(name)
+            if '/' in name:
+                locales.add(name.split('/', 1)[0])
+        if self.default_locale not in locales:
+            raise ValueError(f"No email templates for default locale {self.default_locale}")
+        return sorted(locales)
+    
+    def _template(self, kind: str, locale: Optional[str]):
+        if locale and locale != self.default_locale:
+            try:
+                return self.env.get_template(f'{locale}/{kind}.html')
+            except TemplateNotFound:
+                pass
+        return self.env.get_template(f'{self.default_locale}/{kind}.html')
+    
+    @staticmethod
+    def _render(template, context: Dict) -> RenderedEmail:
+        subject = ''.join(template.blocks['subject'](template.new_context(context)))
+        return RenderedEmail(
+            subject=Markup(subject).unescape().strip(),
+            html=template.render(context)
+        )
+    
+    def render(self, kind: str, recipient, locale: Optional[str] = None, **context) -> RenderedEmail:
+        """
+        渲染一封邮件
+        
+        Args:
+            kind: 邮件类型，即模板名称
+            recipient: 收件人相关的数据（字典或对象）
+            locale: 语言
+            context: 其他模板变量
+        
+        Returns:
+            RenderedEmail: 主题和HTML正文
+        """
+        return self._render(self._template(kind, locale), dict(context, recipient=recipient))
+    
+    def render_many(self, kind: str, recipients: Iterable, locale: Optional[str] = None,
+                    **context) -> List[RenderedEmail]:
+        """
+        使用同一个已编译模板批量渲染，用于摘要等每个收件人内容不同的邮件
+        """
+        template = self._template(kind, locale)
+        return [self._render(template, dict(context, recipient=recipient)) for recipient in recipients]
+    
+    def substitution_template(self, kind: str, locale: Optional[str] = None) -> RenderedEmail:
+        """
+        以SendGrid替换标签代替收件人数据渲染模板，结果按 (类型, 语言) 缓存
+        
+        同类邮件共用渲染结果，每封邮件只需提供替换值，投递时可合并为一次SendGrid调用。
+        模板中对 recipient 的字段只能原样输出，不能参与条件判断或过滤器运算。
+        """
+        key = (kind, locale or self.default_locale)
+        rendered = self._substitution_templates.get(key)
+        if rendered is None:
+            rendered = self.render(kind, _SubstitutionTags(), locale)
+            self._substitution_templates[key] = rendered
+        return rendered
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+def get_email_renderer(config) -> EmailTemplateRenderer:
+    """
+    进程内共享的邮件模板渲染器，首次调用时编译全部模板
+    """
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = EmailTemplateRenderer(
+                template_dir=config['EMAIL_TEMPLATE_DIR'],
+                cache_dir=config['EMAIL_TEMPLATE_CACHE_DIR'] or None,
+                default_locale=config['EMAIL_DEFAULT_LOCALE'],
+                base_url=config['FRONTEND_BASE_URL']
+            )
+            logger.info(f"Compiled email templates for locales: {', '.join(_renderer.locales)}")
+        return _renderer
@@ -0,0 +1,184 @@
+import os
+import json
+import zipfile
+import logging
+from typing import Iterable, Iterator, List, Optional
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+from models.cert_model import Certificate
+
+logger = logging.getLogger(__name__)
+
+class _StreamBuffer:
+    """
+    供 zipfile 写入的只追加缓冲区，由生成器在每次写入后取走数据
+    
+    不提供 seek/tell，zipfile 会按不可寻址的流处理（使用数据描述符），
+    因此整个归档不会在内存中累积。
+    """
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data: bytes) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self) -> None:
+        pass
+    
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+class CertExportService:
+    """
+    证书批量导出，以生成器的形式流式输出
+    
+    支持的格式：
+    - zip: 每个证书一个目录，包含 cert.pem、privkey.pem、chain.pem（及 fullchain.pem）
+    - pkcs12: 每个证书一个 .p12 文件，打包为ZIP
+    - ndjson: 每行一个证书的JSON，包含证书详情及PEM内容
+    """
+    
+    FORMATS = ('zip', 'pkcs12', 'ndjson')
+    MIMETYPES = {
+        'zip': 'application/zip',
+        'pkcs12': 'application/zip',
+        'ndjson': 'application/x-ndjson'
+    }
+    PEM_FILES = ('cert.pem', 'privkey.pem', 'chain.pem', 'fullchain.pem')
+    REQUIRED_FILES = ('cert.pem', 'privkey.pem', 'chain.pem')
+    CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, fmt: str = 'zip', password: Optional[str] = None):
+        """
+        Args:
+            fmt: 导出格式，zip、pkcs12 或 ndjson
+            password: PKCS#12 文件的密码，为空时不加密
+        
+        Raises:
+            ValueError: 导出格式无效
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError("Invalid export format")
+        self.fmt = fmt
+        self.password = password
+    
+    @property
+    def mimetype(self) -> str:
+        return self.MIMETYPES[self.fmt]
+    
+    @property
+    def filename(self) -> str:
+        return 'certificates.ndjson' if self.fmt == 'ndjson' else 'certificates.zip'
+    
+    def _has_files(self, cert: Certificate) -> bool:
+        return all(os.path.isfile(os.path.join(cert.cert_path, name)) for name in self.REQUIRED_FILES)
+    
+    def _read_chunks(self, path: str) -> Iterator[bytes]:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    
+    def _entry_name(self, cert: Certificate) -> str:
+        return f'{cert.primary_domain.replace("*", "_")}-{cert.id}'
+    
+    def stream(self, certs: Iterable[Certificate]) -> Iterator[bytes]:
+        """
+        按所选格式流式输出证书
+        
+        Args:
+            certs: 要导出的证书
+        
+        Returns:
+            Iterator[bytes]: 输出数据块
+        """
+        if self.fmt == 'ndjson':
+            return self._stream_ndjson(certs)
+        return self._stream_zip(certs)
+    
+    def _stream_ndjson(self, certs: Iterable[Certificate]) -> Iterator[bytes]:
+        for cert in certs:
+            line = cert.to_dict()
+            if self._has_files(cert):
+                for key, name in (('certificate', 'cert.pem'), ('private_key', 'privkey.pem'), ('chain', 'chain.pem')):
+                    with open(os.path.join(cert.cert_path, name)) as f:
+                        line[key] = f.read()
+            else:
+                line['error'] = 'Certificate files not found'
+            yield json.dumps(line).encode() + b'\n'
+    
+    def _stream_zip(self, certs: Iterable[Certificate]) -> Iterator[bytes]:
+        buffer = _StreamBuffer()
+        exported = []
+        missing = []
+        failed = []
+        
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for cert in certs:
+                if not self._has_files(cert):
+                    logger.warning(f"Skipping certificate {cert.id} in export: files not found")
+                    missing.append(cert.id)
+                    continue
+                
+                if self.fmt == 'pkcs12':
+                    # 打包失败不应中断已经开始的下载
+                    try:
+                        bundle = self._pkcs12_bundle(cert)
+                    except Exception as e:
+                        logger.error(f"Failed to build PKCS#12 for certificate {cert.id}: {str(e)}")
+                        failed.append(cert.id)
+                        continue
+                    with archive.open(f'{self._entry_name(cert)}.p12', 'w') as entry:
+                        entry.write(bundle)
+                    yield buffer.drain()
+                else:
+                    for name in self.PEM_FILES:
+                        path = os.path.join(cert.cert_path, name)
+                        if not os.path.isfile(path):
+                            continue
+                        with archive.open(f'{self._entry_name(cert)}/{name}', 'w') as entry:
+                            for chunk in self._read_chunks(path):
+                                entry.write(chunk)
+                                yield buffer.drain()
+                        yield buffer.drain()
+                exported.append(cert.id)
+            
+            archive.writestr('manifest.json', json.dumps({'exported': exported, 'missing': missing, 'failed': failed}))
+        
+        yield buffer.drain()
+    
+    def _pkcs12_bundle(self, cert: Certificate) -> bytes:
+        """
+        将证书、私钥和证书链打包为 PKCS#12
+        """
+        with open(os.path.join(cert.cert_path, 'cert.pem'), 'rb') as f:
+            certificate = x509.load_pem_x509_certificate(f.read(), default_backend())
+        with open(os.path.join(cert.cert_path, 'privkey.pem'), 'rb') as f:
+            key = serialization.load_pem_private_key(f.read(), password=None, backend=default_backend())
+        with open(os.path.join(cert.cert_path, 'chain.pem'), 'rb') as f:
+            chain = self._load_pem_chain(f.read())
+        
+        if self.password:
+            encryption = serialization.BestAvailableEncryption(self.password.encode())
+        else:
+            encryption = serialization.NoEncryption()
+        return pkcs12.serialize_key_and_certificates(
+            cert.primary_domain.encode(), key, certificate, chain or None, encryption
+        )
+    
+    @staticmethod
+    def _load_pem_chain(data: bytes) -> List[x509.Certificate]:
+        marker = b'-----END CERTIFICATE-----'
+        chain = []
+        for block in data.split(marker)[:-1]:
+            chain.append(x509.load_pem_x509_certificate(block.strip() + b'\n' + marker + b'\n', default_backend()))
+        return chain
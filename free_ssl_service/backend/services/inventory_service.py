@@ -0,0 +1,135 @@
+import os
+import time
+import logging
+from datetime import timedelta
+from typing import Dict
+from models.cert_model import Certificate, db
+from models.lineage_model import CertificateLineage
+from utils.cert_metadata import get_cert_metadata
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FILES = ('cert.pem', 'privkey.pem', 'chain.pem')
+
+class InventoryReconciler:
+    """
+    证书文件巡检，对比 CERTBOT_CONFIG_DIR 与数据库
+    
+    用 os.scandir 遍历 live 和 archive 目录，目录mtime与上次巡检相同的lineage
+    直接复用已记录的过期时间，不再读取证书文件。巡检结果包括：
+    过期时间与文件不一致的证书（批量修正）、文件缺失的证书、没有对应证书记录的孤儿lineage。
+    """
+    
+    def __init__(self, config_dir: str, batch_size: int = 500, tolerance: timedelta = timedelta(seconds=1)):
+        self.live_dir = os.path.join(config_dir, 'live')
+        self.archive_dir = os.path.join(config_dir, 'archive')
+        self.batch_size = batch_size
+        self.tolerance = tolerance
+    
+    def _scan_dirs(self, path: str) -> Dict[str, int]:
+        """
+        返回目录下各子目录的 mtime（纳秒）
+        """
+        result = {}
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        result[entry.name] = entry.stat().st_mtime_ns
+        except FileNotFoundError:
+            logger.warning(f"Certbot directory not found: {path}")
+        return result
+    
+    def _files_present(self, name: str) -> bool:
+        lineage_dir = os.path.join(self.live_dir, name)
+        return all(os.path.exists(os.path.join(lineage_dir, f)) for f in REQUIRED_FILES)
+    
+    def _refresh_lineages(self, live: Dict[str, int], archive: Dict[str, int], report: dict) -> Dict[str, CertificateLineage]:
+        """
+        更新lineage状态表，只重新解析mtime发生变化的lineage
+        """
+        states = {state.name: state for state in CertificateLineage.query.all()}
+        
+        for name, live_mtime in live.items():
+            mtime_ns = max(live_mtime, archive.get(name, 0))
+            state = states.get(name)
+            if state and state.mtime_ns == mtime_ns:
+                report['unchanged'] += 1
+                continue
+            
+            if not state:
+                state = CertificateLineage(name=name)
+                db.session.add(state)
+                states[name] = state
+            
+            state.mtime_ns = mtime_ns
+            state.files_present = self._files_present(name)
+            try:
+                state.not_after = get_cert_metadata(os.path.join(self.live_dir, name, 'cert.pem')).not_after
+            except (FileNotFoundError, ValueError) as e:
+                logger.warning(f"Failed to read certificate for lineage {name}: {str(e)}")
+                state.not_after = None
+                state.files_present = False
+            report['parsed'] += 1
+        
+        for name in set(states) - set(live):
+            db.session.delete(states.pop(name))
+        
+        return states
+    
+    def run(self) -> dict:
+        """
+        执行一次增量巡检
+        
+        Returns:
+            dict: 巡检报告
+        """
+        started = time.monotonic()
+        report = {
+            'lineages': 0,
+            'parsed': 0,
+            'unchanged': 0,
+            'updated': 0,
+            'missing': [],
+            'orphans': [],
+            'orphan_archives': []
+        }
+        
+        live = self._scan_dirs(self.live_dir)
+        archive = self._scan_dirs(self.archive_dir)
+        report['lineages'] = len(live)
+        report['orphan_archives'] = sorted(set(archive) - set(live))
+        
+        states = self._refresh_lineages(live, archive, report)
+        db.session.commit()
+        
+        # 对比数据库记录与文件状态
+        referenced = set()
+        updates = []
+        rows = db.session.query(
+            Certificate.id, Certificate.cert_path, Certificate.expiry_date
+        ).yield_per(self.batch_size)
+        for cert_id, cert_path, expiry_date in rows:
+            name = os.path.basename(cert_path.rstrip('/'))
+            state = states.get(name) if os.path.dirname(cert_path.rstrip('/')) == self.live_dir else None
+            if state:
+                referenced.add(name)
+            if not state or not state.files_present:
+                report['missing'].append(cert_id)
+                continue
+            
+            if expiry_date is None or abs(expiry_date - state.not_after) > self.tolerance:
+                updates.append({'id': cert_id, 'expiry_date': state.not_after})
+        
+        for start in range(0, len(updates), self.batch_size):
+            db.session.bulk_update_mappings(Certificate, updates[start:start + self.batch_size])
+        db.session.commit()
+        
+        report['updated'] = len(updates)
+        report['orphans'] = sorted(set(live) - referenced)
+        report['elapsed_seconds'] = round(time.monotonic() - started, 3)
+        logger.info(
+            f"Inventory reconciled: {report['lineages']} lineages, {report['parsed']} parsed, "
+            f"{report['updated']} updated, {len(report['missing'])} missing, {len(report['orphans'])} orphans"
+        )
+        return report
@@ -1,9 +1,12 @@
 import secrets
 import string
 from datetime import datetime, timedelta
+from typing import Optional, Tuple
 from flask import current_app
 from models.invitation_model import Invitation, db
 from models.user_model import User
+from services.principal_cache import principal_cache
+from utils.pagination import Page, keyset_page
 
 class InvitationService:
     @staticmethod
@@ -58,30 +61,52 @@ class InvitationService:
         # 给邀请者和被邀请者奖励积分
         reward_points = 100  # 奖励100积分
         
-        inviter = User.query.get(invitation.inviter_id)
-        if inviter:
-            inviter.reward_points += reward_points
-        
-        invitee = User.query.get(invitee_id)
-        if invitee:
-            invitee.reward_points += reward_points
+        # 在数据库端累加，会话中的用户可能是认证缓存挂回的快照，在其上 += 会覆盖并发的积分变化
+        for user_id in (invitation.inviter_id, invitee_id):
+            User.query.filter_by(id=user_id).update(
+                {User.reward_points: User.reward_points + reward_points}, synchronize_session=False
+            )
         
         invitation.reward_points = reward_points
         
         db.session.commit()
+        for user_id in (invitation.inviter_id, invitee_id):
+            principal_cache.invalidate(user_id)
         
         return invitation
     
+    INVITATION_STATUSES = ('pending', 'accepted', 'expired')
+    
     @staticmethod
-    def get_user_invitations(user_id):
+    def get_user_invitations(user_id, cursor: Optional[str] = None, limit: int = 50,
+                             fields: Optional[Tuple[str, ...]] = None, status: Optional[str] = None,
+                             expires_after: Optional[datetime] = None,
+                             expires_before: Optional[datetime] = None) -> Page:
         """
-        获取用户的邀请列表
+        按创建时间倒序分页获取用户的邀请列表
+        
+        只查询 fields 所需的列，状态和过期时间窗口作为SQL条件过滤，
+        按 (created_at, id) 做键集分页，使用 (inviter_id, created_at, id) 索引。
+        
+        Raises:
+            ValueError: 状态或游标无效
         """
-        invitations = Invitation.query.filter_by(inviter_id=user_id).order_by(
-            Invitation.created_at.desc()
-        ).all()
+        query = db.session.query(*Invitation.projected_columns(fields, extra=('id', 'created_at'))).filter(
+            Invitation.inviter_id == user_id
+        )
+        if status:
+            if status not in InvitationService.INVITATION_STATUSES:
+                raise ValueError(
+                    f"Invalid status, expected one of: {', '.join(InvitationService.INVITATION_STATUSES)}"
+                )
+            query = query.filter(Invitation.status == status)
+        if expires_after:
+            query = query.filter(Invitation.expires_at >= expires_after)
+        if expires_before:
+            query = query.filter(Invitation.expires_at < expires_before)
         
-        return [inv.to_dict() for inv in invitations]
+        page = keyset_page(query, Invitation.created_at, Invitation.id, cursor, limit, 'invitations')
+        return Page(Invitation.serialize_many(page.items, fields), page.next_cursor)
     
     @staticmethod
     def get_invitation_stats(user_id):
@@ -0,0 +1,411 @@
+import os
+import re
+import time
+import threading
+import subprocess
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Union
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+import josepy as jose
+import redis
+from acme import challenges, client, crypto_util, errors, messages
+from services.certbot_governor import CertbotGovernor, GovernorTimeout, get_certbot_governor
+from services.dns_provider import DnsProvider, get_dns_provider
+
+logger = logging.getLogger(__name__)
+
+PEM_CERT_RE = re.compile(r'-----BEGIN CERTIFICATE-----.*?-----END CERTIFICATE-----\n?', re.S)
+
+class IssuanceError(Exception):
+    """证书颁发或续期失败"""
+
+class IssueRequest(NamedTuple):
+    """一次证书申请"""
+    cert_name: str  # lineage名称，证书存放在 live/<cert_name>
+    domains: List[str]
+    email: str
+
+class IssuanceBackend(ABC):
+    """
+    证书颁发后端接口
+    
+    所有后端都把证书写到 CERTBOT_CONFIG_DIR/live/<cert_name>/ 下，
+    文件布局与certbot相同，其余代码（PEM缓存、巡检）无需区分后端。
+    配置了 governor 时，对lineage的写操作在集群范围内互斥。
+    supports_batch 为True的后端批量处理时比逐个调用更快，续期引擎会把证书成批交给 renew_many。
+    """
+    
+    name = None
+    supports_batch = False
+    
+    def __init__(self, config_dir: str, governor: Optional[CertbotGovernor] = None):
+        self.config_dir = config_dir
+        self.governor = governor
+    
+    def lineage_path(self, cert_name: str) -> str:
+        return f'{self.config_dir}/live/{cert_name}'
+    
+    @abstractmethod
+    def issue(self, cert_name: str, domains: List[str], email: str) -> str:
+        """
+        颁发证书
+        
+        Returns:
+            str: 证书目录
+        
+        Raises:
+            IssuanceError: 颁发失败
+        """
+    
+    @abstractmethod
+    def renew(self, cert_name: str, domains: List[str], email: str) -> str:
+        """
+        续期证书
+        
+        Returns:
+            str: 证书目录
+        
+        Raises:
+            IssuanceError: 续期失败
+        """
+    
+    def issue_many(self, requests: List[IssueRequest]) -> List[Union[str, Exception]]:
+        """
+        批量颁发证书，返回值与请求一一对应：成功为证书目录，失败为异常对象
+        """
+        return self._each(self.issue, requests)
+    
+    def renew_many(self, requests: List[IssueRequest]) -> List[Union[str, Exception]]:
+        """
+        批量续期证书，返回值与 issue_many 相同
+        """
+        return self._each(self.renew, requests)
+    
+    @staticmethod
+    def _each(operation, requests: List[IssueRequest]) -> List[Union[str, Exception]]:
+        results = []
+        for request in requests:
+            try:
+                results.append(operation(*request))
+            except Exception as e:
+                results.append(e)
+        return results
+
+class CertbotBackend(IssuanceBackend):
+    """
+    调用certbot命令行（默认后端）
+    """
+    
+    name = 'certbot'
+    
+    def __init__(self, certbot_bin: str, config_dir: str, work_dir: str, logs_dir: str, timeout: float = 600.0,
+                 governor: Optional[CertbotGovernor] = None):
+        super().__init__(config_dir, governor)
+        self.certbot_bin = certbot_bin
+        self.work_dir = work_dir
+        self.logs_dir = logs_dir
+        self.timeout = timeout
+    
+    def _dir_args(self) -> List[str]:
+        return [
+            '--config-dir', self.config_dir,
+            '--work-dir', self.work_dir,
+            '--logs-dir', self.logs_dir
+        ]
+    
+    def _run(self, cmd: List[str], cert_name: str) -> None:
+        """
+        执行certbot，配置了 governor 时先获取集群名额和lineage锁
+        """
+        if self.governor is None:
+            return self._exec(cmd)
+        try:
+            with self.governor.slot(cert_name):
+                self._exec(cmd)
+        except GovernorTimeout as e:
+            raise IssuanceError(str(e))
+        except redis.RedisError as e:
+            raise IssuanceError(f"Certbot governor unavailable: {str(e)}")
+    
+    def _exec(self, cmd: List[str]) -> None:
+        try:
+            subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.CalledProcessError as e:
+            logger.error(f"certbot failed: {str(e.stderr)}")
+            raise IssuanceError(f"certbot exited with {e.returncode}: {(e.stderr or '').strip()}")
+        except subprocess.TimeoutExpired:
+            raise IssuanceError(f"certbot timed out after {self.timeout}s")
+    
+    def issue(self, cert_name: str, domains: List[str], email: str) -> str:
+        self._run([
+            self.certbot_bin, 'certonly', '--non-interactive', '--agree-tos',
+            '--email', email,
+            '--dns-route53',
+            '--cert-name', cert_name,
+            '--domains', ','.join(domains)
+        ] + self._dir_args(), cert_name)
+        return self.lineage_path(cert_name)
+    
+    def renew(self, cert_name: str, domains: List[str], email: str) -> str:
+        self._run([
+            self.certbot_bin, 'renew', '--non-interactive',
+            '--cert-name', cert_name
+        ] + self._dir_args(), cert_name)
+        return self.lineage_path(cert_name)
+
+class AcmeBackend(IssuanceBackend):
+    """
+    进程内ACME客户端
+    
+    账户密钥、目录和账户注册保存在进程内复用，不再为每次申请启动certbot。
+    ACME客户端（HTTP会话和nonce）不是线程安全的，每个线程使用自己的客户端，共享同一个账户。
+    issue_many 先为所有订单创建DNS记录，只等待一次DNS传播，再统一应答验证，
+    多个订单在服务端并行验证。
+    """
+    
+    name = 'acme'
+    supports_batch = True
+    
+    def __init__(self, directory_url: str, config_dir: str, dns_provider: DnsProvider,
+                 account_key_path: str = None, verify_ssl: bool = True, key_type: str = 'ec',
+                 propagation_seconds: float = 10.0, timeout: float = 600.0,
+                 governor: Optional[CertbotGovernor] = None):
+        super().__init__(config_dir, governor)
+        self.directory_url = directory_url
+        self.dns_provider = dns_provider
+        self.account_key_path = account_key_path or os.path.join(config_dir, 'accounts', 'inprocess', 'account_key.pem')
+        self.verify_ssl = verify_ssl
+        self.key_type = key_type
+        self.propagation_seconds = propagation_seconds
+        self.timeout = timeout
+        self._account_key = None
+        self._directory = None
+        self._account = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+    
+    def _load_account_key(self) -> jose.JWKRSA:
+        if os.path.exists(self.account_key_path):
+            with open(self.account_key_path, 'rb') as f:
+                key = serialization.load_pem_private_key(f.read(), password=None, backend=default_backend())
+        else:
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+            os.makedirs(os.path.dirname(self.account_key_path), exist_ok=True)
+            fd = os.open(self.account_key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.PKCS8,
+                    serialization.NoEncryption()
+                ))
+        return jose.JWKRSA(key=key)
+    
+    def _get_client(self, email: str) -> client.ClientV2:
+        """
+        获取当前线程的ACME客户端（首次调用时创建），账户只在进程内注册一次
+        """
+        acme_client = getattr(self._local, 'client', None)
+        if acme_client is not None:
+            return acme_client
+        
+        with self._lock:
+            if self._account_key is None:
+                self._account_key = self._load_account_key()
+            net = client.ClientNetwork(self._account_key, user_agent='freessl', verify_ssl=self.verify_ssl)
+            if self._directory is None:
+                self._directory = messages.Directory.from_json(net.get(self.directory_url).json())
+            acme_client = client.ClientV2(self._directory, net=net)
+            if self._account is None:
+                registration = messages.NewRegistration.from_data(email=email, terms_of_service_agreed=True)
+                try:
+                    self._account = acme_client.new_account(registration)
+                except errors.ConflictError as e:
+                    # 账户密钥已注册过，直接复用
+                    self._account = acme_client.query_registration(
+                        messages.RegistrationResource(uri=e.location, body=messages.Registration())
+                    )
+            net.account = self._account
+        
+        self._local.client = acme_client
+        return acme_client
+    
+    def _generate_key_pem(self) -> bytes:
+        if self.key_type == 'rsa':
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+        else:
+            key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+        return key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+    
+    @staticmethod
+    def _dns_challenge(authzr: messages.AuthorizationResource) -> messages.ChallengeBody:
+        for challb in authzr.body.challenges:
+            if isinstance(challb.chall, challenges.DNS01):
+                return challb
+        raise IssuanceError(f"No dns-01 challenge offered for {authzr.body.identifier.value}")
+    
+    def _install(self, cert_name: str, key_pem: bytes, fullchain_pem: str) -> str:
+        if self.governor is None:
+            return self._install_lineage(cert_name, key_pem, fullchain_pem)
+        with self.governor.lineage_lock(cert_name):
+            return self._install_lineage(cert_name, key_pem, fullchain_pem)
+    
+    def _install_lineage(self, cert_name: str, key_pem: bytes, fullchain_pem: str) -> str:
+        """
+        按certbot的布局写入 archive/<name>/xxxN.pem，并原子地切换 live/<name> 下的符号链接
+        """
+        pems = PEM_CERT_RE.findall(fullchain_pem)
+        if not pems:
+            raise IssuanceError("ACME server returned no certificate")
+        contents = {
+            'cert': pems[0],
+            'chain': ''.join(pems[1:]),
+            'fullchain': ''.join(pems),
+            'privkey': key_pem.decode()
+        }
+        
+        archive_dir = os.path.join(self.config_dir, 'archive', cert_name)
+        live_dir = os.path.join(self.config_dir, 'live', cert_name)
+        os.makedirs(archive_dir, exist_ok=True)
+        os.makedirs(live_dir, exist_ok=True)
+        
+        version = 1
+        while os.path.exists(os.path.join(archive_dir, f'cert{version}.pem')):
+            version += 1
+        
+        for kind, content in contents.items():
+            target = os.path.join(archive_dir, f'{kind}{version}.pem')
+            mode = 0o600 if kind == 'privkey' else 0o644
+            fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+        
+        # 证书文件最后切换，读取方看到新cert.pem时私钥和证书链已经就绪
+        for kind in ('privkey', 'chain', 'fullchain', 'cert'):
+            link = os.path.join(live_dir, f'{kind}.pem')
+            tmp_link = link + '.tmp'
+            if os.path.lexists(tmp_link):
+                os.remove(tmp_link)
+            os.symlink(os.path.relpath(os.path.join(archive_dir, f'{kind}{version}.pem'), live_dir), tmp_link)
+            os.replace(tmp_link, link)
+        
+        return live_dir
+    
+    def issue_many(self, requests: List[IssueRequest]) -> List[Union[str, Exception]]:
+        if not requests:
+            return []
+        
+        acme_client = self._get_client(requests[0].email)
+        account_key = acme_client.net.key
+        results = [None] * len(requests)
+        orders = []
+        records = defaultdict(list)
+        
+        # 1. 创建所有订单并收集DNS记录
+        for index, request in enumerate(requests):
+            try:
+                key_pem = self._generate_key_pem()
+                orderr = acme_client.new_order(crypto_util.make_csr(key_pem, request.domains))
+                pending = []
+                for authzr in orderr.authorizations:
+                    if authzr.body.status == messages.STATUS_VALID:
+                        continue
+                    challb = self._dns_challenge(authzr)
+                    record_name = challb.chall.validation_domain_name(authzr.body.identifier.value)
+                    records[record_name].append(challb.chall.validation(account_key))
+                    pending.append(challb)
+                orders.append((index, key_pem, orderr, pending))
+            except Exception as e:
+                logger.error(f"Failed to create ACME order for {request.cert_name}: {str(e)}")
+                results[index] = e
+        
+        # 2. 一次性发布DNS记录，只等待一次传播
+        try:
+            self.dns_provider.add_txt_records(dict(records))
+            if self.propagation_seconds:
+                time.sleep(self.propagation_seconds)
+            
+            # 3. 统一应答验证，然后逐个等待签发
+            for index, _, _, pending in orders:
+                try:
+                    for challb in pending:
+                        acme_client.answer_challenge(challb, challb.response(account_key))
+                except Exception as e:
+                    results[index] = e
+            
+            deadline = datetime.now() + timedelta(seconds=self.timeout)
+            for index, key_pem, orderr, _ in orders:
+                if results[index] is not None:
+                    continue
+                try:
+                    finalized = acme_client.poll_and_finalize(orderr, deadline)
+                    results[index] = self._install(requests[index].cert_name, key_pem, finalized.fullchain_pem)
+                except Exception as e:
+                    logger.error(f"ACME order for {requests[index].cert_name} failed: {str(e)}")
+                    results[index] = e
+        except Exception as e:
+            for index, _, _, _ in orders:
+                if results[index] is None:
+                    results[index] = e
+        finally:
+            self.dns_provider.remove_txt_records(dict(records))
+        
+        return results
+    
+    def issue(self, cert_name: str, domains: List[str], email: str) -> str:
+        result = self.issue_many([IssueRequest(cert_name, domains, email)])[0]
+        if isinstance(result, Exception):
+            raise IssuanceError(f"ACME issuance failed: {str(result)}")
+        return result
+    
+    def renew(self, cert_name: str, domains: List[str], email: str) -> str:
+        # ACME没有续期操作，续期即为相同域名的新订单
+        return self.issue(cert_name, domains, email)
+    
+    def renew_many(self, requests: List[IssueRequest]) -> List[Union[str, Exception]]:
+        return self.issue_many(requests)
+
+_backends: Dict[str, IssuanceBackend] = {}
+_backends_lock = threading.Lock()
+
+def get_issuance_backend(config) -> IssuanceBackend:
+    """
+    根据 ISSUANCE_BACKEND 配置获取颁发后端（进程内单例，ACME账户状态在请求间复用）
+    """
+    name = config['ISSUANCE_BACKEND']
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name == 'certbot':
+                backend = CertbotBackend(
+                    certbot_bin=config['CERTBOT_BIN'],
+                    config_dir=config['CERTBOT_CONFIG_DIR'],
+                    work_dir=config['CERTBOT_WORK_DIR'],
+                    logs_dir=config['CERTBOT_LOG_DIR'],
+                    timeout=config['CERTBOT_TIMEOUT'],
+                    governor=get_certbot_governor(config)
+                )
+            elif name == 'acme':
+                backend = AcmeBackend(
+                    directory_url=config['ACME_DIRECTORY_URL'],
+                    config_dir=config['CERTBOT_CONFIG_DIR'],
+                    dns_provider=get_dns_provider(config),
+                    account_key_path=config['ACME_ACCOUNT_KEY_PATH'] or None,
+                    verify_ssl=config['ACME_VERIFY_SSL'],
+                    key_type=config['ACME_KEY_TYPE'],
+                    propagation_seconds=config['ACME_DNS_PROPAGATION_SECONDS'],
+                    timeout=config['CERTBOT_TIMEOUT'],
+                    governor=get_certbot_governor(config)
+                )
+            else:
+                raise ValueError(f"Unknown issuance backend: {name}")
+            _backends[name] = backend
+        return backend
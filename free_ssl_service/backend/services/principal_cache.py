@@ -0,0 +1,149 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from sqlalchemy.orm import make_transient_to_detached
+from models.user_model import User, db
+
+logger = logging.getLogger(__name__)
+
+class PrincipalCache:
+    """
+    已认证用户缓存，供 AuthService.get_current_user 使用，避免每个请求都查询 users 表
+    
+    两级缓存，均按用户ID作为键：
+    - L1：进程内LRU，TTL很短（默认5秒），承接同一进程内的连续请求
+    - L2：flask_caching 的Redis缓存，TTL较短（默认60秒），在所有进程间共享
+    缓存的是用户的列值（不含密码哈希），命中时以 merge(load=False) 挂回当前会话，
+    不发出SELECT；访问未缓存的列或关联关系时按需加载。
+    挂回的列值可能落后于数据库最多一个TTL，不能作为读-改-写的基础：
+    积分等计数列用 User.reward_points + n 这样的表达式在数据库端更新。
+    
+    缓存的是用户本身的数据而不是某个令牌的会话状态，因此键不包含令牌的jti，
+    invalidate() 一次就能让该用户所有令牌看到最新数据。
+    
+    修改用户数据（验证、重置密码、积分变化等）后需在提交后调用 invalidate()：
+    L2和本进程的L1立即失效，其他进程的L1最多在 local_ttl 秒后失效。
+    """
+    
+    EXCLUDED_COLUMNS = ('password_hash',)
+    
+    def __init__(self, ttl: int = 60, local_ttl: float = 5.0, local_max: int = 1024):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_max = local_max
+        self._cache = None
+        self._local = OrderedDict()  # user_id -> (到期时间, 列值)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def init_app(self, app, cache) -> None:
+        self._cache = cache
+        self.ttl = app.config.get('PRINCIPAL_CACHE_TTL', self.ttl)
+        self.local_ttl = app.config.get('PRINCIPAL_CACHE_LOCAL_TTL', self.local_ttl)
+    
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f'principal:{user_id}'
+    
+    def _get_local(self, user_id: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._local[user_id]
+                return None
+            self._local.move_to_end(user_id)
+            return entry[1]
+    
+    def _set_local(self, user_id: int, data: Dict) -> None:
+        with self._lock:
+            self._local[user_id] = (time.monotonic() + self.local_ttl, data)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.local_max:
+                self._local.popitem(last=False)
+    
+    def _get_shared(self, user_id: int) -> Optional[Dict]:
+        if self._cache is None:
+            return None
+        # 缓存不可用时退回数据库查询
+        try:
+            return self._cache.get(self._key(user_id))
+        except Exception as e:
+            logger.warning(f"Principal cache read failed for user {user_id}: {str(e)}")
+            return None
+    
+    def _set_shared(self, user_id: int, data: Dict) -> None:
+        if self._cache is None:
+            return
+        try:
+            self._cache.set(self._key(user_id), data, timeout=self.ttl)
+        except Exception as e:
+            logger.warning(f"Principal cache write failed for user {user_id}: {str(e)}")
+    
+    def _snapshot(self, user: User) -> Dict:
+        return {
+            prop.key: getattr(user, prop.key)
+            for prop in User.__mapper__.column_attrs
+            if prop.key not in self.EXCLUDED_COLUMNS
+        }
+    
+    @staticmethod
+    def _attach(data: Dict) -> User:
+        user = User(**data)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    
+    def get(self, user_id) -> Optional[User]:
+        """
+        获取用户
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            Optional[User]: 挂在当前会话上的用户对象，用户不存在时返回None
+        """
+        user_id = int(user_id)
+        data = self._get_local(user_id)
+        if data is None:
+            data = self._get_shared(user_id)
+            if data is not None:
+                self._set_local(user_id, data)
+        if data is not None:
+            self.hits += 1
+            return self._attach(data)
+        
+        self.misses += 1
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+        data = self._snapshot(user)
+        self._set_shared(user_id, data)
+        self._set_local(user_id, data)
+        return user
+    
+    def invalidate(self, user_id) -> None:
+        """
+        使用户的缓存失效，在修改用户数据的事务提交后调用
+        """
+        user_id = int(user_id)
+        with self._lock:
+            self._local.pop(user_id, None)
+        if self._cache is None:
+            return
+        try:
+            self._cache.delete(self._key(user_id))
+        except Exception as e:
+            logger.error(f"Principal cache invalidation failed for user {user_id}: {str(e)}")
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._local.clear()
+            self.hits = 0
+            self.misses = 0
+
+principal_cache = PrincipalCache()
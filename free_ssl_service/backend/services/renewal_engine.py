@@ -0,0 +1,341 @@
+import time
+import uuid
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+import redis
+from utils.cert_metadata import get_cert_metadata
+from services.certbot_governor import CertbotGovernor
+from services.issuance_backend import IssuanceBackend, IssueRequest, get_issuance_backend
+
+logger = logging.getLogger(__name__)
+
+# 常见的多级公共后缀，用于近似计算注册域名（Let's Encrypt按注册域名限流）
+MULTI_LABEL_SUFFIXES = {
+    'com.cn', 'net.cn', 'org.cn', 'gov.cn', 'edu.cn',
+    'com.hk', 'com.tw', 'co.jp', 'co.kr',
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk',
+    'com.au', 'net.au', 'org.au', 'co.nz', 'com.br', 'com.sg'
+}
+
+def registered_domain(domain: str) -> str:
+    """
+    计算域名的注册域名（eTLD+1的近似值）
+    
+    Args:
+        domain: 域名，可以是通配符域名
+    
+    Returns:
+        str: 注册域名，例如 www.example.co.uk -> example.co.uk
+    """
+    labels = domain.strip().lower().rstrip('.').split('.')
+    if labels and labels[0] == '*':
+        labels = labels[1:]
+    if len(labels) > 2 and '.'.join(labels[-2:]) in MULTI_LABEL_SUFFIXES:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+class RenewalItem(NamedTuple):
+    """待续期证书"""
+    cert_id: int
+    cert_name: str  # certbot lineage名称（主域名）
+    email: str  # 客户的联系邮箱，同时作为按客户限流的键
+    domains: List[str]
+    cert_path: str
+
+class RenewalResult(NamedTuple):
+    """单个证书的续期结果"""
+    cert_id: int
+    success: bool
+    attempts: int
+    duration: float
+    expiry_date: Optional[datetime] = None
+    error: Optional[str] = None
+
+class RenewalReport:
+    """
+    续期批次汇总：吞吐量、失败列表和重试计划
+    """
+    
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.finished_at = None
+        self.succeeded = []
+        self.failed = []
+        self.retries = []  # (cert_id, attempt, scheduled_at)
+    
+    @property
+    def total(self) -> int:
+        return len(self.succeeded) + len(self.failed)
+    
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at or datetime.now()
+        return (end - self.started_at).total_seconds()
+    
+    @property
+    def throughput(self) -> float:
+        """每分钟完成的证书数"""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.total * 60.0 / self.elapsed
+    
+    def to_dict(self) -> dict:
+        return {
+            'total': self.total,
+            'succeeded': len(self.succeeded),
+            'failed': len(self.failed),
+            'elapsed_seconds': round(self.elapsed, 3),
+            'throughput_per_minute': round(self.throughput, 2),
+            'failures': [
+                {'cert_id': r.cert_id, 'attempts': r.attempts, 'error': r.error}
+                for r in self.failed
+            ],
+            'retries': [
+                {'cert_id': cert_id, 'attempt': attempt, 'scheduled_at': scheduled_at.isoformat()}
+                for cert_id, attempt, scheduled_at in self.retries
+            ]
+        }
+    
+    def summary(self) -> str:
+        return (
+            f"Auto-renewed {len(self.succeeded)} certificates, {len(self.failed)} failed, "
+            f"{len(self.retries)} retries in {self.elapsed:.1f}s "
+            f"({self.throughput:.1f}/min)"
+        )
+
+class RenewalEngine:
+    """
+    并发续期引擎
+    
+    使用有界线程池并行调用颁发后端续期，同时限制每个客户（证书联系邮箱）和每个注册域名的并发数。
+    certbot和进程内ACME客户端都用同一个ACME账户申请，CA对账户的限制由总并发数（max_workers、
+    CERTBOT_CLUSTER_LIMIT）控制，这里的客户上限只是避免单个客户占满续期名额。
+    失败的证书按指数退避重新排队，直到达到最大尝试次数。
+    后端支持批量处理时（进程内ACME客户端），同一轮调度的证书成批交给 renew_many，
+    每批只等待一次DNS传播。
+    配置了 governor 时，客户和注册域名的上限通过Redis在所有分片和worker之间共享（名额带租约，
+    持有者崩溃后自动释放）；Redis不可用时退回本次运行内的计数。
+    一批续期可能先等待certbot名额再逐个执行，名额的租约按 acquire_timeout + 单个租约 × batch_size
+    计算，并在批次执行期间每隔三分之一租约续期一次。
+    工作线程只执行子进程和读取证书文件，数据库写入由调用方在主线程完成。
+    """
+    
+    def __init__(self, backend: IssuanceBackend, max_workers: int = 8, per_customer_limit: int = 4,
+                 per_domain_limit: int = 2, max_attempts: int = 3, retry_base_delay: float = 30.0,
+                 batch_size: int = 20, governor: Optional[CertbotGovernor] = None):
+        self.backend = backend
+        self.max_workers = max_workers
+        self.per_customer_limit = per_customer_limit
+        self.per_domain_limit = per_domain_limit
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.batch_size = batch_size if backend is not None and backend.supports_batch else 1
+        self.governor = governor
+        self.poll_interval = governor.poll_interval if governor is not None else 0.5
+        self.limit_lease_seconds = (
+            governor.acquire_timeout + governor.lease_seconds * self.batch_size if governor is not None else 0.0
+        )
+        self._cluster_unavailable = False
+    
+    @classmethod
+    def from_config(cls, config) -> 'RenewalEngine':
+        backend = get_issuance_backend(config)
+        return cls(
+            backend=backend,
+            max_workers=config['RENEWAL_MAX_WORKERS'],
+            per_customer_limit=config['RENEWAL_PER_CUSTOMER_LIMIT'],
+            per_domain_limit=config['RENEWAL_PER_DOMAIN_LIMIT'],
+            max_attempts=config['RENEWAL_MAX_ATTEMPTS'],
+            retry_base_delay=config['RENEWAL_RETRY_BASE_DELAY'],
+            batch_size=config['RENEWAL_BATCH_SIZE'],
+            governor=backend.governor
+        )
+    
+    def renew_one(self, item: RenewalItem) -> Optional[datetime]:
+        """
+        续期单个证书（在工作线程中执行）
+        
+        Returns:
+            Optional[datetime]: 续期后的过期时间
+        
+        Raises:
+            IssuanceError: 续期失败或超时
+        """
+        self.backend.renew(item.cert_name, item.domains, item.email)
+        return get_cert_metadata(f'{item.cert_path}/cert.pem').not_after
+    
+    def renew_batch(self, items: List[RenewalItem]) -> List[Union[datetime, Exception]]:
+        """
+        续期一批证书（在工作线程中执行），返回值与证书一一对应：成功为过期时间，失败为异常对象
+        """
+        if self.batch_size == 1:
+            try:
+                return [self.renew_one(items[0])]
+            except Exception as e:
+                return [e]
+        
+        results = self.backend.renew_many([IssueRequest(item.cert_name, item.domains, item.email) for item in items])
+        outcomes = []
+        for item, result in zip(items, results):
+            if isinstance(result, Exception):
+                outcomes.append(result)
+                continue
+            try:
+                outcomes.append(get_cert_metadata(f'{item.cert_path}/cert.pem').not_after)
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+    
+    def _rate_keys(self, item: RenewalItem) -> set:
+        return {registered_domain(domain) for domain in item.domains}
+    
+    def _has_capacity(self, item: RenewalItem, customer_active: Counter, domain_active: Counter) -> bool:
+        if customer_active[item.email] >= self.per_customer_limit:
+            return False
+        return all(domain_active[key] < self.per_domain_limit for key in self._rate_keys(item))
+    
+    def _cluster_limits(self, item: RenewalItem) -> Dict[str, int]:
+        limits = {f'renewal:customer:{item.email}': self.per_customer_limit}
+        for key in self._rate_keys(item):
+            limits[f'renewal:domain:{key}'] = self.per_domain_limit
+        return limits
+    
+    def _acquire_cluster(self, item: RenewalItem, token: str) -> bool:
+        if self.governor is None or self._cluster_unavailable:
+            return True
+        try:
+            return self.governor.try_acquire_limits(self._cluster_limits(item), token, self.limit_lease_seconds)
+        except redis.RedisError as e:
+            # 只停止占用新名额，已占用的名额仍通过 governor 续期和释放
+            logger.warning(f"Renewal governor unavailable, falling back to local limits: {str(e)}")
+            self._cluster_unavailable = True
+            return True
+    
+    def _refresh_cluster(self, running: dict) -> None:
+        for batch in running.values():
+            for item, _, token in batch:
+                try:
+                    self.governor.refresh_limits(self._cluster_limits(item), token, self.limit_lease_seconds)
+                except redis.RedisError as e:
+                    logger.warning(f"Failed to refresh renewal limits for cert {item.cert_id}: {str(e)}")
+    
+    def _release_cluster(self, item: RenewalItem, token: str) -> None:
+        if self.governor is not None:
+            self.governor.release_limits(self._cluster_limits(item), token)
+    
+    def _retry_delay(self, attempt: int) -> float:
+        return self.retry_base_delay * (2 ** (attempt - 1))
+    
+    def run(self, items: List[RenewalItem],
+            on_result: Optional[Callable[[RenewalResult], None]] = None) -> RenewalReport:
+        """
+        并发续期一批证书
+        
+        Args:
+            items: 待续期证书列表
+            on_result: 每个证书得到最终结果时在主线程中回调
+        
+        Returns:
+            RenewalReport: 续期汇总报告
+        """
+        report = RenewalReport()
+        pending = [(0.0, 1, item) for item in items]  # (ready_at, attempt, item)
+        running = {}
+        customer_active = Counter()
+        domain_active = Counter()
+        refresh_interval = self.limit_lease_seconds / 3 if self.governor is not None else None
+        refreshed_at = time.monotonic()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                now = time.monotonic()
+                index = 0
+                batch = []
+                cluster_blocked = False
+                while index < len(pending) and len(running) < self.max_workers:
+                    ready_at, attempt, item = pending[index]
+                    if ready_at > now or not self._has_capacity(item, customer_active, domain_active):
+                        index += 1
+                        continue
+                    token = uuid.uuid4().hex
+                    if not self._acquire_cluster(item, token):
+                        # 其他分片正在续期同一客户或注册域名的证书
+                        cluster_blocked = True
+                        index += 1
+                        continue
+                    pending.pop(index)
+                    customer_active[item.email] += 1
+                    for key in self._rate_keys(item):
+                        domain_active[key] += 1
+                    batch.append((item, attempt, token))
+                    if len(batch) >= self.batch_size:
+                        running[pool.submit(self._timed, [entry[0] for entry in batch])] = batch
+                        batch = []
+                if batch:
+                    running[pool.submit(self._timed, [entry[0] for entry in batch])] = batch
+                
+                # 被本地并发上限挡住的证书在有任务完成时重新调度，只需为退避中的重试设置超时；
+                # 被其他分片占满的名额不会因本地任务完成而释放，按 poll_interval 重试
+                waiting = [entry[0] for entry in pending if entry[0] > now]
+                timeout = min(waiting) - now if waiting else None
+                if cluster_blocked:
+                    timeout = self.poll_interval if timeout is None else min(timeout, self.poll_interval)
+                
+                if not running:
+                    # 只剩等待重试或等待集群名额的证书
+                    time.sleep(timeout or 0.0)
+                    continue
+                
+                if refresh_interval:
+                    # 执行中的批次按时续租集群名额，租约不会在续期过程中到期
+                    next_refresh = max(0.0, refreshed_at + refresh_interval - now)
+                    timeout = next_refresh if timeout is None else min(timeout, next_refresh)
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                if refresh_interval and time.monotonic() - refreshed_at >= refresh_interval:
+                    self._refresh_cluster({future: batch for future, batch in running.items() if future not in done})
+                    refreshed_at = time.monotonic()
+                
+                for future in done:
+                    batch = running.pop(future)
+                    try:
+                        outcomes, duration = future.result()
+                    except Exception as e:
+                        outcomes, duration = [e] * len(batch), 0.0
+                    
+                    for (item, attempt, token), outcome in zip(batch, outcomes):
+                        customer_active[item.email] -= 1
+                        for key in self._rate_keys(item):
+                            domain_active[key] -= 1
+                        self._release_cluster(item, token)
+                        
+                        if isinstance(outcome, Exception):
+                            if attempt < self.max_attempts:
+                                delay = self._retry_delay(attempt)
+                                report.retries.append(
+                                    (item.cert_id, attempt + 1, datetime.now() + timedelta(seconds=delay))
+                                )
+                                pending.append((time.monotonic() + delay, attempt + 1, item))
+                                logger.warning(f"Renewal of cert {item.cert_id} failed (attempt {attempt}), "
+                                               f"retrying in {delay:.0f}s: {str(outcome)}")
+                                continue
+                            result = RenewalResult(item.cert_id, False, attempt, 0.0, error=str(outcome))
+                            report.failed.append(result)
+                            logger.error(f"Failed to auto-renew cert {item.cert_id}: {str(outcome)}")
+                        else:
+                            result = RenewalResult(item.cert_id, True, attempt, duration, outcome)
+                            report.succeeded.append(result)
+                        
+                        if on_result:
+                            on_result(result)
+        
+        report.finished_at = datetime.now()
+        logger.info(report.summary())
+        return report
+    
+    def _timed(self, items: List[RenewalItem]):
+        started = time.monotonic()
+        outcomes = self.renew_batch(items)
+        return outcomes, time.monotonic() - started
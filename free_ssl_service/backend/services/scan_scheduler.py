@@ -0,0 +1,177 @@
+import logging
+from datetime import datetime
+from typing import Callable, Iterator, List
+from models.cert_model import Certificate, db
+from models.scan_cursor_model import ScanCursor
+
+logger = logging.getLogger(__name__)
+
+def keyset_chunks(query, sort_column, chunk_size: int = 100) -> Iterator[List[Certificate]]:
+    """
+    按 (sort_column, Certificate.id) 做键集分页，逐批返回证书
+    
+    每批只用上一批最后一行的键值作为起点，不使用OFFSET；处理函数修改了
+    过滤条件涉及的列（例如标记已提醒）也不会跳过或重复行，内存占用与总行数无关。
+    
+    Args:
+        query: 候选证书查询
+        sort_column: 排序列，例如 Certificate.expiry_date
+        chunk_size: 每批行数
+    
+    Returns:
+        Iterator[List[Certificate]]: 证书批次
+    """
+    last = None
+    while True:
+        chunk_query = query
+        if last is not None:
+            last_value, last_id = last
+            chunk_query = chunk_query.filter(db.or_(
+                sort_column > last_value,
+                db.and_(sort_column == last_value, Certificate.id > last_id)
+            ))
+        certs = chunk_query.order_by(sort_column, Certificate.id).limit(chunk_size).all()
+        if not certs:
+            return
+        # 先记下键值，处理函数提交后对象会过期
+        last = (getattr(certs[-1], sort_column.key), certs[-1].id)
+        yield certs
+        if len(certs) < chunk_size:
+            return
+
+def user_chunks(query, sort_column, chunk_size: int = 100) -> Iterator[List[Certificate]]:
+    """
+    按用户分页，每批包含若干个用户的全部候选证书，供摘要提醒为每个用户只生成一封邮件
+    
+    先在SQL中按 user_id 分组统计候选证书数，按 user_id 做键集分页，
+    累计证书数不超过 chunk_size 的用户为一批（证书数超过 chunk_size 的用户单独成批），
+    再按 (user_id, sort_column, id) 加载这些用户的证书。
+    
+    Args:
+        query: 候选证书查询
+        sort_column: 用户内的排序列，例如 Certificate.expiry_date
+        chunk_size: 每批证书数
+    
+    Returns:
+        Iterator[List[Certificate]]: 按用户排列的证书批次
+    """
+    last_user_id = None
+    while True:
+        counts_query = query.with_entities(Certificate.user_id, db.func.count(Certificate.id))
+        if last_user_id is not None:
+            counts_query = counts_query.filter(Certificate.user_id > last_user_id)
+        counts = counts_query.group_by(Certificate.user_id).order_by(Certificate.user_id).limit(chunk_size).all()
+        if not counts:
+            return
+        
+        user_ids = []
+        total = 0
+        for user_id, count in counts:
+            if user_ids and total + count > chunk_size:
+                break
+            user_ids.append(user_id)
+            total += count
+        last_user_id = user_ids[-1]
+        
+        certs = query.filter(Certificate.user_id.in_(user_ids)).order_by(
+            Certificate.user_id, sort_column, Certificate.id
+        ).all()
+        if certs:
+            yield certs
+        if len(counts) < chunk_size and len(user_ids) == len(counts):
+            return
+
+class BucketedScanScheduler:
+    """
+    分桶扫描调度器
+    
+    按证书ID取模把证书划分为固定数量的分桶，每个节拍只处理游标所在的分桶，
+    全天轮转一遍。游标（分桶号和桶内已处理的最大ID）在每个批次后持久化，
+    进程崩溃后从上次的位置继续，而不是从头开始；每个节拍的处理量有上限。
+    运行期间持有游标的租约（每个批次后续租），节拍抖动或上一个节拍未结束时，
+    同一扫描不会有两个运行同时处理相同的证书。
+    
+    摘要提醒需要同一用户的证书在同一批次中，此时按用户ID分桶，
+    游标记录桶内已处理的最大用户ID，每个用户每轮只收到一封摘要邮件。
+    """
+    
+    def __init__(self, buckets: int = 96, tick_limit: int = 500, chunk_size: int = 100,
+                 lease_seconds: int = 1800):
+        self.buckets = buckets
+        self.tick_limit = tick_limit
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+    
+    @classmethod
+    def from_config(cls, config) -> 'BucketedScanScheduler':
+        return cls(
+            buckets=config['SCAN_BUCKETS'],
+            tick_limit=config['SCAN_TICK_LIMIT'],
+            chunk_size=config['SCAN_CHUNK_SIZE'],
+            lease_seconds=config['SCAN_LEASE_SECONDS']
+        )
+    
+    def run(self, name: str, query_factory: Callable, processor: Callable,
+            by_user: bool = False, sort_column=Certificate.id) -> str:
+        """
+        处理游标所在分桶的下一段证书
+        
+        Args:
+            name: 扫描名称，同时作为游标名称
+            query_factory: 接收当前时间、返回候选证书查询的函数
+            processor: 处理一批证书的函数
+            by_user: 是否按用户ID分桶，每批包含若干用户的全部证书（摘要提醒）；
+                用户的证书不拆分，节拍处理量可能超出上限一个用户的证书数
+            sort_column: 按用户分桶时用户内的排序列
+        
+        Returns:
+            str: 处理结果摘要
+        """
+        cursor = ScanCursor.acquire(name, self.lease_seconds)
+        if cursor is None:
+            logger.info(f"Scan {name} is already running, skipping this tick")
+            return f"Scan {name} is already running"
+        
+        key_column = Certificate.user_id if by_user else Certificate.id
+        try:
+            cursor.bucket %= self.buckets
+            bucket = cursor.bucket
+            processed = 0
+            
+            while processed < self.tick_limit:
+                limit = min(self.chunk_size, self.tick_limit - processed)
+                query = query_factory(datetime.now()).filter(
+                    key_column % self.buckets == cursor.bucket,
+                    key_column > cursor.last_id
+                )
+                if by_user:
+                    certs = next(user_chunks(query, sort_column, limit), [])
+                    finished = not certs
+                else:
+                    certs = query.order_by(Certificate.id).limit(limit).all()
+                    finished = len(certs) < limit
+                
+                if certs:
+                    last_key = getattr(certs[-1], key_column.key)
+                    processor(certs)
+                    processed += len(certs)
+                    cursor.last_id = last_key
+                
+                if finished:
+                    # 分桶处理完毕，下个节拍进入下一个分桶
+                    cursor.advance(self.buckets)
+                
+                # 每个批次后保存游标并续租，崩溃后从这里继续
+                if not cursor.save(self.lease_seconds):
+                    logger.warning(f"Scan {name} lost its cursor lease, stopping")
+                    break
+                if finished:
+                    break
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            cursor.release()
+        
+        logger.info(f"Scan {name}: processed {processed} certificates in bucket {bucket}/{self.buckets}")
+        return f"Scanned {processed} certificates for {name} in bucket {bucket}"
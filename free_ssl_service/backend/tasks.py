@@ -1,104 +1,470 @@
+from celery import chord
 from celery.schedules import crontab
+from flask import current_app
 from app import celery
 from models.cert_model import Certificate, db
-from models.user_model import User
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager
+from models.notification_model import Notification
+from models.auth_token_model import AuthToken
 from services.email_service import EmailService
 from datetime import datetime, timedelta
+from itertools import groupby
+from operator import attrgetter
+from typing import Callable, NamedTuple
+import random
 
 @celery.task
-def check_certificate_expiry():
+def issue_certificate(job_id):
     """
-    检查证书到期情况并发送提醒邮件
+    异步执行证书颁发任务
+    """
+    from services.cert_service import CertService
+    job = CertService().run_issue_job(job_id)
+    if not job:
+        return f"Issuance job {job_id} skipped"
+    return f"Issuance job {job_id} {job.status}"
+
+def expiring_certs_query(now):
+    """
+    30天内到期且尚未提醒的证书（同一查询中联表加载用户）
     """
-    now = datetime.now()
-    
-    # 检查30天内到期的证书
     thirty_days_from_now = now + timedelta(days=30)
-    expiring_certs = Certificate.query.filter(
+    return Certificate.query.join(Certificate.user).options(
+        contains_eager(Certificate.user)
+    ).filter(
         Certificate.expiry_date <= thirty_days_from_now,
         Certificate.expiry_date > now,
         Certificate.notified_free_expiry == False
-    ).all()
+    )
+
+def queue_notifications(certs, send_single, send_digests):
+    """
+    将一批证书的提醒写入发件箱（不提交）
+    
+    EXPIRY_NOTIFICATION_MODE 为 digest 时按用户合并，每个用户一封列出其全部证书的摘要邮件，
+    否则每个证书一封。
+    
+    Returns:
+        list: 已写入提醒的证书
+    """
+    if current_app.config['EXPIRY_NOTIFICATION_MODE'] != 'digest':
+        queued = []
+        for cert in certs:
+            try:
+                send_single(cert.user, cert)
+                queued.append(cert)
+            except Exception as e:
+                print(f"Failed to send notification for cert {cert.id}: {str(e)}")
+        return queued
+    
+    user_key = attrgetter('user_id')
+    groups = [list(group) for _, group in groupby(sorted(certs, key=user_key), key=user_key)]
+    try:
+        send_digests([(group[0].user, group) for group in groups])
+    except Exception as e:
+        # 丢弃已写入发件箱的部分摘要，调用方不会标记这些证书，下次扫描重试
+        print(f"Failed to send notification digests: {str(e)}")
+        db.session.rollback()
+        return []
+    return list(certs)
+
+def notify_expiring_certs(expiring_certs):
+    """
+    将一批证书的到期提醒写入发件箱，并用一条UPDATE标记已提醒（同一事务提交）
     
-    for cert in expiring_certs:
+    Returns:
+        int: 已提醒的证书数
+    """
+    notified_ids = [
+        cert.id for cert in queue_notifications(
+            expiring_certs,
+            EmailService.send_certificate_expiry_notification,
+            EmailService.send_certificate_expiry_digests
+        )
+    ]
+    
+    if notified_ids:
         try:
-            user = User.query.get(cert.user_id)
-            if user:
-                EmailService.send_certificate_expiry_notification(user, cert)
-                cert.notified_free_expiry = True
-                db.session.commit()
+            Certificate.query.filter(Certificate.id.in_(notified_ids)).update(
+                {Certificate.notified_free_expiry: True}, synchronize_session=False
+            )
+            db.session.commit()
         except Exception as e:
-            print(f"Failed to send expiry notification for cert {cert.id}: {str(e)}")
+            print(f"Failed to mark certificates as notified: {str(e)}")
             db.session.rollback()
-    
-    return f"Checked {len(expiring_certs)} expiring certificates"
+            return 0
+    return len(notified_ids)
 
 @celery.task
-def check_free_expiry():
+def check_certificate_expiry():
     """
-    检查免费期即将结束的证书并发送提醒
+    检查证书到期情况并发送提醒邮件
     """
-    now = datetime.now()
+    return dispatch_scan('certificate_expiry')
+
+def free_expiry_threshold_expr(now, thresholds):
+    """
+    证书当前所处的最小提醒阈值（天），例如阈值为30/7/1时，剩余5天的证书处于7天阈值
+    """
+    thresholds = sorted(thresholds)
+    return db.case(
+        [(Certificate.free_expiry_date <= now + timedelta(days=days), days) for days in thresholds[:-1]],
+        else_=thresholds[-1]
+    )
+
+def free_expiry_certs_query(now):
+    """
+    免费期进入新提醒阈值的证书（同一查询中联表加载用户）
     
-    # 检查免费期在30天内结束的证书
-    thirty_days_from_now = now + timedelta(days=30)
-    free_expiry_certs = Certificate.query.filter(
-        Certificate.free_expiry_date <= thirty_days_from_now,
+    对提醒台账做反连接：证书在当前阈值或更小的阈值上已有提醒记录时跳过，
+    每个阈值只提醒一次，已提醒过的证书不会在每次扫描中被重新选中。
+    """
+    thresholds = current_app.config['FREE_EXPIRY_THRESHOLDS']
+    threshold = free_expiry_threshold_expr(now, thresholds)
+    already_notified = db.session.query(Notification.id).filter(
+        Notification.certificate_id == Certificate.id,
+        Notification.kind == Notification.KIND_FREE_EXPIRY,
+        Notification.threshold <= threshold
+    ).exists()
+    return Certificate.query.join(Certificate.user).options(
+        contains_eager(Certificate.user),
+        db.with_expression(Certificate.free_expiry_threshold, threshold)
+    ).filter(
+        Certificate.free_expiry_date <= now + timedelta(days=max(thresholds)),
         Certificate.free_expiry_date > now,
-        Certificate.payment_status == 'free'
-    ).all()
+        Certificate.payment_status == 'free',
+        ~already_notified
+    ).execution_options(populate_existing=True)
+
+def notify_free_expiry_certs(free_expiry_certs):
+    """
+    将免费期结束提醒写入发件箱，并在同一事务中写入提醒台账
     
-    for cert in free_expiry_certs:
-        try:
-            user = User.query.get(cert.user_id)
-            if user:
-                EmailService.send_free_expiry_notification(user, cert)
-        except Exception as e:
-            print(f"Failed to send free expiry notification for cert {cert.id}: {str(e)}")
+    Returns:
+        int: 已提醒的证书数
+    """
+    now = datetime.now()
+    ledger = [
+        {
+            'certificate_id': cert.id,
+            'kind': Notification.KIND_FREE_EXPIRY,
+            'threshold': cert.free_expiry_threshold,
+            'created_at': now
+        }
+        for cert in queue_notifications(
+            free_expiry_certs,
+            EmailService.send_free_expiry_notification,
+            EmailService.send_free_expiry_digests
+        )
+    ]
     
-    return f"Checked {len(free_expiry_certs)} certificates with free expiry"
+    try:
+        db.session.bulk_insert_mappings(Notification, ledger)
+        db.session.commit()
+    except Exception as e:
+        # 唯一约束冲突说明其他任务已经提醒过，整批回滚，邮件不会重复发送
+        print(f"Failed to queue free expiry notifications: {str(e)}")
+        db.session.rollback()
+        return 0
+    return len(ledger)
 
 @celery.task
-def auto_renew_certificates():
+def check_free_expiry():
     """
-    自动续期已付费的证书
+    检查免费期即将结束的证书并发送提醒
+    """
+    return dispatch_scan('free_expiry')
+
+def renewal_certs_query(now):
+    """
+    30天内到期的已付费证书
     """
-    now = datetime.now()
-    
-    # 查找30天内到期的已付费证书
     thirty_days_from_now = now + timedelta(days=30)
-    paid_certs_to_renew = Certificate.query.filter(
+    return Certificate.query.filter(
         Certificate.expiry_date <= thirty_days_from_now,
         Certificate.expiry_date > now,
         Certificate.payment_status == 'paid'
-    ).all()
+    )
+
+def renew_certs(paid_certs_to_renew):
+    """
+    并发续期证书并批量写回过期时间
+    
+    Returns:
+        RenewalReport: 续期汇总报告
+    """
+    from services.renewal_engine import RenewalEngine, RenewalItem
+    from utils.pem_cache import pem_cache
     
-    renewed_count = 0
+    items = []
+    cert_paths = {}
     for cert in paid_certs_to_renew:
-        try:
-            from services.cert_service import CertService
-            user = User.query.get(cert.user_id)
-            if user:
-                cert_service = CertService()
-                cert_service.renew_cert(cert.id, user)
-                renewed_count += 1
-        except Exception as e:
-            print(f"Failed to auto-renew cert {cert.id}: {str(e)}")
+        items.append(RenewalItem(
+            cert_id=cert.id,
+            cert_name=cert.primary_domain,
+            email=cert.email,
+            domains=cert.domain_list,
+            cert_path=cert.cert_path
+        ))
+        cert_paths[cert.id] = cert.cert_path
+    
+    engine = RenewalEngine.from_config(current_app.config)
+    report = engine.run(items)
     
-    return f"Auto-renewed {renewed_count} certificates"
+    # 续期结果在主线程中批量写回数据库
+    updates = [
+        {'id': result.cert_id, 'expiry_date': result.expiry_date}
+        for result in report.succeeded
+    ]
+    try:
+        for start in range(0, len(updates), 500):
+            db.session.bulk_update_mappings(Certificate, updates[start:start + 500])
+        db.session.commit()
+    except Exception as e:
+        print(f"Failed to save renewed certificates: {str(e)}")
+        db.session.rollback()
+    
+    for result in report.succeeded:
+        pem_cache.invalidate(cert_paths[result.cert_id])
+    
+    for failure in report.failed:
+        print(f"Failed to auto-renew cert {failure.cert_id}: {failure.error}")
+    
+    return report
+
+@celery.task
+def auto_renew_certificates():
+    """
+    自动续期已付费的证书
+    """
+    return dispatch_scan('auto_renew')
+
+@celery.task
+def drain_email_outbox():
+    """
+    批量投递发件箱中的待发送邮件
+    """
+    from services.email_service import EmailOutboxDrainer
+    
+    drainer = EmailOutboxDrainer.from_config(current_app.config)
+    counts = drainer.run(current_app.config['EMAIL_DRAIN_LIMIT'])
+    return (
+        f"Sent {counts['sent']} emails in {counts['requests']} requests, "
+        f"{counts['retried']} retried, {counts['failed']} failed"
+    )
+
+@celery.task
+def reconcile_certificate_inventory():
+    """
+    增量巡检证书文件与数据库的一致性
+    """
+    from services.inventory_service import InventoryReconciler
+    
+    reconciler = InventoryReconciler(current_app.config['CERTBOT_CONFIG_DIR'])
+    report = reconciler.run()
+    
+    for cert_id in report['missing']:
+        print(f"Certificate files missing for cert {cert_id}")
+    for name in report['orphans']:
+        print(f"Orphaned certbot lineage without certificate record: {name}")
+    
+    return (
+        f"Reconciled {report['lineages']} lineages: {report['updated']} updated, "
+        f"{len(report['missing'])} missing, {len(report['orphans'])} orphans"
+    )
+
+@celery.task
+def purge_expired_auth_tokens():
+    """
+    清理过期或已使用超过保留期的一次性令牌
+    """
+    before = datetime.now() - timedelta(days=current_app.config['AUTH_TOKEN_RETENTION_DAYS'])
+    deleted = AuthToken.purge(before, current_app.config['AUTH_TOKEN_PURGE_BATCH'])
+    return f"Purged {deleted} expired auth tokens"
+
+class Scan(NamedTuple):
+    """一类扫描的候选查询、批处理函数、分片内的分页排序列、结果摘要模板，以及是否为提醒类扫描（支持摘要模式）"""
+    query_factory: Callable
+    processor: Callable
+    sort_column: object
+    summary: str
+    notification: bool = False
+
+SCANS = {
+    'certificate_expiry': Scan(
+        expiring_certs_query, notify_expiring_certs, Certificate.expiry_date,
+        'Checked {checked} expiring certificates, notified {succeeded}', notification=True
+    ),
+    'free_expiry': Scan(
+        free_expiry_certs_query, notify_free_expiry_certs, Certificate.free_expiry_date,
+        'Checked {checked} certificates with free expiry, notified {succeeded}', notification=True
+    ),
+    'auto_renew': Scan(
+        renewal_certs_query, renew_certs, Certificate.expiry_date,
+        'Auto-renewed {succeeded} certificates, {failed} failed, {retries} retries in {elapsed:.1f}s '
+        '({throughput:.1f}/min)'
+    ),
+}
+
+SHARD_COUNTERS = ('checked', 'succeeded', 'failed', 'retries')
+
+def is_digest_scan(name):
+    return SCANS[name].notification and current_app.config['EXPIRY_NOTIFICATION_MODE'] == 'digest'
+
+def dispatch_scan(name):
+    """
+    协调任务：把证书ID范围切分为 SCAN_SHARD_SIZE 大小的分片，以chord分发到各worker，
+    各分片的计数由 aggregate_scan_results 汇总为扫描摘要
+    
+    摘要模式下的提醒类扫描按用户ID切分，同一用户的证书由同一个分片处理，每个用户只收到一封邮件。
+    """
+    started_at = datetime.now().isoformat()
+    digest = is_digest_scan(name)
+    id_column = Certificate.user_id if digest else Certificate.id
+    low, high = db.session.query(func.min(id_column), func.max(id_column)).one()
+    if low is None:
+        return aggregate_scan_results([], name, started_at)
+    
+    shard_size = current_app.config['SCAN_SHARD_SIZE']
+    shard_task = digest_shard if digest else scan_shard
+    # 所有分片使用同一个时间点判断到期，结果与单任务扫描一致
+    shards = [
+        shard_task.s(name, start, min(start + shard_size, high + 1), started_at)
+        for start in range(low, high + 1, shard_size)
+    ]
+    chord(shards)(aggregate_scan_results.s(name, started_at))
+    return f"Dispatched {len(shards)} shards for {name}"
+
+def process_chunks(scan, chunks):
+    """
+    依次处理证书批次并累计计数
+    """
+    counts = dict.fromkeys(SHARD_COUNTERS, 0)
+    for certs in chunks:
+        counts['checked'] += len(certs)
+        outcome = scan.processor(certs)
+        if isinstance(outcome, int):
+            counts['succeeded'] += outcome
+            counts['failed'] += len(certs) - outcome
+        else:
+            # renew_certs 返回续期报告
+            counts['succeeded'] += len(outcome.succeeded)
+            counts['failed'] += len(outcome.failed)
+            counts['retries'] += len(outcome.retries)
+    return counts
+
+@celery.task
+def scan_shard(name, low_id, high_id, now):
+    """
+    处理 [low_id, high_id) 范围内的候选证书，按排序列做键集分页
+    
+    Returns:
+        dict: checked、succeeded、failed、retries 计数
+    """
+    from services.scan_scheduler import keyset_chunks
+    
+    scan = SCANS[name]
+    query = scan.query_factory(datetime.fromisoformat(now)).filter(
+        Certificate.id >= low_id,
+        Certificate.id < high_id
+    )
+    return process_chunks(scan, keyset_chunks(query, scan.sort_column, current_app.config['SCAN_CHUNK_SIZE']))
+
+@celery.task
+def digest_shard(name, low_user_id, high_user_id, now):
+    """
+    摘要模式：处理 [low_user_id, high_user_id) 范围内用户的候选证书，
+    每批包含若干用户的全部证书，由处理函数为每个用户写入一封摘要邮件
+    
+    Returns:
+        dict: checked、succeeded、failed、retries 计数
+    """
+    from services.scan_scheduler import user_chunks
+    
+    scan = SCANS[name]
+    query = scan.query_factory(datetime.fromisoformat(now)).filter(
+        Certificate.user_id >= low_user_id,
+        Certificate.user_id < high_user_id
+    )
+    return process_chunks(scan, user_chunks(query, scan.sort_column, current_app.config['SCAN_CHUNK_SIZE']))
+
+@celery.task
+def aggregate_scan_results(results, name, started_at):
+    """
+    chord回调：汇总各分片的计数
+    """
+    totals = {key: sum(result.get(key, 0) for result in results) for key in SHARD_COUNTERS}
+    elapsed = (datetime.now() - datetime.fromisoformat(started_at)).total_seconds()
+    processed = totals['succeeded'] + totals['failed']
+    return SCANS[name].summary.format(
+        elapsed=elapsed,
+        throughput=processed / elapsed * 60 if elapsed > 0 else 0.0,
+        **totals
+    )
+
+@celery.task
+def scan_tick():
+    """
+    分桶调度的节拍任务：为每类扫描派发一个带随机抖动的分桶任务，
+    避免所有扫描在同一时刻打到数据库、SendGrid和ACME
+    """
+    jitter = current_app.config['SCAN_TICK_JITTER']
+    for name in SCANS:
+        scan_bucket.apply_async(args=[name], countdown=random.uniform(0, jitter))
+    return f"Dispatched {len(SCANS)} bucket scans"
+
+@celery.task
+def scan_bucket(name):
+    """
+    从持久化游标处继续处理一个分桶
+    """
+    from services.scan_scheduler import BucketedScanScheduler
+    
+    scan = SCANS[name]
+    scheduler = BucketedScanScheduler.from_config(current_app.config)
+    # 摘要模式按用户分桶，与 digest_shard 一样保证每个用户每轮只收到一封邮件
+    return scheduler.run(
+        name, scan.query_factory, scan.processor,
+        by_user=is_digest_scan(name), sort_column=scan.sort_column
+    )
 
 # Celery Beat schedule configuration
-celery.conf.beat_schedule = {
-    'check-certificate-expiry-daily': {
-        'task': 'tasks.check_certificate_expiry',
-        'schedule': crontab(hour=9, minute=0),  # 每天上午9点执行
-    },
-    'check-free-expiry-daily': {
-        'task': 'tasks.check_free_expiry',
-        'schedule': crontab(hour=9, minute=30),  # 每天上午9:30执行
-    },
-    'auto-renew-certificates-daily': {
-        'task': 'tasks.auto_renew_certificates',
-        'schedule': crontab(hour=10, minute=0),  # 每天上午10点执行
-    },
+if celery.conf.get('SCAN_SCHEDULE_MODE') == 'bucketed':
+    # 按证书ID分桶，全天每个节拍处理一个分桶
+    celery.conf.beat_schedule = {
+        'scan-tick': {
+            'task': 'tasks.scan_tick',
+            'schedule': timedelta(minutes=celery.conf['SCAN_TICK_MINUTES']),
+        },
+    }
+else:
+    celery.conf.beat_schedule = {
+        'check-certificate-expiry-daily': {
+            'task': 'tasks.check_certificate_expiry',
+            'schedule': crontab(hour=9, minute=0),  # 每天上午9点执行
+        },
+        'check-free-expiry-daily': {
+            'task': 'tasks.check_free_expiry',
+            'schedule': crontab(hour=9, minute=30),  # 每天上午9:30执行
+        },
+        'auto-renew-certificates-daily': {
+            'task': 'tasks.auto_renew_certificates',
+            'schedule': crontab(hour=10, minute=0),  # 每天上午10点执行
+        },
+    }
+
+celery.conf.beat_schedule['drain-email-outbox'] = {
+    'task': 'tasks.drain_email_outbox',
+    'schedule': timedelta(minutes=1),  # 兜底投递，注册等场景提交后会立即触发
+}
+
+celery.conf.beat_schedule['reconcile-certificate-inventory-hourly'] = {
+    'task': 'tasks.reconcile_certificate_inventory',
+    'schedule': crontab(minute=45),  # 每小时第45分钟执行
+}
+
+celery.conf.beat_schedule['purge-expired-auth-tokens-daily'] = {
+    'task': 'tasks.purge_expired_auth_tokens',
+    'schedule': crontab(hour=3, minute=15),  # 每天凌晨3:15执行
 }
\ No newline at end of file
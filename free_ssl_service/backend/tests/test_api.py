@@ -1,9 +1,11 @@
 import pytest
 from app import app, db
 from models.user_model import User
-from models.cert_model import Certificate
+from models.cert_model import Certificate, domain_set_hash
+from models.cert_job_model import CertificateJob
 from services.auth_service import AuthService
 from services.cert_service import CertService
+from datetime import datetime, timedelta
 
 @pytest.fixture
 def client():
@@ -30,6 +32,9 @@ def auth_headers(client):
         'email': 'test@example.com',
         'password': 'Test1234'
     })
+    # 跳过邮箱验证，未验证的用户不能登录
+    User.query.filter_by(username='testuser').update({'verified': True})
+    db.session.commit()
     
     # 登录获取token
     response = client.post('/api/auth/login', json={
@@ -150,6 +155,8 @@ def test_login_user(client):
         'email': 'login@example.com',
         'password': 'Test1234'
     })
+    User.query.filter_by(username='loginuser').update({'verified': True})
+    db.session.commit()
     
     # 登录
     response = client.post('/api/auth/login', json={
@@ -208,18 +215,192 @@ def test_get_current_user_invalid_token(client):
     
     assert response.status_code == 401
 
-def test_create_certificate(client, auth_headers):
+def test_create_certificate(client, auth_headers, monkeypatch):
     """
     测试创建证书
     """
+    import tasks
+    
+    queued = []
+    monkeypatch.setattr(tasks.issue_certificate, 'delay', queued.append)
     response = client.post('/api/certs', 
         json={'domains': 'example.com'},
         headers=auth_headers
     )
     
-    # 注意：实际测试时需要mock certbot命令
-    # 这里只测试API端点是否正确
-    assert response.status_code in [201, 400]  # 400可能是因为certbot未安装
+    # 证书颁发异步执行，接口立即返回任务，Location 指向任务查询地址
+    assert response.status_code == 202
+    data = response.json
+    assert data['status'] == 'pending'
+    assert data['domains'] == 'example.com'
+    assert data['cert_id'] is None
+    assert response.headers['Location'].endswith(f"/api/certs/jobs/{data['id']}")
+    assert queued == [data['id']]
+    
+    job = CertificateJob.query.get(data['id'])
+    assert job.user_id == User.query.filter_by(username='testuser').one().id
+    
+    response = client.get(response.headers['Location'], headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['id'] == data['id']
+
+def test_create_certificate_reuses_existing(client, auth_headers):
+    """
+    测试相同域名集合已有有效证书时直接返回
+    """
+    user = User.query.filter_by(username='testuser').first()
+    cert = Certificate(
+        user_id=user.id,
+        email=user.email,
+        expiry_date=datetime.now() + timedelta(days=80),
+        free_expiry_date=datetime.now() + timedelta(days=90),
+        cert_path='/etc/letsencrypt/live/example.com'
+    )
+    cert.set_domains('example.com,www.example.com')
+    db.session.add(cert)
+    db.session.commit()
+    
+    # 顺序和大小写不同的相同域名集合
+    response = client.post('/api/certs',
+        json={'domains': 'WWW.example.com, example.com.'},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json['id'] == cert.id
+    
+    # 即将过期的证书不复用
+    cert.expiry_date = datetime.now() + timedelta(days=5)
+    db.session.commit()
+    assert CertService().find_reusable_cert('example.com,www.example.com', user) is None
+
+def test_submit_issue_job_coalesces_inflight(client, auth_headers):
+    """
+    测试进行中的相同申请合并为同一个任务
+    """
+    user = User.query.filter_by(username='testuser').first()
+    job = CertificateJob(
+        user_id=user.id,
+        domains='example.com',
+        email=user.email,
+        inflight_key=f"{user.id}:{domain_set_hash('example.com')}"
+    )
+    db.session.add(job)
+    db.session.commit()
+    
+    assert CertService().submit_issue_job('Example.com', user.email, user).id == job.id
+    assert CertificateJob.query.count() == 1
+
+def test_submit_issue_job_dispatch_failure(client, auth_headers, monkeypatch):
+    """
+    测试任务投递失败时任务结束并释放 inflight_key，相同的申请可以立即重试
+    """
+    import tasks
+    
+    def broker_down(job_id):
+        raise ConnectionError('broker unavailable')
+    
+    monkeypatch.setattr(tasks.issue_certificate, 'delay', broker_down)
+    user = User.query.filter_by(username='testuser').first()
+    
+    with pytest.raises(Exception, match='Failed to queue issuance job'):
+        CertService().submit_issue_job('example.com', user.email, user)
+    job = CertificateJob.query.one()
+    assert job.status == CertificateJob.STATUS_FAILED
+    assert job.inflight_key is None
+    
+    monkeypatch.setattr(tasks.issue_certificate, 'delay', lambda job_id: None)
+    assert CertService().submit_issue_job('example.com', user.email, user).id != job.id
+
+def test_inflight_job_lease(client, auth_headers):
+    """
+    测试执行中的任务按开始时间的租约判断是否失效，而不是按创建时间
+    """
+    user = User.query.filter_by(username='testuser').first()
+    key = f"{user.id}:{domain_set_hash('example.com')}"
+    job = CertificateJob(
+        user_id=user.id,
+        domains='example.com',
+        email=user.email,
+        inflight_key=key,
+        status=CertificateJob.STATUS_RUNNING,
+        created_at=datetime.now() - timedelta(hours=2),
+        started_at=datetime.now() - timedelta(seconds=60)
+    )
+    db.session.add(job)
+    db.session.commit()
+    
+    # 排队很久但刚开始执行的任务仍然有效
+    assert CertService()._get_inflight_job(key).id == job.id
+    
+    job.started_at = datetime.now() - timedelta(seconds=app.config['ISSUE_JOB_LEASE_SECONDS'] + 1)
+    db.session.commit()
+    assert CertService()._get_inflight_job(key) is None
+    assert job.status == CertificateJob.STATUS_FAILED
+    assert job.inflight_key is None
+
+def test_run_issue_job_claims_once(client, auth_headers, monkeypatch):
+    """
+    测试颁发任务只被领取一次，租约失效后的结果不会覆盖任务状态
+    """
+    user = User.query.filter_by(username='testuser').first()
+    job = CertificateJob(
+        user_id=user.id,
+        domains='example.com',
+        email=user.email,
+        inflight_key=f"{user.id}:{domain_set_hash('example.com')}"
+    )
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+    
+    service = CertService()
+    
+    def slow_issue(domains, email, owner):
+        # 执行期间任务因超出租约被释放
+        CertificateJob.query.filter_by(id=job_id).update({
+            CertificateJob.status: CertificateJob.STATUS_FAILED,
+            CertificateJob.error: 'Issuance job timed out',
+            CertificateJob.inflight_key: None
+        }, synchronize_session=False)
+        db.session.commit()
+        return Certificate.query.first()
+    
+    monkeypatch.setattr(service, 'issue_cert', slow_issue)
+    job = service.run_issue_job(job_id)
+    assert job.status == CertificateJob.STATUS_FAILED
+    assert job.error == 'Issuance job timed out'
+    
+    # 已经结束的任务再次投递不会重复执行
+    assert service.run_issue_job(job_id) is None
+
+def test_governor_metrics_admin_only(client, auth_headers):
+    """
+    测试证书颁发调度指标只对管理员开放
+    """
+    response = client.get('/api/certs/governor', headers=auth_headers)
+    assert response.status_code == 403
+    
+    app.config['ADMIN_EMAILS'] = ['test@example.com']
+    try:
+        response = client.get('/api/certs/governor', headers=auth_headers)
+        assert response.status_code != 403
+    finally:
+        app.config['ADMIN_EMAILS'] = []
+
+def test_domain_set_hash():
+    """
+    测试域名集合哈希与顺序、大小写和IDN写法无关
+    """
+    assert domain_set_hash('b.com,a.com') == domain_set_hash('A.com, b.com., a.com')
+    assert domain_set_hash('bücher.example') == domain_set_hash('xn--bcher-kva.example')
+    assert domain_set_hash('a.com') != domain_set_hash('a.com,b.com')
+
+def test_get_issue_job_not_found(client, auth_headers):
+    """
+    测试查询颁发任务 - 任务不存在
+    """
+    response = client.get('/api/certs/jobs/nonexistent', headers=auth_headers)
+    assert response.status_code == 404
 
 def test_create_certificate_invalid_data(client, auth_headers):
     """
@@ -242,6 +423,91 @@ def test_list_certificates(client, auth_headers):
     data = response.json
     assert isinstance(data, list)
 
+def test_list_certificates_by_domain(client, auth_headers):
+    """
+    测试按域名查找证书
+    """
+    user = User.query.filter_by(username='testuser').first()
+    for domains in ['example.com,www.example.com', '*.example.com', 'api.other.com']:
+        cert = Certificate(
+            user_id=user.id,
+            email=user.email,
+            expiry_date=datetime.now() + timedelta(days=90),
+            free_expiry_date=datetime.now() + timedelta(days=90),
+            cert_path='/etc/letsencrypt/live/example.com'
+        )
+        cert.set_domains(domains)
+        db.session.add(cert)
+    db.session.commit()
+    
+    # 精确匹配和上一级通配符都能覆盖该主机名
+    response = client.get('/api/certs?domain=www.example.com', headers=auth_headers)
+    assert response.status_code == 200
+    assert sorted(cert['domains'] for cert in response.json) == ['*.example.com', 'example.com,www.example.com']
+    
+    # 后缀匹配返回该域名下的所有证书
+    response = client.get('/api/certs?domain=example.com&match=suffix', headers=auth_headers)
+    assert len(response.json) == 2
+    
+    # 域名中的 % 和 _ 按字面匹配，不作为通配符
+    for domain in ['_xample.com', '%25.com']:
+        response = client.get(f'/api/certs?domain={domain}&match=suffix', headers=auth_headers)
+        assert response.json == []
+    
+    # 域名查找同样分页，并可与其他筛选条件组合
+    response = client.get('/api/certs?domain=example.com&match=suffix&limit=1', headers=auth_headers)
+    assert len(response.json) == 1
+    assert response.headers.get('X-Next-Cursor')
+    response = client.get('/api/certs?domain=example.com&match=suffix&status=expired', headers=auth_headers)
+    assert response.json == []
+    
+    response = client.get('/api/certs?domain=example.com&match=invalid', headers=auth_headers)
+    assert response.status_code == 400
+
+def test_list_certificates_paginated(client, auth_headers):
+    """
+    测试证书列表的游标分页、字段投影和筛选
+    """
+    user = User.query.filter_by(username='testuser').first()
+    now = datetime.now()
+    for i in range(5):
+        cert = Certificate(
+            user_id=user.id,
+            email=user.email,
+            issue_date=now - timedelta(days=i // 2),  # 颁发时间有重复，由 id 决定顺序
+            expiry_date=now + timedelta(days=30 if i % 2 else -1),
+            free_expiry_date=now + timedelta(days=30),
+            cert_path=f'/etc/letsencrypt/live/site{i}.com',
+            payment_status='paid' if i == 4 else 'free'
+        )
+        cert.set_domains(f'site{i}.com')
+        db.session.add(cert)
+    db.session.commit()
+    
+    ids, cursor = [], None
+    while True:
+        response = client.get('/api/certs', query_string={'limit': 2, 'fields': 'id,status', 'cursor': cursor},
+                              headers=auth_headers)
+        assert response.status_code == 200
+        assert all(set(cert) == {'id', 'status'} for cert in response.json)
+        ids += [cert['id'] for cert in response.json]
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+        assert 'cursor=' in response.headers['Link']
+    expected = [cert.id for cert in Certificate.query.order_by(Certificate.issue_date.desc(), Certificate.id.desc())]
+    assert ids == expected
+    
+    response = client.get('/api/certs?status=active', headers=auth_headers)
+    assert len(response.json) == 2 and all(cert['status'] == 'active' for cert in response.json)
+    response = client.get('/api/certs?payment_status=paid', headers=auth_headers)
+    assert [cert['payment_status'] for cert in response.json] == ['paid']
+    response = client.get('/api/certs', query_string={'expires_before': now.isoformat()}, headers=auth_headers)
+    assert len(response.json) == 3
+    
+    for query in ['cursor=invalid', 'fields=password', 'limit=0', 'status=revoked', 'expires_after=tomorrow']:
+        assert client.get(f'/api/certs?{query}', headers=auth_headers).status_code == 400
+
 def test_unauthorized_access(client):
     """
     测试未授权访问
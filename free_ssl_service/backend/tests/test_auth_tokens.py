@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import pytest
+from app import app, db
+from models.user_model import User
+from models.auth_token_model import AuthToken, hash_token
+from models.email_outbox_model import EmailOutbox
+
+@pytest.fixture
+def client():
+    """
+    创建测试数据库及一个已注册的用户
+    """
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    
+    with app.app_context():
+        db.create_all()
+        user = User(username='testuser', email='test@example.com')
+        user.set_password('Test1234')
+        db.session.add(user)
+        db.session.commit()
+        yield app.test_client()
+        db.drop_all()
+
+def last_token(key):
+    email = EmailOutbox.query.order_by(EmailOutbox.id.desc()).first()
+    return email.substitutions[f'-{key}-']
+
+def test_register_verify_token_single_use(client):
+    """
+    测试验证令牌只保存哈希，且只能使用一次
+    """
+    client.post('/api/auth/register', json={
+        'username': 'newuser',
+        'email': 'new@example.com',
+        'password': 'Test1234'
+    })
+    token = last_token('verification_token')
+    
+    stored = AuthToken.query.filter_by(purpose=AuthToken.PURPOSE_VERIFY_EMAIL).one()
+    assert stored.token_hash == hash_token(token)
+    
+    assert client.get(f'/api/auth/verify/{token}').status_code == 200
+    assert User.query.filter_by(username='newuser').one().verified
+    assert client.get(f'/api/auth/verify/{token}').status_code == 400
+
+def test_expired_and_superseded_tokens_rejected(client):
+    """
+    测试过期令牌和被新令牌替代的令牌无法使用
+    """
+    expired = AuthToken.issue(1, AuthToken.PURPOSE_RESET_PASSWORD, timedelta(seconds=-1))
+    db.session.commit()
+    assert AuthToken.consume(expired, AuthToken.PURPOSE_RESET_PASSWORD) is None
+    
+    first = AuthToken.issue(1, AuthToken.PURPOSE_RESET_PASSWORD, timedelta(hours=1))
+    second = AuthToken.issue(1, AuthToken.PURPOSE_RESET_PASSWORD, timedelta(hours=1))
+    db.session.commit()
+    assert AuthToken.consume(first, AuthToken.PURPOSE_RESET_PASSWORD) is None
+    assert AuthToken.consume(second, AuthToken.PURPOSE_VERIFY_EMAIL) is None
+    assert AuthToken.consume(second, AuthToken.PURPOSE_RESET_PASSWORD) == 1
+
+def test_reset_password_keeps_token_on_invalid_password(client):
+    """
+    测试新密码不合法时令牌仍然可用，重置成功后失效
+    """
+    client.post('/api/auth/forgot-password', json={'email': 'test@example.com'})
+    token = last_token('reset_token')
+    
+    response = client.post('/api/auth/reset-password', json={'token': token, 'new_password': 'short'})
+    assert response.status_code == 400
+    
+    response = client.post('/api/auth/reset-password', json={'token': token, 'new_password': 'NewPass123'})
+    assert response.status_code == 200
+    assert User.query.get(1).check_password('NewPass123')
+    
+    response = client.post('/api/auth/reset-password', json={'token': token, 'new_password': 'Other1234'})
+    assert response.status_code == 400
+
+def test_purge_removes_only_stale_tokens(client):
+    """
+    测试清理任务分批删除过期和已使用的令牌，保留有效令牌
+    """
+    for _ in range(5):
+        AuthToken.issue(1, AuthToken.PURPOSE_VERIFY_EMAIL, timedelta(days=-10))
+    AuthToken.issue(1, AuthToken.PURPOSE_RESET_PASSWORD, timedelta(hours=1))
+    db.session.commit()
+    
+    deleted = AuthToken.purge(datetime.now() - timedelta(days=7), batch_size=2)
+    
+    assert deleted == 5
+    assert AuthToken.query.one().purpose == AuthToken.PURPOSE_RESET_PASSWORD
@@ -0,0 +1,103 @@
+import os
+import pytest
+from datetime import datetime, timedelta
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from utils.cert_metadata import CertMetadataCache, parse_cert_pem
+
+def make_cert_pem(domains, days=90, key=None):
+    """
+    生成自签名测试证书
+    """
+    key = key or ec.generate_private_key(ec.SECP256R1(), default_backend())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, domains[0])])
+    now = datetime.utcnow().replace(microsecond=0)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + timedelta(days=days))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(d) for d in domains]), critical=False)
+        .sign(key, hashes.SHA256(), default_backend())
+    )
+    return cert.public_bytes(serialization.Encoding.PEM)
+
+@pytest.fixture
+def cert_file(tmp_path):
+    path = tmp_path / 'cert.pem'
+    path.write_bytes(make_cert_pem(['example.com', 'www.example.com']))
+    return str(path)
+
+def test_parse_cert_pem():
+    """
+    测试一次性解析证书元数据
+    """
+    metadata = parse_cert_pem(make_cert_pem(['example.com', 'www.example.com'], days=30))
+    
+    assert metadata.sans == ['example.com', 'www.example.com']
+    assert metadata.issuer == 'CN=example.com'
+    assert metadata.key_type == 'EC-secp256r1'
+    assert len(metadata.fingerprint) == 64
+    assert (metadata.not_after - metadata.not_before).days == 30
+
+def test_parse_cert_pem_invalid():
+    """
+    测试解析无效证书
+    """
+    with pytest.raises(ValueError):
+        parse_cert_pem(b'not a certificate')
+
+def test_metadata_cache_hit(cert_file):
+    """
+    测试文件未变化时命中缓存
+    """
+    cache = CertMetadataCache()
+    first = cache.get(cert_file)
+    second = cache.get(cert_file)
+    
+    assert first is second
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+def test_metadata_cache_invalidated_on_replace(cert_file):
+    """
+    测试证书文件替换后缓存失效
+    """
+    cache = CertMetadataCache()
+    first = cache.get(cert_file)
+    
+    # 模拟certbot续期：写入新文件后原子替换
+    replacement = cert_file + '.new'
+    with open(replacement, 'wb') as f:
+        f.write(make_cert_pem(['example.com'], days=60))
+    os.replace(replacement, cert_file)
+    
+    second = cache.get(cert_file)
+    assert second.fingerprint != first.fingerprint
+    assert second.sans == ['example.com']
+
+def test_metadata_cache_eviction(tmp_path):
+    """
+    测试缓存条目数上限
+    """
+    cache = CertMetadataCache(max_entries=2)
+    pem = make_cert_pem(['example.com'])
+    for i in range(3):
+        path = tmp_path / f'cert{i}.pem'
+        path.write_bytes(pem)
+        cache.get(str(path))
+    
+    assert len(cache) == 2
+
+def test_metadata_cache_missing_file(tmp_path):
+    """
+    测试证书文件不存在
+    """
+    with pytest.raises(FileNotFoundError):
+        CertMetadataCache().get(str(tmp_path / 'missing.pem'))
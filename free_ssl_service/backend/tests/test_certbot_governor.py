@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+import pytest
+import redis
+from services.certbot_governor import CertbotGovernor, GovernorTimeout
+from services.issuance_backend import IssuanceError
+from tests.test_renewal_engine import make_engine
+
+class RecordingGovernor:
+    """
+    记录 slot 调用的并发控制器
+    """
+    
+    def __init__(self, timeout=False):
+        self.names = []
+        self.timeout = timeout
+    
+    @contextmanager
+    def slot(self, cert_name):
+        if self.timeout:
+            raise GovernorTimeout('Timed out waiting for a certbot slot')
+        self.names.append(cert_name)
+        yield 0.0
+
+def test_certbot_backend_uses_governor(tmp_path):
+    """
+    测试certbot调用经过并发控制器
+    """
+    backend = make_engine(tmp_path).backend
+    backend.governor = RecordingGovernor()
+    
+    backend.issue('example.com', ['example.com', 'www.example.com'], 'a@example.com')
+    backend.renew('example.org', ['example.org'], 'a@example.com')
+    assert backend.governor.names == ['example.com', 'example.org']
+    
+    backend.governor = RecordingGovernor(timeout=True)
+    with pytest.raises(IssuanceError, match='certbot slot'):
+        backend.issue('example.com', ['example.com'], 'a@example.com')
+
+@pytest.fixture
+def redis_client():
+    url = os.getenv('REDIS_URL')
+    if not url:
+        pytest.skip('REDIS_URL not set')
+    client = redis.Redis.from_url(url)
+    yield client
+    for key in client.scan_iter('freessl-test:*'):
+        client.delete(key)
+
+@pytest.mark.integration
+def test_governor_cluster_limit(redis_client):
+    """
+    测试集群并发上限和lineage互斥
+    """
+    governor = CertbotGovernor(redis_client, cluster_limit=2, acquire_timeout=5,
+                               poll_interval=0.01, key_prefix='freessl-test:')
+    lock = threading.Lock()
+    active = {'total': 0, 'peak': 0, 'same': 0, 'same_peak': 0}
+    
+    def run(name):
+        with governor.slot(name):
+            with lock:
+                active['total'] += 1
+                active['peak'] = max(active['peak'], active['total'])
+                if name == 'same.com':
+                    active['same'] += 1
+                    active['same_peak'] = max(active['same_peak'], active['same'])
+            time.sleep(0.05)
+            with lock:
+                active['total'] -= 1
+                if name == 'same.com':
+                    active['same'] -= 1
+    
+    threads = [threading.Thread(target=run, args=(name,)) for name in ['same.com'] * 3 + ['a.com', 'b.com', 'c.com']]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert active['peak'] == 2
+    assert active['same_peak'] == 1
+    metrics = governor.metrics()
+    assert metrics['acquired'] == 6
+    assert metrics['active'] == 0
+    assert metrics['waiting'] == 0
+
+@pytest.mark.integration
+def test_governor_acquire_timeout(redis_client):
+    """
+    测试等待lineage锁超时
+    """
+    governor = CertbotGovernor(redis_client, cluster_limit=1, acquire_timeout=0.1,
+                               poll_interval=0.01, key_prefix='freessl-test:')
+    
+    with governor.slot('example.com'):
+        with pytest.raises(GovernorTimeout):
+            with governor.slot('example.com'):
+                pass
+    
+    assert governor.metrics()['timeouts'] == 1
+
+@pytest.mark.integration
+def test_governor_limits_all_or_nothing(redis_client):
+    """
+    测试多键限流全部有空余时才占用，释放后可以再次占用
+    """
+    governor = CertbotGovernor(redis_client, key_prefix='freessl-test:')
+    
+    assert governor.try_acquire_limits({'customer:a': 1, 'domain:x': 2}, 'one')
+    assert not governor.try_acquire_limits({'customer:a': 1, 'domain:y': 2}, 'two')
+    # 失败的尝试不会占用 domain:y
+    assert redis_client.zcard('freessl-test:limit:domain:y') == 0
+    assert governor.try_acquire_limits({'customer:b': 1, 'domain:x': 2}, 'three')
+    assert not governor.try_acquire_limits({'customer:c': 1, 'domain:x': 2}, 'four')
+    
+    governor.release_limits(['customer:a', 'domain:x'], 'one')
+    assert governor.try_acquire_limits({'customer:a': 1, 'domain:x': 2}, 'five')
@@ -0,0 +1,124 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+from app import app, db
+from models.user_model import User
+from models.email_outbox_model import EmailOutbox
+from services.email_service import EmailService, EmailOutboxDrainer, SendGridTransport
+
+class FakeSendGrid(BaseHTTPRequestHandler):
+    """
+    本地SendGrid替身：记录请求，按 responses 依次返回状态码
+    """
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    responses = []
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.requests.append(body)
+        status = self.responses.pop(0) if self.responses else 202
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def sendgrid_url():
+    FakeSendGrid.requests = []
+    FakeSendGrid.responses = []
+    server = HTTPServer(('127.0.0.1', 0), FakeSendGrid)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.drop_all()
+
+def queue_verification(count):
+    for i in range(count):
+        user = User(username=f'user{i}', email=f'user{i}@example.com')
+        EmailService.send_verification_email(user, f'token{i}')
+    db.session.commit()
+
+def test_register_writes_outbox(client):
+    """
+    测试注册时验证邮件与用户一起写入发件箱
+    """
+    response = client.post('/api/auth/register', json={
+        'username': 'testuser',
+        'email': 'test@example.com',
+        'password': 'Test1234'
+    })
+    
+    assert response.status_code == 201
+    email = EmailOutbox.query.one()
+    assert email.kind == 'verification'
+    assert email.to_email == 'test@example.com'
+    assert email.status == EmailOutbox.STATUS_PENDING
+
+def test_drain_batches_personalizations(client, sendgrid_url):
+    """
+    测试相同模板的邮件合并为一次调用
+    """
+    queue_verification(5)
+    drainer = EmailOutboxDrainer(SendGridTransport('test-key', sendgrid_url), 'noreply@example.com', batch_size=3)
+    
+    counts = drainer.run()
+    
+    assert counts == {'sent': 5, 'retried': 0, 'failed': 0, 'requests': 2}
+    assert [len(body['personalizations']) for body in FakeSendGrid.requests] == [3, 2]
+    assert FakeSendGrid.requests[0]['personalizations'][0]['substitutions']['-username-'] == 'user0'
+    assert EmailOutbox.query.filter_by(status=EmailOutbox.STATUS_SENT).count() == 5
+
+def test_drain_retries_with_backoff(client, sendgrid_url):
+    """
+    测试可重试的失败按退避重新排期
+    """
+    queue_verification(2)
+    FakeSendGrid.responses = [503]
+    drainer = EmailOutboxDrainer(SendGridTransport('test-key', sendgrid_url), 'noreply@example.com',
+                                 max_attempts=2, retry_base_delay=0)
+    
+    assert drainer.run()['retried'] == 2
+    assert drainer.run()['sent'] == 2
+    assert all(email.attempts == 2 for email in EmailOutbox.query.all())
+
+def test_expiry_notification_days_from_now(client, monkeypatch):
+    """
+    测试单封到期提醒和摘要中的剩余天数都从当前时间起算
+    """
+    from datetime import datetime, timedelta
+    from models.cert_model import Certificate
+    
+    user = User(username='testuser', email='test@example.com')
+    cert = Certificate(
+        domains='example.com',
+        expiry_date=datetime.now() + timedelta(days=10, hours=1),
+        free_expiry_date=datetime.now() - timedelta(days=80)
+    )
+    queued = []
+    monkeypatch.setattr(EmailService, 'queue_template', lambda kind, user, fields: queued.append(fields))
+    monkeypatch.setattr(EmailService, 'queue_digests',
+                        lambda kind, groups, row: queued.extend(row(cert) for _, certs in groups for cert in certs))
+    
+    EmailService.send_certificate_expiry_notification(user, cert)
+    EmailService.send_certificate_expiry_digests([(user, [cert])])
+    assert [fields['days_until_expiry'] for fields in queued] == [10, 10]
+    
+    queued.clear()
+    EmailService.send_free_expiry_notification(user, cert)
+    EmailService.send_free_expiry_digests([(user, [cert])])
+    assert [fields['days_until_free_expiry'] for fields in queued] == [0, 0]
+
@@ -0,0 +1,90 @@
+import time
+from services.email_templates import EmailTemplateRenderer
+
+def make_renderer(tmp_path):
+    return EmailTemplateRenderer(cache_dir=str(tmp_path), base_url='https://freessl.example/')
+
+def test_render_locale_variants(tmp_path):
+    """
+    测试按语言选择模板，未知语言使用默认语言
+    """
+    renderer = make_renderer(tmp_path)
+    recipient = {'username': 'alice', 'reset_token': 'abc'}
+    
+    zh = renderer.render('password_reset', recipient)
+    en = renderer.render('password_reset', recipient, locale='en')
+    
+    assert renderer.locales == ['en', 'zh']
+    assert zh.subject == '重置您的密码'
+    assert en.subject == 'Reset your password'
+    assert 'href="https://freessl.example/reset-password?token=abc"' in en.html
+    assert renderer.render('password_reset', recipient, locale='fr') == zh
+
+def test_render_escapes_recipient_data(tmp_path):
+    """
+    测试收件人数据经过HTML转义
+    """
+    renderer = make_renderer(tmp_path)
+    
+    rendered = renderer.render('verification', {'username': '<b>bob</b>', 'verification_token': 't'})
+    
+    assert '&lt;b&gt;bob&lt;/b&gt;' in rendered.html
+    assert '<b>bob</b>' not in rendered.html
+
+def test_substitution_template(tmp_path):
+    """
+    测试以SendGrid替换标签渲染的模板按 (类型, 语言) 缓存
+    """
+    renderer = make_renderer(tmp_path)
+    
+    rendered = renderer.substitution_template('free_expiry', 'en')
+    
+    assert rendered.subject == 'Free period ending soon - -domains-'
+    assert 'href="https://freessl.example/certificates/-cert_id-/renew"' in rendered.html
+    assert renderer.substitution_template('free_expiry', 'en') is rendered
+
+def test_render_digest(tmp_path):
+    """
+    测试摘要邮件列出收件人的全部证书
+    """
+    renderer = make_renderer(tmp_path)
+    certificates = [
+        {
+            'cert_id': i,
+            'domains': f'site{i}.com',
+            'free_expiry_date': '2026-01-01',
+            'expiry_date': '2026-03-01',
+            'days_until_free_expiry': 7
+        }
+        for i in range(3)
+    ]
+    
+    rendered = renderer.render('free_expiry_digest', {'username': 'alice', 'certificates': certificates}, 'en')
+    
+    assert rendered.subject == 'Free period ending soon - 3 certificates'
+    assert rendered.html.count('<td>site') == 3
+    assert 'href="https://freessl.example/certificates/2/renew"' in rendered.html
+
+def test_render_many_throughput(tmp_path):
+    """
+    基准：批量渲染不重复解析模板，每秒可渲染数千封邮件
+    """
+    renderer = make_renderer(tmp_path)
+    recipients = [
+        {
+            'username': f'user{i}',
+            'domains': f'site{i}.com',
+            'expiry_date': '2026-01-01',
+            'days_until_expiry': 30,
+            'free_expiry_date': '2025-12-01'
+        }
+        for i in range(5000)
+    ]
+    
+    started = time.perf_counter()
+    rendered = renderer.render_many('certificate_expiry', recipients)
+    elapsed = time.perf_counter() - started
+    
+    assert len(rendered) == 5000
+    assert rendered[4999].subject == '证书即将到期提醒 - site4999.com'
+    assert len(rendered) / elapsed > 2000
@@ -0,0 +1,89 @@
+import io
+import json
+import zipfile
+import pytest
+from types import SimpleNamespace
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import pkcs12
+from services.export_service import CertExportService
+from tests.test_cert_metadata import make_cert_pem
+
+def make_cert(tmp_path, cert_id, name, with_files=True):
+    """
+    创建测试用的证书对象及证书目录
+    """
+    cert_path = tmp_path / 'live' / name
+    if with_files:
+        cert_path.mkdir(parents=True)
+        key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+        (cert_path / 'privkey.pem').write_bytes(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ))
+        (cert_path / 'cert.pem').write_bytes(make_cert_pem([name], key=key))
+        (cert_path / 'chain.pem').write_bytes(make_cert_pem(['Test CA']))
+    return SimpleNamespace(
+        id=cert_id,
+        cert_path=str(cert_path),
+        primary_domain=name,
+        to_dict=lambda: {'id': cert_id, 'domains': name}
+    )
+
+def test_export_invalid_format():
+    """
+    测试无效的导出格式
+    """
+    with pytest.raises(ValueError):
+        CertExportService('tar')
+
+def test_export_zip_streams_chunks(tmp_path):
+    """
+    测试ZIP导出分块输出并记录缺失的证书
+    """
+    certs = [make_cert(tmp_path, i, f'site{i}.com') for i in range(3)]
+    certs.append(make_cert(tmp_path, 99, 'missing.com', with_files=False))
+    exporter = CertExportService('zip')
+    exporter.CHUNK_SIZE = 256
+    
+    chunks = list(exporter.stream(certs))
+    
+    assert len(chunks) > len(certs)
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    assert 'site1.com-1/privkey.pem' in archive.namelist()
+    assert archive.read('site0.com-0/cert.pem') == (tmp_path / 'live' / 'site0.com' / 'cert.pem').read_bytes()
+    assert json.loads(archive.read('manifest.json')) == {'exported': [0, 1, 2], 'missing': [99], 'failed': []}
+
+def test_export_pkcs12(tmp_path):
+    """
+    测试PKCS#12导出
+    """
+    exporter = CertExportService('pkcs12', password='secret')
+    
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(exporter.stream([make_cert(tmp_path, 1, 'example.com')]))))
+    
+    key, certificate, chain = pkcs12.load_key_and_certificates(
+        archive.read('example.com-1.p12'), b'secret', default_backend()
+    )
+    assert certificate is not None
+    assert len(chain) == 1
+    
+    # 证书与私钥不匹配时跳过并记录
+    broken = make_cert(tmp_path, 2, 'broken.com')
+    (tmp_path / 'live' / 'broken.com' / 'cert.pem').write_bytes(make_cert_pem(['broken.com']))
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(exporter.stream([broken]))))
+    assert json.loads(archive.read('manifest.json'))['failed'] == [2]
+
+def test_export_ndjson(tmp_path):
+    """
+    测试NDJSON导出每行一个证书
+    """
+    certs = [make_cert(tmp_path, 1, 'example.com'), make_cert(tmp_path, 2, 'missing.com', with_files=False)]
+    
+    lines = [json.loads(line) for line in CertExportService('ndjson').stream(certs)]
+    
+    assert lines[0]['certificate'].startswith('-----BEGIN CERTIFICATE-----')
+    assert 'private_key' in lines[0]
+    assert lines[1] == {'id': 2, 'domains': 'missing.com', 'error': 'Certificate files not found'}
@@ -0,0 +1,101 @@
+import re
+import json
+import time
+import pytest
+from utils.input_screen import RULE_SETS, InputRejected, InputScreener, screen_input
+
+SAMPLES = [
+    'example.com', 'Tom and Jerry', 'SELECT * FROM users', 'color', 'android', 'fromage',
+    '<SCRIPT>alert(1)</script>', 'javascript:void(0)', '<iframe src=x>', 'VBScript:x', 'drop-shadow', '测试 or 1=1'
+]
+
+def legacy_matches(value):
+    patterns = [pattern for patterns in RULE_SETS.values() for pattern in patterns]
+    return any(re.search(pattern, value, re.IGNORECASE) for pattern in patterns)
+
+def test_combined_matcher_agrees_with_individual_patterns():
+    """
+    测试组合正则与逐条匹配的结果一致，并报告命中的分组
+    """
+    screener = InputScreener()
+    for value in SAMPLES:
+        try:
+            screener.scan({'value': value})
+            rejected = False
+        except InputRejected:
+            rejected = True
+        assert rejected == legacy_matches(value), value
+    
+    with pytest.raises(InputRejected) as error:
+        screener.scan({'nested': [{'html': '<script>'}]})
+    assert error.value.rule == 'xss'
+
+def test_route_policy_rules_and_exemptions():
+    """
+    测试路由可只启用部分规则分组，并跳过指定字段
+    """
+    screener = InputScreener()
+    
+    @screen_input(rules=('xss',), exempt_fields=('password',))
+    def view():
+        pass
+    
+    screener.check({'note': 'select a plan', 'password': '<script>'}, view)
+    with pytest.raises(InputRejected):
+        screener.check({'note': '<script>'}, view)
+    with pytest.raises(InputRejected):
+        screener.check({'note': 'select a plan'})
+    with pytest.raises(ValueError):
+        screen_input(rules=('unknown',))
+
+def test_budgets_reject_deep_and_wide_payloads():
+    """
+    测试嵌套层数和元素总数超出预算时拒绝，深层嵌套不会触发递归深度错误
+    """
+    deep = []
+    for _ in range(5000):
+        deep = [deep]
+    with pytest.raises(InputRejected):
+        InputScreener(max_depth=32).scan(deep)
+    InputScreener(max_depth=10000).scan(deep)
+    
+    with pytest.raises(InputRejected):
+        InputScreener(max_nodes=1000).scan({'items': list(range(1001))})
+
+def legacy_validate_input(data):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, (str, bytes)):
+                for patterns in RULE_SETS.values():
+                    for pattern in patterns:
+                        if re.search(pattern, str(value), re.IGNORECASE):
+                            raise ValueError("Invalid input detected")
+            elif isinstance(value, (dict, list)):
+                legacy_validate_input(value)
+    elif isinstance(data, list):
+        for item in data:
+            legacy_validate_input(item)
+
+@pytest.mark.slow
+def test_screening_throughput_on_1mb_body():
+    """
+    基准：约1MB的JSON请求体，组合正则单次遍历的吞吐量不低于逐条匹配的实现
+    """
+    record = {'domain': 'www.example.com', 'note': 'renewal requested by customer', 'tags': ['prod', 'web']}
+    body = json.dumps({'items': [dict(record, id=i) for i in range(12000)]})
+    data = json.loads(body)
+    megabytes = len(body) / 1024 / 1024
+    screener = InputScreener()
+    
+    def throughput(func, rounds=5):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            func(data)
+        return megabytes * rounds / (time.perf_counter() - started)
+    
+    legacy = throughput(legacy_validate_input)
+    screened = throughput(screener.scan)
+    print(f"\n{megabytes:.2f} MB body: legacy {legacy:.1f} MB/s, screener {screened:.1f} MB/s")
+    
+    assert megabytes >= 1
+    assert screened > legacy
@@ -0,0 +1,75 @@
+import os
+import pytest
+from datetime import datetime, timedelta
+from app import app, db
+from models.user_model import User
+from models.cert_model import Certificate
+from services.inventory_service import InventoryReconciler
+from tests.test_cert_metadata import make_cert_pem
+
+@pytest.fixture
+def config_dir(tmp_path):
+    """
+    创建测试用的certbot配置目录和数据库
+    """
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    
+    with app.app_context():
+        db.create_all()
+        yield tmp_path
+        db.drop_all()
+
+def make_lineage(config_dir, name, days=90):
+    lineage = config_dir / 'live' / name
+    lineage.mkdir(parents=True)
+    (lineage / 'cert.pem').write_bytes(make_cert_pem([name], days))
+    (lineage / 'privkey.pem').write_text('KEY')
+    (lineage / 'chain.pem').write_text('CHAIN')
+    (config_dir / 'archive' / name).mkdir(parents=True)
+    return str(lineage)
+
+def add_cert(user, cert_path, name):
+    cert = Certificate(
+        user_id=user.id,
+        email=user.email,
+        expiry_date=datetime(2000, 1, 1),
+        free_expiry_date=datetime.now() + timedelta(days=90),
+        cert_path=cert_path
+    )
+    cert.set_domains(name)
+    db.session.add(cert)
+    db.session.commit()
+    return cert
+
+def test_inventory_reconciler(config_dir):
+    """
+    测试巡检修正过期时间并报告缺失和孤儿lineage
+    """
+    user = User(username='testuser', email='test@example.com')
+    user.set_password('Test1234')
+    db.session.add(user)
+    db.session.commit()
+    
+    drifted = add_cert(user, make_lineage(config_dir, 'example.com'), 'example.com')
+    missing = add_cert(user, str(config_dir / 'live' / 'missing.com'), 'missing.com')
+    make_lineage(config_dir, 'orphan.com')
+    
+    reconciler = InventoryReconciler(str(config_dir))
+    report = reconciler.run()
+    
+    assert report['lineages'] == 2
+    assert report['updated'] == 1
+    assert report['missing'] == [missing.id]
+    assert report['orphans'] == ['orphan.com']
+    assert Certificate.query.get(drifted.id).expiry_date > datetime.now()
+    
+    # 目录未变化时不再解析证书文件
+    report = reconciler.run()
+    assert report['parsed'] == 0
+    assert report['unchanged'] == 2
+    assert report['updated'] == 0
+    
+    os.remove(config_dir / 'live' / 'example.com' / 'chain.pem')
+    report = reconciler.run()
+    assert sorted(report['missing']) == sorted([drifted.id, missing.id])
@@ -0,0 +1,194 @@
+import copy
+import os
+import stat
+import pytest
+from services.dns_provider import ChallTestSrvDnsProvider, DnsProvider, Route53DnsProvider
+from services.issuance_backend import AcmeBackend, CertbotBackend, IssuanceBackend, IssuanceError, IssueRequest
+from tests.test_cert_metadata import make_cert_pem
+from utils.cert_metadata import parse_cert_pem
+
+FAKE_CERTBOT = '''#!/bin/sh
+# 模拟certbot：--cert-name为fail开头时失败，slow开头时超时
+while [ $# -gt 0 ]; do
+    if [ "$1" = "--cert-name" ]; then NAME="$2"; fi
+    shift
+done
+case "$NAME" in
+    fail*) echo "challenge failed for $NAME" >&2; exit 1 ;;
+    slow*) sleep 5 ;;
+esac
+exit 0
+'''
+
+class RecordingDnsProvider(DnsProvider):
+    """
+    记录发布和删除的DNS记录
+    """
+    
+    def __init__(self):
+        self.added = []
+        self.removed = []
+    
+    def add_txt_records(self, records):
+        self.added.append(records)
+    
+    def remove_txt_records(self, records):
+        self.removed.append(records)
+
+class FakeRoute53:
+    """
+    内存中的Route53：DELETE必须与现有记录集完全一致，否则整个批次被拒绝
+    """
+    
+    class exceptions:
+        class InvalidChangeBatch(Exception):
+            pass
+    
+    def __init__(self):
+        self.record_sets = {}
+        self.before_change = None
+    
+    def get_paginator(self, name):
+        class Paginator:
+            def paginate(self):
+                return [{'HostedZones': [{'Name': 'example.com.', 'Id': 'Z1', 'Config': {}}]}]
+        return Paginator()
+    
+    def list_resource_record_sets(self, HostedZoneId, StartRecordName, StartRecordType, MaxItems):
+        record_set = self.record_sets.get(StartRecordName)
+        return {'ResourceRecordSets': [copy.deepcopy(record_set)] if record_set else []}
+    
+    def change_resource_record_sets(self, HostedZoneId, ChangeBatch):
+        if self.before_change:
+            hook, self.before_change = self.before_change, None
+            hook()
+        for change in ChangeBatch['Changes']:
+            record_set = change['ResourceRecordSet']
+            existing = self.record_sets.get(record_set['Name'])
+            if change['Action'] == 'DELETE' and existing != record_set:
+                raise self.exceptions.InvalidChangeBatch('record set does not match')
+            if change['Action'] == 'CREATE' and existing and ChangeBatch['Changes'][0]['Action'] != 'DELETE':
+                raise self.exceptions.InvalidChangeBatch('record set already exists')
+        for change in ChangeBatch['Changes']:
+            record_set = change['ResourceRecordSet']
+            if change['Action'] == 'DELETE':
+                del self.record_sets[record_set['Name']]
+            else:
+                self.record_sets[record_set['Name']] = copy.deepcopy(record_set)
+        return {'ChangeInfo': {'Id': 'C1'}}
+    
+    def get_change(self, Id):
+        return {'ChangeInfo': {'Status': 'INSYNC'}}
+    
+    def values(self, name):
+        record_set = self.record_sets.get(name)
+        return [record['Value'] for record in record_set['ResourceRecords']] if record_set else []
+
+def test_route53_merges_concurrent_txt_values():
+    """
+    测试同一记录名的多个订单互不覆盖，删除时只删除自己的值
+    """
+    route53 = FakeRoute53()
+    provider = Route53DnsProvider(client=route53)
+    name = '_acme-challenge.example.com'
+    
+    provider.add_txt_records({name: ['apex']})
+    provider.add_txt_records({name: ['wildcard']})
+    assert route53.values(name) == ['"apex"', '"wildcard"']
+    
+    # 读取之后、写入之前其他订单修改了记录：批次被拒绝，重新读取后合并
+    route53.before_change = lambda: route53.record_sets[name]['ResourceRecords'].append({'Value': '"other"'})
+    provider.add_txt_records({name: ['third']})
+    assert route53.values(name) == ['"apex"', '"wildcard"', '"other"', '"third"']
+    
+    provider.remove_txt_records({name: ['apex', 'third']})
+    assert route53.values(name) == ['"wildcard"', '"other"']
+    provider.remove_txt_records({name: ['wildcard', 'other']})
+    assert name not in route53.record_sets
+
+def test_backend_interfaces_are_abstract():
+    with pytest.raises(TypeError):
+        IssuanceBackend('/tmp')
+    with pytest.raises(TypeError):
+        DnsProvider()
+
+def make_certbot_backend(tmp_path, timeout=600.0):
+    certbot = tmp_path / 'certbot'
+    certbot.write_text(FAKE_CERTBOT)
+    certbot.chmod(certbot.stat().st_mode | stat.S_IEXEC)
+    return CertbotBackend(str(certbot), str(tmp_path), str(tmp_path), str(tmp_path), timeout=timeout)
+
+def test_certbot_backend_issue(tmp_path):
+    """
+    测试certbot后端返回lineage路径
+    """
+    backend = make_certbot_backend(tmp_path)
+    
+    assert backend.issue('example.com', ['example.com'], 'a@example.com') == str(tmp_path / 'live' / 'example.com')
+    assert backend.issue_many([IssueRequest('example.org', ['example.org'], 'a@example.com')]) == [
+        str(tmp_path / 'live' / 'example.org')
+    ]
+
+def test_certbot_backend_errors(tmp_path):
+    """
+    测试certbot失败和超时转换为IssuanceError
+    """
+    backend = make_certbot_backend(tmp_path, timeout=0.5)
+    
+    with pytest.raises(IssuanceError, match='challenge failed'):
+        backend.issue('fail.com', ['fail.com'], 'a@example.com')
+    with pytest.raises(IssuanceError, match='timed out'):
+        backend.renew('slow.com', ['slow.com'], 'a@example.com')
+
+def test_acme_backend_install_lineage(tmp_path):
+    """
+    测试进程内ACME后端按certbot布局写入证书
+    """
+    backend = AcmeBackend('https://acme.invalid/directory', str(tmp_path), RecordingDnsProvider())
+    leaf = make_cert_pem(['example.com']).decode()
+    intermediate = make_cert_pem(['Test CA']).decode()
+    
+    live_dir = backend._install_lineage('example.com', b'KEY', leaf + intermediate)
+    
+    assert live_dir == backend.lineage_path('example.com')
+    assert os.path.islink(os.path.join(live_dir, 'cert.pem'))
+    assert parse_cert_pem(open(os.path.join(live_dir, 'cert.pem'), 'rb').read()).sans == ['example.com']
+    assert open(os.path.join(live_dir, 'chain.pem')).read() == intermediate
+    assert open(os.path.join(live_dir, 'fullchain.pem')).read() == leaf + intermediate
+    assert stat.S_IMODE(os.stat(os.path.join(live_dir, 'privkey.pem')).st_mode) == 0o600
+    
+    # 续期写入新版本并切换链接
+    renewed = make_cert_pem(['example.com'], days=60).decode()
+    backend._install_lineage('example.com', b'KEY2', renewed + intermediate)
+    assert os.readlink(os.path.join(live_dir, 'cert.pem')).endswith('cert2.pem')
+    assert open(os.path.join(live_dir, 'privkey.pem')).read() == 'KEY2'
+    
+    with pytest.raises(IssuanceError):
+        backend._install_lineage('example.com', b'KEY', 'garbage')
+
+@pytest.mark.integration
+@pytest.mark.skipif(not os.getenv('PEBBLE_DIRECTORY_URL'), reason='PEBBLE_DIRECTORY_URL not set')
+def test_acme_backend_against_pebble(tmp_path):
+    """
+    测试对Pebble批量签发（需要运行pebble和pebble-challtestsrv）
+    """
+    dns_provider = ChallTestSrvDnsProvider(os.getenv('PEBBLE_CHALLTESTSRV_URL', 'http://localhost:8055'))
+    backend = AcmeBackend(
+        os.getenv('PEBBLE_DIRECTORY_URL'),
+        str(tmp_path),
+        dns_provider,
+        verify_ssl=False,
+        propagation_seconds=0,
+        timeout=120
+    )
+    requests = [
+        IssueRequest('example.com', ['example.com', 'www.example.com'], 'a@example.com'),
+        IssueRequest('example.org', ['*.example.org'], 'a@example.com')
+    ]
+    
+    results = backend.issue_many(requests)
+    
+    for request, result in zip(requests, results):
+        assert result == backend.lineage_path(request.cert_name)
+        metadata = parse_cert_pem(open(os.path.join(result, 'cert.pem'), 'rb').read())
+        assert sorted(metadata.sans) == sorted(request.domains)
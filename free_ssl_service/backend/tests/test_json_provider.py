@@ -0,0 +1,85 @@
+import json
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+import pytest
+import models.user_model  # noqa: F401  Certificate/Invitation 的关系按名称引用 User，需要先注册映射
+from models.cert_model import Certificate
+from models.invitation_model import Invitation
+from utils.json_provider import JSONProvider, orjson
+
+CertRow = namedtuple('CertRow', Certificate.SERIALIZED_COLUMNS)
+
+def make_certs(count, now):
+    return [
+        Certificate(
+            id=i, user_id=1, domains=f'site{i}.example.com,www.site{i}.example.com', email='owner@example.com',
+            issue_date=now - timedelta(days=60, microseconds=i), expiry_date=now + timedelta(days=i % 90 - 30),
+            free_expiry_date=now + timedelta(days=i % 60, hours=i % 24), cert_path=f'/etc/letsencrypt/live/site{i}',
+            notified_free_expiry=False, payment_status='free'
+        )
+        for i in range(count)
+    ]
+
+def as_rows(certs):
+    return [CertRow(*(getattr(cert, name) for name in Certificate.SERIALIZED_COLUMNS)) for cert in certs]
+
+def test_backends_produce_same_data():
+    """
+    测试 orjson 和标准库输出的数据一致（日期为ISO格式，Decimal为浮点数，键排序）
+    """
+    data = {'b': [datetime(2024, 5, 1, 8, 30, 0, 123456), Decimal('99.00')], 'a': '测试', 'c': None}
+    stdlib = JSONProvider('stdlib').dumps(data)
+    
+    assert stdlib.startswith(b'{"a":"\\u6d4b\\u8bd5","b"')
+    assert json.loads(stdlib) == {'a': '测试', 'b': ['2024-05-01T08:30:00.123456', 99.0], 'c': None}
+    if orjson is not None:
+        assert json.loads(JSONProvider('orjson').dumps(data)) == json.loads(stdlib)
+    assert JSONProvider('orjson').backend == ('orjson' if orjson is not None else 'stdlib')
+    with pytest.raises(ValueError):
+        JSONProvider('ujson')
+
+def test_serialize_many_matches_to_dict():
+    """
+    测试批量序列化与逐个 to_dict() 的JSON一致，包括可续期判断的边界
+    """
+    now = datetime.now()
+    certs = make_certs(200, now + timedelta(minutes=5))
+    provider = JSONProvider()
+    
+    expected = json.loads(json.dumps([cert.to_dict() for cert in certs]))
+    assert json.loads(provider.dumps(Certificate.serialize_many(as_rows(certs), now))) == expected
+    
+    for offset in (timedelta(days=31), timedelta(days=31) - timedelta(microseconds=1), timedelta(days=30)):
+        row = CertRow(1, 'a.com', 'a@a.com', now, now + timedelta(days=90), now + offset, '/p', False, 'free')
+        (result,) = Certificate.serialize_many([row], now)
+        assert result['can_renew'] == ((row.free_expiry_date - now).days <= 30)
+    
+    invitation = Invitation(id=1, invite_code='abc', inviter_id=1, status='pending', reward_points=0, created_at=now)
+    assert json.loads(provider.dumps(Invitation.serialize_many([invitation]))) == [invitation.to_dict()]
+
+@pytest.mark.slow
+def test_serialization_cost_10k_rows():
+    """
+    基准：10000行证书列表，逐行 to_dict() + 标准库编码 与 列投影批量序列化 + orjson 的耗时
+    """
+    now = datetime.now()
+    certs = make_certs(10000, now)
+    rows = as_rows(certs)
+    
+    def timed(func, rounds=5):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            body = func()
+        return (time.perf_counter() - started) / rounds, body
+    
+    legacy, legacy_body = timed(lambda: json.dumps([cert.to_dict() for cert in certs], sort_keys=True).encode())
+    stdlib, _ = timed(lambda: JSONProvider('stdlib').dumps(Certificate.serialize_many(rows)))
+    fast, fast_body = timed(lambda: JSONProvider('orjson').dumps(Certificate.serialize_many(rows)))
+    
+    print(f"\n10k certificates: to_dict+json {legacy * 1000:.1f} ms, "
+          f"serialize_many+json {stdlib * 1000:.1f} ms, serialize_many+{JSONProvider().backend} {fast * 1000:.1f} ms")
+    
+    assert json.loads(fast_body) == json.loads(legacy_body)
+    assert fast < legacy
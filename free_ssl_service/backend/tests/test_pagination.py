@@ -0,0 +1,54 @@
+from datetime import datetime
+import pytest
+from flask import Flask
+from utils.pagination import decode_cursor, encode_cursor, parse_datetime, parse_fields, parse_limit
+
+@pytest.fixture
+def app_context():
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test-secret-key'
+    with app.app_context():
+        yield
+
+def test_parse_limit():
+    """
+    测试每页数量：默认值、上限及无效值
+    """
+    assert parse_limit(None, 50, 200) == 50
+    assert parse_limit('', 50, 200) == 50
+    assert parse_limit('10', 50, 200) == 10
+    assert parse_limit('1000', 50, 200) == 200
+    for value in ['0', '-1', 'abc']:
+        with pytest.raises(ValueError):
+            parse_limit(value, 50, 200)
+
+def test_parse_fields():
+    """
+    测试字段列表：去重保序，未知字段报错
+    """
+    allowed = ('id', 'domains', 'status')
+    assert parse_fields(None, allowed) is None
+    assert parse_fields(' , ', allowed) is None
+    assert parse_fields('status, id,status', allowed) == ('status', 'id')
+    with pytest.raises(ValueError, match='password'):
+        parse_fields('id,password', allowed)
+
+def test_parse_datetime():
+    assert parse_datetime(None, 'expires_after') is None
+    assert parse_datetime('2024-05-01T08:30:00', 'expires_after') == datetime(2024, 5, 1, 8, 30)
+    with pytest.raises(ValueError, match='expires_after'):
+        parse_datetime('tomorrow', 'expires_after')
+
+def test_cursor_round_trip(app_context):
+    """
+    测试游标可还原，且不能篡改或跨列表使用
+    """
+    issue_date = datetime(2024, 5, 1, 8, 30, 0, 123456)
+    cursor = encode_cursor(issue_date, 42, 'certs')
+    
+    assert decode_cursor(cursor, 'certs') == (issue_date, 42)
+    for bad in [cursor[:-2] + 'xx', 'invalid', '']:
+        with pytest.raises(ValueError, match='Invalid cursor'):
+            decode_cursor(bad, 'certs')
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 'invitations')
@@ -0,0 +1,146 @@
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash
+from utils.password_hasher import PasswordHasher
+
+FAST_PBKDF2 = {'iterations': 1000}
+FAST_SCRYPT = {'n': 1024, 'r': 8, 'p': 1}
+
+@pytest.fixture
+def pooled():
+    hasher = PasswordHasher('pbkdf2', FAST_PBKDF2, workers=2, max_pending=4)
+    yield hasher
+    hasher.shutdown()
+
+def test_hash_and_verify_schemes():
+    """
+    测试各算法的哈希和校验，兼容 werkzeug 生成的历史哈希
+    """
+    for scheme, params in (('pbkdf2', FAST_PBKDF2), ('scrypt', FAST_SCRYPT)):
+        hasher = PasswordHasher(scheme, params)
+        pwhash = hasher.hash('Test1234')
+        
+        assert len(pwhash) <= 255
+        assert hasher.verify(pwhash, 'Test1234')
+        assert not hasher.verify(pwhash, 'wrong')
+        assert not hasher.needs_rehash(pwhash)
+    
+    legacy = generate_password_hash('Test1234')
+    assert hasher.verify(legacy, 'Test1234')
+    assert hasher.needs_rehash(legacy)
+    assert PasswordHasher('pbkdf2', {'iterations': 2000}).needs_rehash(PasswordHasher('pbkdf2', FAST_PBKDF2).hash('x'))
+
+def test_process_pool_verify(pooled):
+    """
+    测试在进程池中校验密码
+    """
+    pwhash = pooled.hash('Test1234')
+    
+    assert pooled.verify(pwhash, 'Test1234')
+    assert not pooled.verify(pwhash, 'wrong')
+
+def test_share_splits_host_budget():
+    """
+    测试进程池和排队上限按主机预算在gunicorn worker之间平分
+    """
+    hasher = PasswordHasher('pbkdf2', FAST_PBKDF2, workers=8, max_pending=64)
+    hasher.share(3)
+    assert (hasher.workers, hasher.max_pending) == (2, 21)
+    
+    hasher = PasswordHasher('pbkdf2', FAST_PBKDF2, workers=8, max_pending=64)
+    hasher.share(8)
+    assert (hasher.workers, hasher.max_pending, hasher._host_slots) == (1, 8, None)
+    
+    # 在请求线程中哈希的配置保持不变
+    hasher = PasswordHasher('pbkdf2', FAST_PBKDF2, workers=0)
+    hasher.share(4)
+    assert hasher.workers == 0
+
+def test_share_caps_host_concurrency_below_worker_count():
+    """
+    测试gunicorn worker数多于哈希预算时，各worker的池进程共用主机级名额，同时执行的哈希数不超过预算
+    """
+    hasher = PasswordHasher('pbkdf2', FAST_PBKDF2, workers=2, max_pending=4)
+    hasher.share(9)
+    assert (hasher.workers, hasher.max_pending) == (1, 1)
+    assert hasher._host_slots.get_value() == 2
+    
+    # 模拟其他worker占满主机名额：池进程等待名额，请求超时返回503
+    hasher.timeout = 0.5
+    hasher._host_slots.acquire()
+    hasher._host_slots.acquire()
+    try:
+        with pytest.raises(ServiceUnavailable):
+            hasher.hash('Test1234')
+    finally:
+        hasher._host_slots.release()
+        hasher._host_slots.release()
+    
+    try:
+        # 名额释放后等待中的哈希继续执行，新的请求正常完成
+        hasher.timeout = 10
+        deadline = time.monotonic() + 10
+        while hasher._slots._value == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert hasher.verify(hasher.hash('Test1234'), 'Test1234')
+        assert hasher._host_slots.get_value() == 2
+    finally:
+        hasher.shutdown()
+
+def test_back_pressure_rejects_fast():
+    """
+    测试排队数达到上限时立即返回503
+    """
+    hasher = PasswordHasher('scrypt', {'n': 2 ** 16, 'r': 8, 'p': 1}, workers=1, max_pending=1)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as threads:
+            running = threads.submit(hasher.hash, 'Test1234')
+            while hasher._slots is None or hasher._slots._value:
+                time.sleep(0.001)
+            
+            started = time.perf_counter()
+            with pytest.raises(ServiceUnavailable) as excinfo:
+                hasher.hash('Test1234')
+            
+            assert time.perf_counter() - started < 0.05
+            assert excinfo.value.retry_after == 1
+            assert running.result().startswith('scrypt:')
+        assert hasher.rejected == 1
+    finally:
+        hasher.shutdown()
+
+@pytest.mark.slow
+def test_login_latency_under_concurrency():
+    """
+    基准：64个并发登录经有界进程池校验，超出排队上限的请求快速失败，被接受请求的p99有上限
+    """
+    hasher = PasswordHasher('pbkdf2', {'iterations': 50000}, workers=2, max_pending=16)
+    pwhash = hasher.hash('Test1234')
+    
+    def login():
+        started = time.perf_counter()
+        try:
+            ok = hasher.verify(pwhash, 'Test1234')
+        except ServiceUnavailable:
+            ok = None
+        return ok, time.perf_counter() - started
+    
+    try:
+        single = login()[1]
+        with ThreadPoolExecutor(max_workers=64) as threads:
+            results = list(threads.map(lambda _: login(), range(64)))
+    finally:
+        hasher.shutdown()
+    
+    accepted = sorted(elapsed for ok, elapsed in results if ok)
+    rejected = sorted(elapsed for ok, elapsed in results if ok is None)
+    p99 = accepted[int(len(accepted) * 0.99) - 1]
+    print(f"\nlogin: single {single * 1000:.1f}ms, accepted {len(accepted)} p99 {p99 * 1000:.1f}ms, "
+          f"rejected {len(rejected)} max {max(rejected, default=0) * 1000:.1f}ms")
+    
+    assert len(accepted) >= 16
+    # 被接受的请求最多排在 max_pending/workers 个任务之后
+    assert p99 < single * (16 / 2 + 2) + 0.5
+    assert all(elapsed < 0.1 for elapsed in rejected)
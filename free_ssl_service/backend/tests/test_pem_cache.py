@@ -0,0 +1,61 @@
+import os
+import pytest
+from utils.pem_cache import PemMaterialCache
+
+def write_lineage(path, cert='CERT', key='KEY', chain='CHAIN'):
+    """
+    写入测试用的证书目录
+    """
+    path.mkdir(exist_ok=True)
+    for name, content in (('cert.pem', cert), ('privkey.pem', key), ('chain.pem', chain)):
+        tmp = path / (name + '.tmp')
+        tmp.write_text(content)
+        os.replace(tmp, path / name)
+    return str(path)
+
+def test_pem_cache_hit(tmp_path):
+    """
+    测试文件未变化时命中缓存
+    """
+    cache = PemMaterialCache()
+    cert_path = write_lineage(tmp_path / 'example.com')
+    
+    first = cache.get(cert_path)
+    second = cache.get(cert_path)
+    
+    assert first == ('CERT', 'KEY', 'CHAIN')
+    assert second is first
+    assert cache.hits == 1
+
+def test_pem_cache_invalidated_on_renewal(tmp_path):
+    """
+    测试续期替换文件后重新读取
+    """
+    cache = PemMaterialCache()
+    cert_path = write_lineage(tmp_path / 'example.com')
+    cache.get(cert_path)
+    
+    write_lineage(tmp_path / 'example.com', cert='RENEWED')
+    assert cache.get(cert_path).certificate == 'RENEWED'
+    assert cache.misses == 2
+
+def test_pem_cache_size_bound(tmp_path):
+    """
+    测试按总字节数淘汰最久未使用的条目
+    """
+    cache = PemMaterialCache(max_bytes=40)
+    paths = [write_lineage(tmp_path / f'site{i}.com', cert='C' * 10) for i in range(3)]
+    for path in paths:
+        cache.get(path)
+    
+    assert cache.size <= 40
+    assert len(cache) == 2
+    cache.get(paths[0])
+    assert cache.misses == 4
+
+def test_pem_cache_missing_file(tmp_path):
+    """
+    测试证书文件缺失
+    """
+    with pytest.raises(FileNotFoundError):
+        PemMaterialCache().get(str(tmp_path / 'missing'))
@@ -0,0 +1,99 @@
+import pytest
+from flask_caching import Cache
+from app import app, db
+from models.user_model import User
+from services.principal_cache import PrincipalCache
+
+@pytest.fixture
+def cache():
+    """
+    创建测试数据库、用户及使用进程内缓存的 PrincipalCache
+    """
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    
+    with app.app_context():
+        db.create_all()
+        user = User(username='testuser', email='test@example.com', reward_points=10)
+        user.set_password('Test1234')
+        db.session.add(user)
+        db.session.commit()
+        
+        principal_cache = PrincipalCache()
+        principal_cache.init_app(app, Cache(app, config={'CACHE_TYPE': 'SimpleCache'}))
+        yield principal_cache
+        db.drop_all()
+
+def count_queries(func):
+    statements = []
+    
+    def before_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+    
+    db.event.listen(db.engine, 'before_cursor_execute', before_execute)
+    try:
+        result = func()
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', before_execute)
+    return result, len(statements)
+
+def test_principal_cache_hit_without_query(cache):
+    """
+    测试缓存命中时不查询数据库，且不缓存密码哈希
+    """
+    cache.get(1)
+    db.session.remove()
+    
+    user, queries = count_queries(lambda: cache.get('1'))
+    
+    assert queries == 0
+    assert user.username == 'testuser'
+    assert cache.hits == 1
+    assert 'password_hash' not in cache._get_shared(1)
+    # 未缓存的列按需加载
+    assert user.check_password('Test1234')
+
+def test_principal_cache_invalidate(cache):
+    """
+    测试修改用户后失效缓存
+    """
+    cache.get(1)
+    User.query.get(1).reward_points = 110
+    db.session.commit()
+    cache.invalidate(1)
+    db.session.remove()
+    
+    assert cache.get(1).reward_points == 110
+    assert cache.misses == 2
+    assert cache.get(999) is None
+
+def test_accept_invitation_on_cached_user(cache):
+    """
+    测试被邀请者是缓存挂回的旧快照时，接受邀请的积分在数据库端累加，不覆盖并发的积分变化
+    """
+    from datetime import datetime, timedelta
+    from models.invitation_model import Invitation
+    from services.invitation_service import InvitationService
+    
+    inviter = User(username='inviter', email='inviter@example.com', reward_points=0)
+    inviter.set_password('Test1234')
+    db.session.add(inviter)
+    db.session.add(Invitation(
+        inviter_id=2, invite_code='CODE1234', status='pending', expires_at=datetime.now() + timedelta(days=1)
+    ))
+    db.session.commit()
+    cache.get(1)
+    db.session.remove()
+    
+    # 其他进程修改了积分，本进程的缓存仍是旧值
+    User.query.filter_by(id=1).update({User.reward_points: 50})
+    db.session.commit()
+    db.session.remove()
+    # 与请求中 get_current_user 返回的用户一样，快照在会话中保持到请求结束
+    invitee = cache.get(1)
+    assert invitee.reward_points == 10
+    
+    InvitationService.accept_invitation('CODE1234', 1)
+    db.session.remove()
+    assert User.query.get(1).reward_points == 150
+    assert User.query.get(2).reward_points == 100
\ No newline at end of file
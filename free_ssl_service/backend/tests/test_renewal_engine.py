@@ -0,0 +1,284 @@
+import os
+import stat
+import threading
+import time
+import redis
+from collections import Counter
+from datetime import datetime
+from services.issuance_backend import CertbotBackend, IssuanceBackend, IssuanceError
+from services.renewal_engine import RenewalEngine, RenewalItem, registered_domain
+from tests.test_cert_metadata import make_cert_pem
+
+FAKE_CERTBOT = '''#!/bin/sh
+# 模拟certbot：--cert-name为fail开头时失败
+while [ $# -gt 0 ]; do
+    if [ "$1" = "--cert-name" ]; then NAME="$2"; fi
+    shift
+done
+sleep 0.05
+case "$NAME" in
+    fail*) echo "challenge failed for $NAME" >&2; exit 1 ;;
+esac
+exit 0
+'''
+
+def make_engine(tmp_path, **kwargs):
+    """
+    创建使用假certbot的续期引擎
+    """
+    certbot = tmp_path / 'certbot'
+    certbot.write_text(FAKE_CERTBOT)
+    certbot.chmod(certbot.stat().st_mode | stat.S_IEXEC)
+    backend = CertbotBackend(str(certbot), str(tmp_path), str(tmp_path), str(tmp_path))
+    options = {'max_workers': 4, 'retry_base_delay': 0.01}
+    options.update(kwargs)
+    return RenewalEngine(backend, **options)
+
+def make_item(tmp_path, cert_id, name, email='owner@example.com'):
+    cert_path = tmp_path / 'live' / name
+    cert_path.mkdir(parents=True)
+    (cert_path / 'cert.pem').write_bytes(make_cert_pem([name]))
+    return RenewalItem(cert_id, name, email, [name], str(cert_path))
+
+def test_registered_domain():
+    """
+    测试注册域名计算
+    """
+    assert registered_domain('www.example.com') == 'example.com'
+    assert registered_domain('*.api.example.com') == 'example.com'
+    assert registered_domain('shop.example.co.uk') == 'example.co.uk'
+    assert registered_domain('example.com.cn') == 'example.com.cn'
+
+def test_renewal_engine_with_fake_certbot(tmp_path):
+    """
+    测试使用假certbot批量续期
+    """
+    engine = make_engine(tmp_path, max_attempts=2)
+    items = [make_item(tmp_path, i, f'site{i}.com') for i in range(6)]
+    items.append(make_item(tmp_path, 99, 'fail.com'))
+    
+    report = engine.run(items)
+    
+    assert len(report.succeeded) == 6
+    assert all(isinstance(r.expiry_date, datetime) for r in report.succeeded)
+    assert [r.cert_id for r in report.failed] == [99]
+    assert report.failed[0].attempts == 2
+    assert 'challenge failed' in report.failed[0].error
+    assert [(cert_id, attempt) for cert_id, attempt, _ in report.retries] == [(99, 2)]
+    assert report.to_dict()['total'] == 7
+
+class RecordingEngine(RenewalEngine):
+    """
+    记录并发情况的续期引擎
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.active_customers = Counter()
+        self.active_domains = Counter()
+        self.peak_customers = Counter()
+        self.peak_domains = Counter()
+        self.peak_total = 0
+    
+    def renew_one(self, item):
+        key = registered_domain(item.cert_name)
+        with self.lock:
+            self.active_customers[item.email] += 1
+            self.active_domains[key] += 1
+            self.peak_customers[item.email] = max(self.peak_customers[item.email], self.active_customers[item.email])
+            self.peak_domains[key] = max(self.peak_domains[key], self.active_domains[key])
+            self.peak_total = max(self.peak_total, sum(self.active_customers.values()))
+        time.sleep(0.02)
+        with self.lock:
+            self.active_customers[item.email] -= 1
+            self.active_domains[key] -= 1
+        return None
+
+def test_renewal_engine_concurrency_caps(tmp_path):
+    """
+    测试客户和注册域名的并发上限
+    """
+    engine = RecordingEngine(None, max_workers=6, per_customer_limit=3, per_domain_limit=2)
+    items = []
+    for i in range(30):
+        email = f'user{i % 3}@example.com'
+        name = f'host{i}.domain{i % 5}.com'
+        items.append(RenewalItem(i, name, email, [name], ''))
+    
+    report = engine.run(items)
+    
+    assert len(report.succeeded) == 30
+    assert engine.peak_total <= 6
+    assert max(engine.peak_customers.values()) <= 3
+    assert max(engine.peak_domains.values()) <= 2
+    assert engine.peak_total > 1
+
+class SharedLimits:
+    """
+    进程内模拟 CertbotGovernor 的集群名额（带租约）
+    """
+    
+    poll_interval = 0.005
+    
+    def __init__(self, lease_seconds=60.0, acquire_timeout=0.0):
+        self.lease_seconds = lease_seconds
+        self.acquire_timeout = acquire_timeout
+        self.lock = threading.Lock()
+        self.holders = {}  # key -> {token: 租约到期时间}
+        self.leases = []
+    
+    def _live(self, key):
+        now = time.monotonic()
+        holders = self.holders.setdefault(key, {})
+        for token in [token for token, expires in holders.items() if expires <= now]:
+            del holders[token]
+        return holders
+    
+    def try_acquire_limits(self, limits, token, lease_seconds=None):
+        with self.lock:
+            self.leases.append(lease_seconds)
+            if any(len(self._live(key)) >= limit for key, limit in limits.items()):
+                return False
+            for key in limits:
+                self.holders[key][token] = time.monotonic() + lease_seconds
+            return True
+    
+    def refresh_limits(self, keys, token, lease_seconds):
+        with self.lock:
+            for key in keys:
+                if token in self._live(key):
+                    self.holders[key][token] = time.monotonic() + lease_seconds
+    
+    def release_limits(self, keys, token):
+        with self.lock:
+            for key in keys:
+                self.holders.get(key, {}).pop(token, None)
+
+def run_shards(governor, count=2, per_shard=20):
+    """
+    多个分片（共享并发计数的 RecordingEngine）在各自的线程中同时续期，返回各分片的引擎和报告
+    """
+    shards = [
+        RecordingEngine(None, max_workers=6, per_customer_limit=3, per_domain_limit=2, governor=governor)
+        for _ in range(count)
+    ]
+    # 各分片共享同一组并发计数，模拟同一集群内的多个worker
+    for engine in shards[1:]:
+        for name in ('lock', 'active_customers', 'active_domains', 'peak_customers', 'peak_domains'):
+            setattr(engine, name, getattr(shards[0], name))
+    
+    reports = []
+    threads = []
+    for shard, engine in enumerate(shards):
+        items = []
+        for i in range(shard * per_shard, (shard + 1) * per_shard):
+            email = f'user{i % 2}@example.com'
+            name = f'host{i}.domain{i % 3}.com'
+            items.append(RenewalItem(i, name, email, [name], ''))
+        threads.append(threading.Thread(target=lambda engine=engine, items=items: reports.append(engine.run(items))))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return shards, reports
+
+def test_renewal_engine_cluster_caps(tmp_path):
+    """
+    测试多个分片同时续期时，客户和注册域名的并发上限在集群范围内生效
+    """
+    governor = SharedLimits()
+    shards, reports = run_shards(governor)
+    
+    assert sum(len(report.succeeded) for report in reports) == 40
+    assert max(shards[0].peak_customers.values()) <= 3
+    assert max(shards[0].peak_domains.values()) <= 2
+    assert all(not holders for holders in governor.holders.values())
+    assert set(governor.leases) == {60.0}
+
+def test_renewal_engine_refreshes_cluster_leases(tmp_path):
+    """
+    测试续期时间超过名额租约时引擎按时续租，集群上限不会因租约到期而失效
+    """
+    # 每次续期耗时0.02秒，超过名额的租约
+    governor = SharedLimits(lease_seconds=0.015)
+    shards, reports = run_shards(governor)
+    
+    assert sum(len(report.succeeded) for report in reports) == 40
+    assert max(shards[0].peak_customers.values()) <= 3
+    assert max(shards[0].peak_domains.values()) <= 2
+
+def test_renewal_engine_limit_lease_covers_batch():
+    """
+    测试名额租约覆盖等待certbot名额和整批续期的时间
+    """
+    governor = SharedLimits(lease_seconds=660, acquire_timeout=300)
+    engine = RenewalEngine(BatchingBackend('/tmp'), batch_size=20, governor=governor)
+    assert engine.limit_lease_seconds == 300 + 660 * 20
+
+class FlakyLimits(SharedLimits):
+    """
+    第二次占用名额时Redis不可用
+    """
+    
+    def try_acquire_limits(self, limits, token, lease_seconds=None):
+        if len(self.leases) == 1:
+            self.leases.append(lease_seconds)
+            raise redis.RedisError('connection reset')
+        return super().try_acquire_limits(limits, token, lease_seconds)
+
+def test_renewal_engine_releases_limits_after_redis_error():
+    """
+    测试Redis出错后退回本地上限，出错前已占用的集群名额仍被释放
+    """
+    governor = FlakyLimits()
+    engine = RecordingEngine(None, max_workers=2, governor=governor)
+    items = [RenewalItem(i, f'host{i}.example{i}.com', f'user{i}@example.com', [f'host{i}.example{i}.com'], '')
+             for i in range(4)]
+    
+    report = engine.run(items)
+    
+    assert len(report.succeeded) == 4
+    assert len(governor.leases) == 2
+    assert all(not holders for holders in governor.holders.values())
+
+class BatchingBackend(IssuanceBackend):
+    """
+    支持批量处理的假后端，记录每批的证书，fail开头的证书失败
+    """
+    
+    supports_batch = True
+    
+    def __init__(self, config_dir):
+        super().__init__(config_dir)
+        self.batches = []
+    
+    def issue(self, cert_name, domains, email):
+        raise AssertionError('batched backend should not be called per certificate')
+    
+    renew = issue
+    
+    def renew_many(self, requests):
+        self.batches.append([request.cert_name for request in requests])
+        return [
+            IssuanceError(f'challenge failed for {request.cert_name}') if request.cert_name.startswith('fail')
+            else self.lineage_path(request.cert_name)
+            for request in requests
+        ]
+
+def test_renewal_engine_batches_orders(tmp_path):
+    """
+    测试支持批量处理的后端按批续期，批内失败的证书单独重试
+    """
+    backend = BatchingBackend(str(tmp_path))
+    engine = RenewalEngine(backend, max_workers=2, max_attempts=2, retry_base_delay=0.01, batch_size=3)
+    items = [make_item(tmp_path, i, f'site{i}.com', email=f'user{i}@example.com') for i in range(5)]
+    items.append(make_item(tmp_path, 99, 'fail.com'))
+    
+    report = engine.run(items)
+    
+    assert backend.batches == [
+        ['site0.com', 'site1.com', 'site2.com'], ['site3.com', 'site4.com', 'fail.com'], ['fail.com']
+    ]
+    assert sorted(r.cert_id for r in report.succeeded) == [0, 1, 2, 3, 4]
+    assert [(r.cert_id, r.attempts) for r in report.failed] == [(99, 2)]
@@ -0,0 +1,327 @@
+import pytest
+from datetime import datetime, timedelta
+from app import app, db
+from models.user_model import User
+from models.cert_model import Certificate
+from models.scan_cursor_model import ScanCursor
+from services.scan_scheduler import BucketedScanScheduler, keyset_chunks, user_chunks
+
+@pytest.fixture
+def user():
+    """
+    创建测试数据库和用户
+    """
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    
+    with app.app_context():
+        db.create_all()
+        user = User(username='testuser', email='test@example.com')
+        user.set_password('Test1234')
+        db.session.add(user)
+        db.session.commit()
+        yield user
+        db.drop_all()
+
+def test_keyset_chunks_with_updates(user):
+    """
+    测试键集分页在处理过程中修改过滤列时不跳过也不重复
+    """
+    now = datetime.now()
+    for i in range(25):
+        # 多个证书使用相同的过期时间，验证 (expiry_date, id) 的并列处理
+        cert = Certificate(
+            user_id=user.id,
+            email=user.email,
+            expiry_date=now + timedelta(days=1 + i % 4),
+            free_expiry_date=now + timedelta(days=90),
+            cert_path=f'/etc/letsencrypt/live/site{i}.com'
+        )
+        cert.set_domains(f'site{i}.com')
+        db.session.add(cert)
+    db.session.commit()
+    
+    query = Certificate.query.filter(Certificate.notified_free_expiry == False)
+    seen = []
+    for certs in keyset_chunks(query, Certificate.expiry_date, chunk_size=10):
+        assert len(certs) <= 10
+        seen.extend(cert.id for cert in certs)
+        Certificate.query.filter(Certificate.id.in_([cert.id for cert in certs])).update(
+            {Certificate.notified_free_expiry: True}, synchronize_session=False
+        )
+        db.session.commit()
+    
+    assert sorted(seen) == list(range(1, 26))
+    assert Certificate.query.filter_by(notified_free_expiry=False).count() == 0
+
+def add_certs(user, count, **kwargs):
+    """
+    为用户创建证书（默认10天后过期）
+    """
+    now = datetime.now()
+    for i in range(count):
+        values = {'expiry_date': now + timedelta(days=10), 'free_expiry_date': now + timedelta(days=90)}
+        values.update(kwargs)
+        cert = Certificate(user_id=user.id, email=user.email, cert_path=f'/etc/letsencrypt/live/site{i}.com', **values)
+        cert.set_domains(f'site{i}.com')
+        db.session.add(cert)
+    db.session.commit()
+
+def all_certs(now):
+    return Certificate.query
+
+def test_bucketed_scheduler_advance_and_wrap(user):
+    """
+    测试分桶依次推进，回绕时开始新一轮，一轮内每个证书只处理一次
+    """
+    add_certs(user, 7)
+    scheduler = BucketedScanScheduler(buckets=3, tick_limit=100, chunk_size=2)
+    seen = []
+    
+    for bucket in range(3):
+        scheduler.run('test', all_certs, lambda certs: seen.append([cert.id for cert in certs]))
+        cursor = ScanCursor.query.get('test')
+        assert (cursor.bucket, cursor.last_id) == ((bucket + 1) % 3, 0)
+        assert cursor.locked_by is None
+    
+    # 每个分桶是 id % 3 相同的证书，按ID顺序分批
+    assert seen == [[3, 6], [1, 4], [7], [2, 5]]
+    started = ScanCursor.query.get('test').cycle_started_at
+    scheduler.run('test', all_certs, lambda certs: seen.append([cert.id for cert in certs]))
+    assert seen[-1] == [3, 6]
+    assert ScanCursor.query.get('test').cycle_started_at == started
+
+def test_bucketed_scheduler_resume_after_crash(user):
+    """
+    测试批次之间崩溃后从游标处继续，已提交的批次不会重复处理
+    """
+    add_certs(user, 10)
+    scheduler = BucketedScanScheduler(buckets=1, tick_limit=100, chunk_size=3)
+    seen = []
+    
+    def crash_on_second_chunk(certs):
+        if seen:
+            raise RuntimeError('worker lost')
+        seen.extend(cert.id for cert in certs)
+    
+    with pytest.raises(RuntimeError):
+        scheduler.run('test', all_certs, crash_on_second_chunk)
+    cursor = ScanCursor.query.get('test')
+    assert (cursor.bucket, cursor.last_id, cursor.locked_by) == (0, 3, None)
+    
+    scheduler.run('test', all_certs, lambda certs: seen.extend(cert.id for cert in certs))
+    assert seen == list(range(1, 11))
+    
+    # 每个节拍的处理量有上限，下个节拍继续处理同一分桶
+    limited = BucketedScanScheduler(buckets=1, tick_limit=4, chunk_size=3)
+    seen.clear()
+    limited.run('limited', all_certs, lambda certs: seen.extend(cert.id for cert in certs))
+    assert seen == [1, 2, 3, 4]
+    assert ScanCursor.query.get('limited').last_id == 4
+    limited.run('limited', all_certs, lambda certs: seen.extend(cert.id for cert in certs))
+    assert seen == list(range(1, 9))
+
+def test_bucketed_scheduler_lease(user):
+    """
+    测试同一扫描已有运行持有租约时跳过，租约到期（持有者崩溃）后可以接管
+    """
+    add_certs(user, 3)
+    scheduler = BucketedScanScheduler(buckets=1, tick_limit=100, chunk_size=10)
+    holder = ScanCursor.acquire('test', 60)
+    seen = []
+    
+    assert scheduler.run('test', all_certs, seen.extend) == 'Scan test is already running'
+    assert seen == []
+    
+    ScanCursor.query.filter_by(name='test').update({ScanCursor.locked_until: datetime.now() - timedelta(seconds=1)})
+    db.session.commit()
+    scheduler.run('test', all_certs, seen.extend)
+    assert len(seen) == 3
+    # 被接管的运行不能再写回游标
+    assert not holder.save(60)
+
+def test_scan_tick_and_bucket(user, monkeypatch):
+    """
+    测试节拍任务为每类扫描派发分桶任务，分桶任务从游标处处理证书
+    """
+    import tasks
+    
+    # 直接调用任务会推入新的应用上下文，退出时移除会话，先准备好数据
+    add_certs(user, 5)
+    dispatched = []
+    monkeypatch.setattr(tasks.scan_bucket, 'apply_async', lambda args, countdown: dispatched.append(args[0]))
+    tasks.scan_tick()
+    assert sorted(dispatched) == sorted(tasks.SCANS)
+    
+    sent = []
+    monkeypatch.setattr(tasks.EmailService, 'send_certificate_expiry_notification',
+                        lambda user, cert: sent.append(cert.id))
+    monkeypatch.setitem(app.config, 'SCAN_BUCKETS', 2)
+    
+    assert tasks.scan_bucket('certificate_expiry') == 'Scanned 2 certificates for certificate_expiry in bucket 0'
+    assert tasks.scan_bucket('certificate_expiry') == 'Scanned 3 certificates for certificate_expiry in bucket 1'
+    assert sorted(sent) == [1, 2, 3, 4, 5]
+    assert Certificate.query.filter_by(notified_free_expiry=False).count() == 0
+
+def test_scan_shard_and_aggregate(user, monkeypatch):
+    """
+    测试分片扫描只处理ID范围内的证书，并汇总各分片计数
+    """
+    import tasks
+    
+    sent = []
+    monkeypatch.setattr(tasks.EmailService, 'send_certificate_expiry_notification',
+                        lambda user, cert: sent.append(cert.id))
+    now = datetime.now()
+    for i in range(10):
+        cert = Certificate(
+            user_id=user.id,
+            email=user.email,
+            expiry_date=now + timedelta(days=10),
+            free_expiry_date=now + timedelta(days=90),
+            cert_path=f'/etc/letsencrypt/live/site{i}.com'
+        )
+        cert.set_domains(f'site{i}.com')
+        db.session.add(cert)
+    db.session.commit()
+    
+    first = tasks.scan_shard('certificate_expiry', 1, 6, now.isoformat())
+    second = tasks.scan_shard('certificate_expiry', 6, 11, now.isoformat())
+    
+    assert first == {'checked': 5, 'succeeded': 5, 'failed': 0, 'retries': 0}
+    assert sorted(sent) == list(range(1, 11))
+    assert tasks.aggregate_scan_results([first, second], 'certificate_expiry', now.isoformat()) == \
+        'Checked 10 expiring certificates, notified 10'
+
+def test_free_expiry_ledger(user, monkeypatch):
+    """
+    测试免费期提醒按阈值只发送一次，已提醒的证书不会被重新扫描
+    """
+    import tasks
+    from models.notification_model import Notification
+    
+    sent = []
+    monkeypatch.setattr(tasks.EmailService, 'send_free_expiry_notification',
+                        lambda user, cert: sent.append(cert.id))
+    now = datetime.now()
+    for i, days in enumerate([20, 5, 60]):
+        cert = Certificate(
+            user_id=user.id,
+            email=user.email,
+            expiry_date=now + timedelta(days=90),
+            free_expiry_date=now + timedelta(days=days),
+            cert_path=f'/etc/letsencrypt/live/site{i}.com'
+        )
+        cert.set_domains(f'site{i}.com')
+        db.session.add(cert)
+    db.session.commit()
+    
+    assert tasks.scan_shard('free_expiry', 1, 4, now.isoformat())['succeeded'] == 2
+    assert tasks.scan_shard('free_expiry', 1, 4, now.isoformat())['checked'] == 0
+    
+    # 两周后第一张证书进入7天阈值
+    later = now + timedelta(days=14)
+    assert tasks.scan_shard('free_expiry', 1, 4, later.isoformat())['succeeded'] == 1
+    assert sent == [2, 1, 1]
+    assert sorted((n.certificate_id, n.threshold) for n in Notification.query.all()) == [(1, 7), (1, 30), (2, 7)]
+
+def test_user_chunks_keep_users_together(user):
+    """
+    测试按用户分页时每个用户的证书都在同一批中
+    """
+    other = User(username='other', email='other@example.com')
+    other.set_password('Test1234')
+    db.session.add(other)
+    db.session.commit()
+    now = datetime.now()
+    for owner, count in ((user, 6), (other, 3)):
+        for i in range(count):
+            cert = Certificate(
+                user_id=owner.id,
+                email=owner.email,
+                expiry_date=now + timedelta(days=10 + i),
+                free_expiry_date=now + timedelta(days=90),
+                cert_path=f'/etc/letsencrypt/live/{owner.username}{i}.com'
+            )
+            cert.set_domains(f'{owner.username}{i}.com')
+            db.session.add(cert)
+    db.session.commit()
+    
+    chunks = list(user_chunks(Certificate.query, Certificate.expiry_date, chunk_size=4))
+    
+    assert [[cert.user_id for cert in certs] for certs in chunks] == [[user.id] * 6, [other.id] * 3]
+
+def test_free_expiry_digest(user, monkeypatch):
+    """
+    测试摘要模式下每个用户只写入一封邮件
+    """
+    import tasks
+    
+    digests = []
+    monkeypatch.setitem(app.config, 'EXPIRY_NOTIFICATION_MODE', 'digest')
+    # 任务退出时会移除会话，在回调中记下ID而不是保留ORM对象
+    monkeypatch.setattr(tasks.EmailService, 'send_free_expiry_digests', lambda groups: digests.extend(
+        (owner.id, [cert.id for cert in certs]) for owner, certs in groups
+    ))
+    now = datetime.now()
+    for i in range(5):
+        cert = Certificate(
+            user_id=user.id,
+            email=user.email,
+            expiry_date=now + timedelta(days=90),
+            free_expiry_date=now + timedelta(days=5 + i),
+            cert_path=f'/etc/letsencrypt/live/site{i}.com'
+        )
+        cert.set_domains(f'site{i}.com')
+        db.session.add(cert)
+    db.session.commit()
+    
+    counts = tasks.digest_shard('free_expiry', user.id, user.id + 1, now.isoformat())
+    
+    assert counts['succeeded'] == 5
+    assert digests == [(1, [1, 2, 3, 4, 5])]
+
+def test_bucketed_digest_groups_by_user(user, monkeypatch):
+    """
+    测试分桶调度的摘要模式按用户分桶，每个用户每轮只收到一封摘要邮件
+    """
+    import tasks
+    
+    other = User(username='other', email='other@example.com')
+    other.set_password('Test1234')
+    db.session.add(other)
+    db.session.commit()
+    # 两个用户的证书ID交错，按证书ID分桶会把同一用户的证书分到不同的桶
+    for i in range(3):
+        add_certs(user, 1, free_expiry_date=datetime.now() + timedelta(days=5))
+        add_certs(other, 1, free_expiry_date=datetime.now() + timedelta(days=5))
+    
+    digests = []
+    monkeypatch.setitem(app.config, 'EXPIRY_NOTIFICATION_MODE', 'digest')
+    monkeypatch.setitem(app.config, 'SCAN_BUCKETS', 3)
+    monkeypatch.setattr(tasks.EmailService, 'send_free_expiry_digests', lambda groups: digests.extend(
+        (owner.id, [cert.id for cert in certs]) for owner, certs in groups
+    ))
+    
+    for bucket in range(3):
+        tasks.scan_bucket('free_expiry')
+    assert sorted(digests) == [(1, [1, 3, 5]), (2, [2, 4, 6])]
+
+def test_digest_failure_rolls_back(user, monkeypatch):
+    """
+    测试写入摘要邮件失败时回滚已写入的部分，证书不被标记为已提醒
+    """
+    import tasks
+    from models.notification_model import Notification
+    
+    def partial_failure(groups):
+        db.session.add(Notification(certificate_id=1, kind=Notification.KIND_FREE_EXPIRY, threshold=7))
+        raise RuntimeError('template error')
+    
+    add_certs(user, 2, free_expiry_date=datetime.now() + timedelta(days=5))
+    monkeypatch.setitem(app.config, 'EXPIRY_NOTIFICATION_MODE', 'digest')
+    monkeypatch.setattr(tasks.EmailService, 'send_free_expiry_digests', partial_failure)
+    
+    certs = tasks.free_expiry_certs_query(datetime.now()).all()
+    assert tasks.notify_free_expiry_certs(certs) == 0
+    assert Notification.query.count() == 0
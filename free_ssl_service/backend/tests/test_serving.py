@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until_ready(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+def run_load(port, path='/api/health', concurrency=32, requests_per_client=200):
+    """
+    压测：concurrency 个客户端各自复用一个keep-alive连接发送请求
+    
+    Returns:
+        dict: rps、p50、p99（秒）和错误数
+    """
+    def client(_):
+        latencies, errors = [], 0
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            latencies.append(time.perf_counter() - started)
+        conn.close()
+        return latencies, errors
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    
+    latencies = sorted(latency for result in results for latency in result[0])
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[int(len(latencies) * 0.99) - 1],
+        'errors': sum(result[1] for result in results)
+    }
+
+def serve(command, port, env=None):
+    process = subprocess.Popen(
+        command, cwd=BACKEND_DIR, env=dict(os.environ, **(env or {})),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_ready(port, process)
+        run_load(port, requests_per_client=10)  # 预热
+        return run_load(port)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+@pytest.mark.slow
+@pytest.mark.integration
+def test_gunicorn_outperforms_development_server():
+    """
+    基准：同一接口分别由Flask开发服务器（原 python app.py 方式）和 gunicorn 预加载多worker提供，
+    比较吞吐量和p99延迟；需要可连接的数据库和Redis，并已执行 python -m migrations.create_schema 建表
+    """
+    pytest.importorskip('gunicorn')
+    
+    port = free_port()
+    dev = serve([sys.executable, '-c', f"from app import app; app.run(port={port})"], port)
+    
+    results = {'development': dev}
+    for worker_class in ('sync', 'gthread'):
+        port = free_port()
+        results[worker_class] = serve(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}'],
+            port,
+            {
+                'GUNICORN_WORKER_CLASS': worker_class,
+                'GUNICORN_WORKERS': '4',
+                'GUNICORN_MAX_REQUESTS': '0',  # 压测期间不回收worker
+                'GUNICORN_ACCESS_LOG': ''
+            }
+        )
+    
+    for name, result in results.items():
+        print(f"\n{name}: {result['rps']:.0f} req/s, p50 {result['p50'] * 1000:.1f} ms, "
+              f"p99 {result['p99'] * 1000:.1f} ms, {result['errors']} errors")
+    
+    assert results['sync']['errors'] == results['gthread']['errors'] == 0
+    assert results['gthread']['rps'] > dev['rps']
+    assert results['gthread']['p99'] < dev['p99']
@@ -0,0 +1,63 @@
+import os
+import sys
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只有Web进程需要的模块，Celery worker/beat 启动时不应导入
+WEB_ONLY_MODULES = ('flasgger', 'flask_limiter', 'flask_wtf', 'flask_cors', 'flask_restful', 'routes.auth_routes')
+
+# worker 启动时导入模块的总耗时上限（秒），可通过环境变量调整以适应较慢的CI机器
+WORKER_IMPORT_BUDGET = float(os.getenv('WORKER_IMPORT_BUDGET', '3.0'))
+
+def import_profile(statement):
+    """
+    在新进程中以 python -X importtime 执行语句
+    
+    Returns:
+        dict: 模块名 -> 自身导入耗时（微秒）
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, _, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        if self_us.isdigit():
+            modules[name] = int(self_us)
+    return modules
+
+def total_seconds(modules):
+    return sum(modules.values()) / 1000000
+
+def test_worker_startup_skips_web_stack():
+    """
+    测试 celery -A app.celery 只创建worker角色的应用，不导入Swagger、限流、CSRF和路由
+    """
+    worker = import_profile('import app; app.celery')
+    
+    assert [name for name in WEB_ONLY_MODULES if name in worker] == []
+    # 任务模块由worker启动时按 CELERY_IMPORTS 导入
+    assert 'tasks' not in worker
+
+def test_import_time_budget():
+    """
+    基准：分别统计Web和worker角色启动时的导入耗时，worker应明显更少且不超过预算
+    """
+    bare = import_profile('import app')
+    web = import_profile('import app; app.app')
+    worker = import_profile('import app; app.celery')
+    
+    print(f"\nimport app: {total_seconds(bare):.3f}s, web: {total_seconds(web):.3f}s, "
+          f"worker: {total_seconds(worker):.3f}s")
+    slowest = sorted(worker.items(), key=lambda item: item[1], reverse=True)[:10]
+    for name, self_us in slowest:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+    
+    assert set(WEB_ONLY_MODULES) <= set(web)
+    assert 'celery' not in bare and 'flasgger' not in bare
+    assert total_seconds(worker) < total_seconds(web)
+    assert total_seconds(worker) < WORKER_IMPORT_BUDGET
@@ -0,0 +1,129 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import dsa, ec, ed25519, ed448, rsa
+
+class CertMetadata(NamedTuple):
+    """证书元数据（时间均为UTC naive datetime，与openssl输出一致）"""
+    not_before: datetime
+    not_after: datetime
+    subject: str
+    issuer: str
+    sans: List[str]
+    key_type: str
+    fingerprint: str  # SHA-256，小写十六进制
+
+def _key_type(public_key) -> str:
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return f'RSA-{public_key.key_size}'
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        return f'EC-{public_key.curve.name}'
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return 'Ed25519'
+    if isinstance(public_key, ed448.Ed448PublicKey):
+        return 'Ed448'
+    if isinstance(public_key, dsa.DSAPublicKey):
+        return f'DSA-{public_key.key_size}'
+    return type(public_key).__name__
+
+def parse_cert_pem(data: bytes) -> CertMetadata:
+    """
+    一次性解析PEM证书的全部元数据
+    
+    Args:
+        data: PEM格式证书内容（fullchain时只解析第一张证书）
+    
+    Returns:
+        CertMetadata: 证书元数据
+    
+    Raises:
+        ValueError: 证书内容无法解析
+    """
+    cert = x509.load_pem_x509_certificate(data)
+    
+    try:
+        san_ext = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName)
+        sans = san_ext.value.get_values_for_type(x509.DNSName)
+    except x509.ExtensionNotFound:
+        sans = []
+    
+    return CertMetadata(
+        not_before=cert.not_valid_before,
+        not_after=cert.not_valid_after,
+        subject=cert.subject.rfc4514_string(),
+        issuer=cert.issuer.rfc4514_string(),
+        sans=sans,
+        key_type=_key_type(cert.public_key()),
+        fingerprint=cert.fingerprint(hashes.SHA256()).hex()
+    )
+
+class CertMetadataCache:
+    """
+    证书元数据缓存，以(路径, inode, mtime)为键
+    
+    certbot续期时会替换live目录下的符号链接，inode或mtime随之变化，
+    旧条目自然失效，无需显式清理。
+    """
+    
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, cert_file: str) -> CertMetadata:
+        """
+        获取证书元数据，文件未变化时直接返回缓存结果
+        
+        Args:
+            cert_file: 证书文件路径
+        
+        Returns:
+            CertMetadata: 证书元数据
+        
+        Raises:
+            FileNotFoundError: 证书文件不存在
+            ValueError: 证书内容无法解析
+        """
+        st = os.stat(cert_file)
+        key = (cert_file, st.st_ino, st.st_mtime_ns)
+        
+        with self._lock:
+            metadata = self._entries.get(key)
+            if metadata is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return metadata
+            self.misses += 1
+        
+        with open(cert_file, 'rb') as f:
+            metadata = parse_cert_pem(f.read())
+        
+        with self._lock:
+            self._entries[key] = metadata
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return metadata
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+metadata_cache = CertMetadataCache()
+
+def get_cert_metadata(cert_file: str, cache: Optional[CertMetadataCache] = None) -> CertMetadata:
+    """
+    读取证书元数据（默认使用进程级缓存）
+    """
+    return (cache or metadata_cache).get(cert_file)
@@ -10,9 +10,12 @@ def handle_error(error):
         'error': str(error)
     }
     
+    headers = {}
     if isinstance(error, HTTPException):
         response['error'] = error.description
         status_code = error.code
+        # 保留 Retry-After 等提示客户端重试的响应头
+        headers = {name: value for name, value in error.get_headers() if name != 'Content-Type'}
     else:
         response['error'] = 'Internal server error'
         status_code = 500
@@ -22,7 +25,7 @@ def handle_error(error):
     if os.getenv('FLASK_ENV') == 'development':
         response['traceback'] = traceback.format_exc()
     
-    return jsonify(response), status_code
+    return jsonify(response), status_code, headers
 
 def register_error_handlers(app):
     """
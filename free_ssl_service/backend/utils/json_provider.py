@@ -0,0 +1,87 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # 未安装时使用标准库
+    orjson = None
+
+BACKENDS = ('orjson', 'stdlib')
+
+def _default(obj):
+    # 与 orjson 原生输出一致：日期时间为ISO 8601，Decimal 转为浮点数
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, UUID):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class JSONProvider:
+    """
+    API响应的JSON序列化
+    
+    优先使用 orjson（C实现，原生序列化 datetime），未安装或配置为 stdlib 时使用标准库 json，
+    两者输出的数据相同：键排序遵循 JSON_SORT_KEYS，datetime 输出为 isoformat()。
+    批量序列化器（如 Certificate.serialize_many）直接返回 datetime，由这里统一编码，
+    不再逐行调用 isoformat()。
+    
+    Flask 2.0 还没有可替换的 JSON provider，路由通过本模块的 jsonify 使用它。
+    """
+    
+    def __init__(self, backend: str = 'orjson', sort_keys: bool = True, ensure_ascii: bool = True):
+        self.configure(backend, sort_keys, ensure_ascii)
+    
+    def init_app(self, app) -> None:
+        self.configure(
+            app.config.get('JSON_PROVIDER', 'orjson'),
+            app.config.get('JSON_SORT_KEYS', True),
+            app.config.get('JSON_AS_ASCII', True)
+        )
+    
+    def configure(self, backend: str, sort_keys: bool, ensure_ascii: bool) -> None:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unsupported JSON provider: {backend}")
+        self.backend = backend if backend == 'stdlib' or orjson is not None else 'stdlib'
+        self.sort_keys = sort_keys
+        self.ensure_ascii = ensure_ascii
+        if self.backend == 'orjson':
+            # orjson 始终输出UTF-8，不转义非ASCII字符
+            self._option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+    
+    def dumps(self, obj) -> bytes:
+        if self.backend == 'orjson':
+            return orjson.dumps(obj, default=_default, option=self._option)
+        return json.dumps(
+            obj, default=_default, sort_keys=self.sort_keys, ensure_ascii=self.ensure_ascii,
+            separators=(',', ':')
+        ).encode()
+    
+    def loads(self, data):
+        if self.backend == 'orjson':
+            return orjson.loads(data)
+        return json.loads(data)
+    
+    def response(self, data):
+        return current_app.response_class(
+            self.dumps(data) + b'\n',
+            mimetype=current_app.config.get('JSONIFY_MIMETYPE', 'application/json')
+        )
+
+json_provider = JSONProvider()
+
+def jsonify(*args, **kwargs):
+    """
+    与 flask.jsonify 用法相同，使用 json_provider 序列化
+    """
+    if args and kwargs:
+        raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+    if len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+    return json_provider.response(data)
@@ -0,0 +1,122 @@
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+from flask import current_app, request, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import and_, or_
+from utils.json_provider import jsonify
+
+class Page(NamedTuple):
+    """一页结果及下一页的游标（没有下一页时为None）"""
+    items: List
+    next_cursor: Optional[str]
+
+def parse_limit(value: Optional[str], default: int, maximum: int) -> int:
+    """
+    解析每页数量，超过上限时取上限
+    
+    Raises:
+        ValueError: 不是正整数
+    """
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be a positive integer")
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, maximum)
+
+def parse_fields(value: Optional[str], allowed: Iterable[str]) -> Optional[Tuple[str, ...]]:
+    """
+    解析逗号分隔的 fields 参数，未指定时返回None（全部字段）
+    
+    Raises:
+        ValueError: 包含不支持的字段
+    """
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields or None
+
+def parse_datetime(value: Optional[str], name: str) -> Optional[datetime]:
+    """
+    解析ISO 8601时间参数
+    
+    Raises:
+        ValueError: 格式无效
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 datetime")
+
+def _serializer(salt: str) -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt=salt)
+
+def encode_cursor(sort_value: datetime, row_id: int, salt: str) -> str:
+    """
+    生成不透明的游标：签名后的 (排序值, ID)，客户端无法构造或篡改
+    """
+    return _serializer(salt).dumps([sort_value.isoformat(), row_id])
+
+def decode_cursor(cursor: str, salt: str) -> Tuple[datetime, int]:
+    """
+    Raises:
+        ValueError: 游标无效
+    """
+    try:
+        sort_value, row_id = _serializer(salt).loads(cursor)
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (BadSignature, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+def keyset_page(query, sort_column, id_column, cursor: Optional[str], limit: int, salt: str) -> Page:
+    """
+    按 (sort_column, id_column) 倒序做键集分页
+    
+    游标之后的数据用 (sort < v) OR (sort = v AND id < id0) 定位，配合
+    (过滤列, sort_column, id_column) 复合索引，每一页都是一次索引范围扫描，
+    不随页码变深而变慢。多查一行以判断是否还有下一页。
+    
+    Args:
+        query: 已加过滤条件的查询，结果行需包含两个排序列
+        sort_column: 排序列（不能为空）
+        id_column: 主键列，排序值相同时保证顺序稳定
+        cursor: 上一页返回的游标
+        limit: 每页数量
+        salt: 游标签名的盐，不同列表的游标不能混用
+    
+    Returns:
+        Page: 当前页及下一页游标
+    
+    Raises:
+        ValueError: 游标无效
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, salt)
+        query = query.filter(or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, id_column < row_id)
+        ))
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return Page(rows, None)
+    last = rows[limit - 1]
+    return Page(rows[:limit], encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key), salt))
+
+def page_response(items: List, next_cursor: Optional[str]):
+    """
+    JSON数组响应，下一页游标放在 X-Next-Cursor 和 Link 响应头中，响应体格式与不分页时相同
+    """
+    response = jsonify(items)
+    if next_cursor:
+        args = dict(request.args, cursor=next_cursor)
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(request.endpoint, **request.view_args, **args)}>; rel="next"'
+    return response
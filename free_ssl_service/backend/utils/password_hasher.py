@@ -0,0 +1,232 @@
+import os
+import hmac
+import hashlib
+import secrets
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+SCHEMES = ('pbkdf2', 'scrypt', 'argon2')
+
+# 主机级的并发哈希名额，池进程启动时由 _init_pool 设置（见 PasswordHasher.share）
+_host_slots = None
+
+def _init_pool(host_slots) -> None:
+    global _host_slots
+    _host_slots = host_slots
+
+def _run_limited(func, *args):
+    if _host_slots is None:
+        return func(*args)
+    with _host_slots:
+        return func(*args)
+
+def _scrypt_hex(password: str, salt: str, n: int, r: int, p: int) -> str:
+    return hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=132 * n * r * p).hex()
+
+def _argon2_hasher(params: Dict):
+    from argon2 import PasswordHasher as Argon2Hasher
+    return Argon2Hasher(
+        time_cost=params.get('time_cost', 3),
+        memory_cost=params.get('memory_cost', 65536),
+        parallelism=params.get('parallelism', 4)
+    )
+
+def hash_password(password: str, scheme: str, params: Dict) -> str:
+    """
+    按指定算法生成密码哈希（在进程池中执行，需为模块级函数）
+    
+    pbkdf2 使用 werkzeug 的格式，scrypt 使用与新版 werkzeug 相同的 scrypt:n:r:p$salt$hash 格式，
+    argon2 使用 argon2-cffi 的 PHC 格式。
+    """
+    if scheme == 'pbkdf2':
+        return generate_password_hash(password, method=f"pbkdf2:sha256:{params['iterations']}", salt_length=16)
+    if scheme == 'scrypt':
+        n, r, p = params['n'], params['r'], params['p']
+        salt = secrets.token_hex(8)
+        return f'scrypt:{n}:{r}:{p}${salt}${_scrypt_hex(password, salt, n, r, p)}'
+    if scheme == 'argon2':
+        return _argon2_hasher(params).hash(password)
+    raise ValueError(f"Unsupported password hash scheme: {scheme}")
+
+def verify_password(pwhash: str, password: str) -> bool:
+    """
+    校验密码，根据哈希前缀识别算法，兼容 werkzeug 生成的历史哈希
+    """
+    if pwhash.startswith('$argon2'):
+        from argon2.exceptions import InvalidHash, VerificationError
+        try:
+            return _argon2_hasher({}).verify(pwhash, password)
+        except (VerificationError, InvalidHash):
+            return False
+    if pwhash.startswith('scrypt:'):
+        try:
+            method, salt, expected = pwhash.split('$', 2)
+            n, r, p = (int(value) for value in method.split(':')[1:4])
+        except ValueError:
+            return False
+        return hmac.compare_digest(_scrypt_hex(password, salt, n, r, p), expected)
+    return check_password_hash(pwhash, password)
+
+class PasswordHasher:
+    """
+    密码哈希服务
+    
+    哈希和校验在有界的进程池中执行，不占用请求线程的CPU，登录高峰时其他请求不受影响。
+    排队和执行中的任务数达到 max_pending 时立即返回503（带 Retry-After），而不是无限排队；
+    workers 为0时在当前线程中执行（用于测试和单进程工具）。
+    
+    workers 和 max_pending 是整台主机的预算：gunicorn 主进程在fork worker之前调用 share()，
+    由各web worker平分，主机上同时执行的哈希数不随 gunicorn worker 数成倍增长。
+    进程池在每个进程首次使用时以 forkserver 方式创建，不从已启动请求线程的进程直接fork。
+    """
+    
+    def __init__(self, scheme: str = 'pbkdf2', params: Optional[Dict] = None, workers: int = 0,
+                 max_pending: int = 64, timeout: float = 10.0, retry_after: int = 1):
+        self.scheme = scheme
+        self.params = params or {'iterations': 260000}
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._pool = None
+        self._slots = None
+        self._pid = None
+        self._host_slots = None
+        self._lock = threading.Lock()
+    
+    def init_app(self, app) -> None:
+        config = app.config
+        self.scheme = config.get('PASSWORD_HASH_SCHEME', self.scheme)
+        if self.scheme not in SCHEMES:
+            raise ValueError(f"Unsupported password hash scheme: {self.scheme}")
+        self.params = {
+            'pbkdf2': lambda: {'iterations': config['PASSWORD_PBKDF2_ITERATIONS']},
+            'scrypt': lambda: {
+                'n': config['PASSWORD_SCRYPT_N'],
+                'r': config['PASSWORD_SCRYPT_R'],
+                'p': config['PASSWORD_SCRYPT_P']
+            },
+            'argon2': lambda: {
+                'time_cost': config['PASSWORD_ARGON2_TIME_COST'],
+                'memory_cost': config['PASSWORD_ARGON2_MEMORY_COST'],
+                'parallelism': config['PASSWORD_ARGON2_PARALLELISM']
+            },
+        }[self.scheme]()
+        self.workers = config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self.timeout = config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self.shutdown()
+    
+    def share(self, processes: int) -> None:
+        """
+        在同一主机上的多个进程之间平分进程池和排队上限（gunicorn 主进程fork worker之前调用一次）
+        
+        进程数多于哈希预算时（默认配置下 gunicorn worker 数为 2*CPU+1，预算为CPU数），
+        每个进程仍各有一个池进程，但同时执行的哈希数由在此创建、被各worker继承的跨进程信号量
+        限制在预算之内，其余哈希在池进程中等待名额。
+        
+        Args:
+            processes: 共享预算的进程数，即 gunicorn worker 数
+        """
+        if self.workers and processes > self.workers:
+            # 与池进程相同的 forkserver 上下文创建，才能传给池进程
+            self._host_slots = multiprocessing.get_context('forkserver').BoundedSemaphore(self.workers)
+            self.workers = 1
+        elif self.workers:
+            self.workers //= processes
+        self.max_pending = max(1, self.max_pending // processes)
+        self.shutdown()
+    
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # gthread worker 中从多线程进程fork不安全，由单独的forkserver进程创建池进程；
+                # forkserver 只预加载本模块（不导入 __main__），池进程只执行纯计算函数，不会导入应用
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context,
+                    initializer=_init_pool, initargs=(self._host_slots,)
+                )
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._pid = os.getpid()
+            return self._pool, self._slots
+    
+    def _busy(self) -> ServiceUnavailable:
+        return ServiceUnavailable(
+            'Too many concurrent password operations. Please retry shortly.',
+            retry_after=self.retry_after
+        )
+    
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        
+        pool, slots = self._get_pool()
+        if not slots.acquire(blocking=False):
+            self.rejected += 1
+            raise self._busy()
+        try:
+            future = pool.submit(_run_limited, func, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self.shutdown()
+            raise self._busy()
+        # 任务真正结束时才释放名额，超时返回的请求不会让排队数超过上限
+        future.add_done_callback(lambda _: slots.release())
+        
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise self._busy()
+        except BrokenProcessPool:
+            self.shutdown()
+            raise self._busy()
+    
+    def hash(self, password: str) -> str:
+        """
+        生成密码哈希
+        
+        Raises:
+            ServiceUnavailable: 进程池繁忙
+        """
+        return self._run(hash_password, password, self.scheme, self.params)
+    
+    def verify(self, pwhash: str, password: str) -> bool:
+        """
+        校验密码
+        
+        Raises:
+            ServiceUnavailable: 进程池繁忙
+        """
+        if not pwhash:
+            return False
+        return self._run(verify_password, pwhash, password)
+    
+    def needs_rehash(self, pwhash: str) -> bool:
+        """
+        哈希的算法或参数与当前配置不一致时返回True，登录成功后据此透明地升级哈希
+        """
+        if self.scheme == 'argon2':
+            return not pwhash.startswith('$argon2') or _argon2_hasher(self.params).check_needs_rehash(pwhash)
+        if self.scheme == 'scrypt':
+            prefix = f"scrypt:{self.params['n']}:{self.params['r']}:{self.params['p']}$"
+        else:
+            prefix = f"pbkdf2:sha256:{self.params['iterations']}$"
+        return not pwhash.startswith(prefix)
+    
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(wait=False)
+            self._pool = None
+            self._slots = None
+            self._pid = None
+
+password_hasher = PasswordHasher()
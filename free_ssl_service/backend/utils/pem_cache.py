@@ -0,0 +1,103 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+class PemMaterial(NamedTuple):
+    """证书目录下的PEM文件内容"""
+    certificate: str
+    private_key: str
+    chain: str
+
+class PemMaterialCache:
+    """
+    PEM文件内容缓存，按总字节数做LRU淘汰
+    
+    每次读取都会stat三个文件，(inode, mtime, size)任一变化即视为已续期并重新读取；
+    live目录下是指向archive的符号链接，os.stat会跟随链接，续期后自然失效。
+    """
+    
+    FILES = ('cert.pem', 'privkey.pem', 'chain.pem')
+    
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # cert_path -> (signature, material, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def init_app(self, app) -> None:
+        self.max_bytes = app.config.get('PEM_CACHE_MAX_BYTES', self.max_bytes)
+    
+    def _signature(self, cert_path: str) -> tuple:
+        signature = []
+        for name in self.FILES:
+            st = os.stat(os.path.join(cert_path, name))
+            signature.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+    
+    def get(self, cert_path: str) -> PemMaterial:
+        """
+        获取证书目录的PEM内容
+        
+        Args:
+            cert_path: 证书存放路径
+        
+        Returns:
+            PemMaterial: 证书、私钥和证书链
+        
+        Raises:
+            FileNotFoundError: 任一PEM文件不存在
+        """
+        signature = self._signature(cert_path)
+        
+        with self._lock:
+            entry = self._entries.get(cert_path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(cert_path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        
+        contents = []
+        for name in self.FILES:
+            with open(os.path.join(cert_path, name)) as f:
+                contents.append(f.read())
+        material = PemMaterial(*contents)
+        size = sum(len(content) for content in contents)
+        
+        with self._lock:
+            self._discard(cert_path)
+            if size <= self.max_bytes:
+                self._entries[cert_path] = (signature, material, size)
+                self._size += size
+                while self._size > self.max_bytes:
+                    _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                    self._size -= evicted_size
+        return material
+    
+    def invalidate(self, cert_path: str) -> None:
+        with self._lock:
+            self._discard(cert_path)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+    
+    def _discard(self, cert_path: str) -> None:
+        entry = self._entries.pop(cert_path, None)
+        if entry is not None:
+            self._size -= entry[2]
+    
+    @property
+    def size(self) -> int:
+        return self._size
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+pem_cache = PemMaterialCache()
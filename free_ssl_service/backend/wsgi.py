@@ -0,0 +1,25 @@
+"""
+生产环境WSGI入口
+    
+    gunicorn -c gunicorn.conf.py
+
+gunicorn 以 preload_app 方式在主进程中导入一次应用，再fork出worker，
+各worker通过写时复制共享已导入的模块、编译好的邮件模板和筛查规则，不再各自初始化。
+"""
+import gc
+
+def create_app():
+    """
+    导入应用并做好fork前的准备
+    
+    导入过程中建立的数据库连接在fork前关闭，避免多个worker共用同一个socket；
+    随后冻结当前所有对象，使其不再被垃圾回收扫描，worker中的GC不会写脏共享的内存页。
+    """
+    from app import app, db
+    
+    with app.app_context():
+        db.engine.dispose()
+    gc.freeze()
+    return app
+
+application = create_app()
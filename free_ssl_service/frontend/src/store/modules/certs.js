@@ -1,15 +1,31 @@
 import api from '@/utils/api'
 
 const state = {
-    certificates: []
+    certificates: [],
+    // 下一页游标，为空表示已加载全部证书
+    nextCursor: null
 }
 
 const mutations = {
     SET_CERTIFICATES(state, certs) {
         state.certificates = certs
     },
+    APPEND_CERTIFICATES(state, certs) {
+        // 翻页期间新申请的证书可能已经插入列表，跳过重复的证书
+        const ids = new Set(state.certificates.map(c => c.id))
+        state.certificates = state.certificates.concat(certs.filter(c => !ids.has(c.id)))
+    },
+    SET_NEXT_CURSOR(state, cursor) {
+        state.nextCursor = cursor || null
+    },
     ADD_CERTIFICATE(state, cert) {
-        state.certificates.unshift(cert)
+        // 复用的证书或合并任务的结果可能已经在列表中，按id更新而不是重复插入
+        const index = state.certificates.findIndex(c => c.id === cert.id)
+        if (index !== -1) {
+            state.certificates.splice(index, 1, cert)
+        } else {
+            state.certificates.unshift(cert)
+        }
     },
     UPDATE_CERTIFICATE(state, cert) {
         const index = state.certificates.findIndex(c => c.id === cert.id)
@@ -20,20 +36,40 @@ const mutations = {
 }
 
 const actions = {
+    // 列表按游标分页，下一页游标在 X-Next-Cursor 响应头中；只加载第一页，其余按需加载
     async fetchCertificates({ commit }) {
         try {
             const response = await api.get('/certs')
             commit('SET_CERTIFICATES', response.data)
+            commit('SET_NEXT_CURSOR', response.headers['x-next-cursor'])
         } catch (error) {
             console.error('Failed to fetch certificates:', error)
             throw error
         }
     },
 
+    async fetchMoreCertificates({ commit, state }) {
+        if (!state.nextCursor) {
+            return
+        }
+        try {
+            const response = await api.get('/certs', { params: { cursor: state.nextCursor } })
+            commit('APPEND_CERTIFICATES', response.data)
+            commit('SET_NEXT_CURSOR', response.headers['x-next-cursor'])
+        } catch (error) {
+            console.error('Failed to fetch more certificates:', error)
+            throw error
+        }
+    },
+
     async createCertificate({ commit }, data) {
         try {
+            // 返回异步颁发任务，证书在任务完成后出现在列表中；
+            // 已有相同域名集合的有效证书时直接返回该证书（200）
             const response = await api.post('/certs', data)
-            commit('ADD_CERTIFICATE', response.data)
+            if (response.status === 200) {
+                commit('ADD_CERTIFICATE', response.data)
+            }
             return response.data
         } catch (error) {
             console.error('Failed to create certificate:', error)
@@ -41,6 +77,34 @@ const actions = {
         }
     },
 
+    async getIssueJob({ commit }, jobId) {
+        try {
+            const response = await api.get(`/certs/jobs/${jobId}`)
+            if (response.data.status === 'succeeded' && response.data.certificate) {
+                commit('ADD_CERTIFICATE', response.data.certificate)
+            }
+            return response.data
+        } catch (error) {
+            console.error('Failed to get issue job:', error)
+            throw error
+        }
+    },
+
+    // 轮询颁发任务直到结束，成功时证书由 getIssueJob 加入列表
+    async waitForIssueJob({ dispatch }, { jobId, interval = 3000, timeout = 15 * 60 * 1000 }) {
+        const deadline = Date.now() + timeout
+        for (;;) {
+            const job = await dispatch('getIssueJob', jobId)
+            if (job.status === 'succeeded' || job.status === 'failed') {
+                return job
+            }
+            if (Date.now() + interval > deadline) {
+                throw new Error('Timed out waiting for issuance job')
+            }
+            await new Promise(resolve => setTimeout(resolve, interval))
+        }
+    },
+
     async renewCertificate({ commit }, certId) {
         try {
             const response = await api.post(`/certs/${certId}/renew`)
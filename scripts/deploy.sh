@@ -122,16 +122,25 @@ wait_for_services() {
     done
 }
 
-# 初始化数据库
-init_database() {
-    log_info "初始化数据库..."
-    docker-compose -f free_ssl_service/docker-compose.yml exec -T backend python -c "
-from app import app, db
-with app.app_context():
-    db.create_all()
-    print('Database initialized successfully')
-"
-    log_info "数据库初始化完成"
+# 执行数据库迁移（首次部署时建表，升级时为已有表添加列和索引、回填数据）
+# 在启动应用之前执行，新版本的代码不会查询尚未添加的列
+migrate_database() {
+    log_info "启动数据库..."
+    docker-compose -f free_ssl_service/docker-compose.yml up -d mariadb redis
+    for i in {1..30}; do
+        if docker-compose -f free_ssl_service/docker-compose.yml exec -T mariadb mysqladmin ping -h localhost --silent; then
+            break
+        fi
+        if [ $i -eq 30 ]; then
+            log_error "数据库启动超时"
+            exit 1
+        fi
+        sleep 2
+    done
+    
+    log_info "执行数据库迁移..."
+    docker-compose -f free_ssl_service/docker-compose.yml run --rm --no-deps backend python -m migrations.upgrade
+    log_info "数据库迁移完成"
 }
 
 # 清理旧镜像
@@ -161,9 +170,9 @@ main() {
     pull_code
     stop_containers
     build_images
+    migrate_database
     start_containers
     wait_for_services
-    init_database
     cleanup_images
     
     # 显示状态